@@ -0,0 +1,326 @@
+// Message framing on the Python worker's stdin/stdout (see py/utils/protocol.py).
+// Both sides start with JSON lines; after a hello exchange they can switch to
+// frames: a 4-byte big-endian length followed by the message as msgpack or JSON.
+
+export type PyProtocol = "msgpack" | "json" | "lines";
+
+export const PY_PROTOCOLS: PyProtocol[] = ["msgpack", "json", "lines"];
+
+// Larger frames mean the stream is out of step, not a real message
+const MAX_FRAME_BYTES = 64 * 1024 * 1024;
+
+export type PyProtocolStats = {
+   protocol: PyProtocol;
+   messagesIn: number;
+   messagesOut: number;
+   bytesIn: number;
+   bytesOut: number;
+   maxMessageBytes: number;
+   decodeMs: number;
+   encodeMs: number;
+};
+
+// --- msgpack -----------------------------------------------------------------
+// The subset the worker's messages use: nil, booleans, integers, floats,
+// strings, binary, arrays and maps (no extension types).
+
+class Writer {
+   buf = Buffer.allocUnsafe(256);
+   length = 0;
+
+   reserve(size: number) {
+      if (this.length + size <= this.buf.length) return;
+      const grown = Buffer.allocUnsafe(Math.max(this.buf.length * 2, this.length + size));
+      this.buf.copy(grown, 0, 0, this.length);
+      this.buf = grown;
+   }
+
+   byte(value: number) {
+      this.reserve(1);
+      this.buf[this.length++] = value;
+   }
+
+   head(tag: number, size: number, write: (buf: Buffer, offset: number) => void) {
+      this.reserve(1 + size);
+      this.buf[this.length] = tag;
+      write(this.buf, this.length + 1);
+      this.length += 1 + size;
+   }
+
+   bytes(data: Uint8Array) {
+      this.reserve(data.length);
+      this.buf.set(data, this.length);
+      this.length += data.length;
+   }
+}
+
+function writeLength(w: Writer, length: number, tags: [number, number, number]) {
+   if (length < 0x100 && tags[0]) w.head(tags[0], 1, (b, o) => b.writeUInt8(length, o));
+   else if (length < 0x10000) w.head(tags[1], 2, (b, o) => b.writeUInt16BE(length, o));
+   else w.head(tags[2], 4, (b, o) => b.writeUInt32BE(length, o));
+}
+
+function writeValue(w: Writer, value: any) {
+   if (value === null || value === undefined) {
+      w.byte(0xc0);
+   } else if (typeof value === "boolean") {
+      w.byte(value ? 0xc3 : 0xc2);
+   } else if (typeof value === "number") {
+      writeNumber(w, value);
+   } else if (typeof value === "string") {
+      const data = Buffer.from(value, "utf8");
+      if (data.length < 32) w.byte(0xa0 | data.length);
+      else writeLength(w, data.length, [0xd9, 0xda, 0xdb]);
+      w.bytes(data);
+   } else if (value instanceof Uint8Array) {
+      writeLength(w, value.length, [0xc4, 0xc5, 0xc6]);
+      w.bytes(value);
+   } else if (Array.isArray(value)) {
+      if (value.length < 16) w.byte(0x90 | value.length);
+      else writeLength(w, value.length, [0, 0xdc, 0xdd]);
+      for (const item of value) writeValue(w, item);
+   } else if (typeof value === "object") {
+      // Like JSON.stringify: undefined members are left out
+      const entries = Object.entries(value).filter(([, v]) => v !== undefined);
+      if (entries.length < 16) w.byte(0x80 | entries.length);
+      else writeLength(w, entries.length, [0, 0xde, 0xdf]);
+      for (const [key, item] of entries) {
+         writeValue(w, key);
+         writeValue(w, item);
+      }
+   } else {
+      throw new TypeError(`Can't encode a ${typeof value} as msgpack`);
+   }
+}
+
+function writeNumber(w: Writer, value: number) {
+   if (!Number.isInteger(value) || Math.abs(value) > 0xffffffff) {
+      w.head(0xcb, 8, (b, o) => b.writeDoubleBE(value, o));
+   } else if (value >= 0) {
+      if (value < 0x80) w.byte(value);
+      else if (value < 0x100) w.head(0xcc, 1, (b, o) => b.writeUInt8(value, o));
+      else if (value < 0x10000) w.head(0xcd, 2, (b, o) => b.writeUInt16BE(value, o));
+      else w.head(0xce, 4, (b, o) => b.writeUInt32BE(value, o));
+   } else if (value >= -32) {
+      w.byte(value & 0xff);
+   } else if (value >= -0x80) {
+      w.head(0xd0, 1, (b, o) => b.writeInt8(value, o));
+   } else if (value >= -0x8000) {
+      w.head(0xd1, 2, (b, o) => b.writeInt16BE(value, o));
+   } else if (value >= -0x80000000) {
+      w.head(0xd2, 4, (b, o) => b.writeInt32BE(value, o));
+   } else {
+      w.head(0xcb, 8, (b, o) => b.writeDoubleBE(value, o));
+   }
+}
+
+export function msgpackEncode(value: any): Buffer {
+   const w = new Writer();
+   writeValue(w, value);
+   return w.buf.subarray(0, w.length);
+}
+
+export function msgpackDecode(data: Buffer): any {
+   let offset = 0;
+
+   const take = (size: number) => {
+      if (offset + size > data.length) throw new Error("msgpack data ends early");
+      const start = offset;
+      offset += size;
+      return start;
+   };
+   const str = (size: number) => data.toString("utf8", take(size), offset);
+   const bin = (size: number) => Buffer.from(data.subarray(take(size), offset));
+   const array = (size: number) => {
+      const items = new Array(size);
+      for (let i = 0; i < size; i++) items[i] = read();
+      return items;
+   };
+   const map = (size: number) => {
+      const obj: Record<string, any> = {};
+      for (let i = 0; i < size; i++) {
+         const key = read();
+         obj[String(key)] = read();
+      }
+      return obj;
+   };
+
+   function read(): any {
+      const tag = data[take(1)];
+      if (tag < 0x80) return tag;
+      if (tag < 0x90) return map(tag & 0x0f);
+      if (tag < 0xa0) return array(tag & 0x0f);
+      if (tag < 0xc0) return str(tag & 0x1f);
+      if (tag >= 0xe0) return tag - 0x100;
+
+      switch (tag) {
+         case 0xc0:
+            return null;
+         case 0xc2:
+            return false;
+         case 0xc3:
+            return true;
+         case 0xc4:
+            return bin(data.readUInt8(take(1)));
+         case 0xc5:
+            return bin(data.readUInt16BE(take(2)));
+         case 0xc6:
+            return bin(data.readUInt32BE(take(4)));
+         case 0xca:
+            return data.readFloatBE(take(4));
+         case 0xcb:
+            return data.readDoubleBE(take(8));
+         case 0xcc:
+            return data.readUInt8(take(1));
+         case 0xcd:
+            return data.readUInt16BE(take(2));
+         case 0xce:
+            return data.readUInt32BE(take(4));
+         case 0xcf:
+            return Number(data.readBigUInt64BE(take(8)));
+         case 0xd0:
+            return data.readInt8(take(1));
+         case 0xd1:
+            return data.readInt16BE(take(2));
+         case 0xd2:
+            return data.readInt32BE(take(4));
+         case 0xd3:
+            return Number(data.readBigInt64BE(take(8)));
+         case 0xd9:
+            return str(data.readUInt8(take(1)));
+         case 0xda:
+            return str(data.readUInt16BE(take(2)));
+         case 0xdb:
+            return str(data.readUInt32BE(take(4)));
+         case 0xdc:
+            return array(data.readUInt16BE(take(2)));
+         case 0xdd:
+            return array(data.readUInt32BE(take(4)));
+         case 0xde:
+            return map(data.readUInt16BE(take(2)));
+         case 0xdf:
+            return map(data.readUInt32BE(take(4)));
+      }
+      throw new Error(`Unsupported msgpack type 0x${tag.toString(16)}`);
+   }
+
+   const value = read();
+   if (offset !== data.length) throw new Error("Trailing bytes after msgpack value");
+   return value;
+}
+
+// --- stream ------------------------------------------------------------------
+
+export class PyStream {
+   protocol: PyProtocol = "lines";
+   private buffered: Buffer = Buffer.alloc(0);
+   private counters = {
+      messagesIn: 0,
+      messagesOut: 0,
+      bytesIn: 0,
+      bytesOut: 0,
+      maxMessageBytes: 0,
+      decodeMs: 0,
+      encodeMs: 0,
+   };
+
+   constructor(
+      private onMessage: (msg: any) => void,
+      // Output that isn't a message (stray prints in lines mode, bad frames)
+      private onRaw: (text: string) => void
+   ) {}
+
+   // Feed stdout chunks as they come. Chunks can end anywhere, including in
+   // the middle of a multi-byte character or a frame header; the protocol can
+   // change between two messages of the same chunk (the hello answer).
+   push(chunk: Buffer) {
+      this.buffered =
+         this.buffered.length > 0 ? Buffer.concat([this.buffered, chunk]) : chunk;
+
+      let offset = 0;
+      while (offset < this.buffered.length) {
+         const used =
+            this.protocol === "lines" ? this.nextLine(offset) : this.nextFrame(offset);
+         if (used === 0) break;
+         offset += used;
+      }
+      this.buffered = this.buffered.subarray(offset);
+   }
+
+   private nextLine(offset: number) {
+      const end = this.buffered.indexOf(0x0a, offset);
+      if (end < 0) return 0;
+      const line = this.buffered.toString("utf8", offset, end);
+      if (line.trim()) {
+         const start = performance.now();
+         let msg: any;
+         try {
+            msg = JSON.parse(line);
+         } catch {
+            this.onRaw(line);
+         }
+         if (msg !== undefined) {
+            this.count("In", end + 1 - offset, start);
+            this.onMessage(msg);
+         }
+      }
+      return end + 1 - offset;
+   }
+
+   private nextFrame(offset: number) {
+      if (this.buffered.length - offset < 4) return 0;
+      const size = this.buffered.readUInt32BE(offset);
+      if (size > MAX_FRAME_BYTES) {
+         // Nothing after this can be trusted
+         this.onRaw(`frame of ${size} bytes; dropping the rest of the stream`);
+         return this.buffered.length - offset;
+      }
+      if (this.buffered.length - offset < 4 + size) return 0;
+
+      const body = this.buffered.subarray(offset + 4, offset + 4 + size);
+      const start = performance.now();
+      let msg: any;
+      try {
+         msg =
+            this.protocol === "msgpack"
+               ? msgpackDecode(body)
+               : JSON.parse(body.toString("utf8"));
+      } catch (e) {
+         this.onRaw(`undecodable ${this.protocol} frame: ${e}`);
+      }
+      if (msg !== undefined) {
+         this.count("In", 4 + size, start);
+         this.onMessage(msg);
+      }
+      return 4 + size;
+   }
+
+   encode(msg: any): Buffer {
+      const start = performance.now();
+      let data: Buffer;
+      if (this.protocol === "lines") {
+         data = Buffer.from(JSON.stringify(msg) + "\n", "utf8");
+      } else {
+         const body =
+            this.protocol === "msgpack"
+               ? msgpackEncode(msg)
+               : Buffer.from(JSON.stringify(msg), "utf8");
+         data = Buffer.allocUnsafe(4 + body.length);
+         data.writeUInt32BE(body.length, 0);
+         body.copy(data, 4);
+      }
+      this.count("Out", data.length, start);
+      return data;
+   }
+
+   private count(direction: "In" | "Out", size: number, start: number) {
+      this.counters[`messages${direction}`] += 1;
+      this.counters[`bytes${direction}`] += size;
+      this.counters.maxMessageBytes = Math.max(this.counters.maxMessageBytes, size);
+      this.counters[direction === "In" ? "decodeMs" : "encodeMs"] += performance.now() - start;
+   }
+
+   stats(): PyProtocolStats {
+      return { protocol: this.protocol, ...this.counters };
+   }
+}
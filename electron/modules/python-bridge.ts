@@ -1,6 +1,7 @@
 import { app, BrowserWindow, ipcMain } from "electron";
 import { spawn, ChildProcessWithoutNullStreams } from "node:child_process";
 import path from "node:path";
+import { PyProtocol, PyStream } from "./py-protocol";
 
 const IS_DEV = process.env.NODE_ENV === "development";
 
@@ -51,26 +52,51 @@ type QueuedRequest = {
    reject: (e: any) => void;
 };
 
+// Requests sent to Python and not answered yet. Python works on several at
+// once (DISTRACT_WORKER_THREADS) and answers them out of order by correlationId.
+const MAX_IN_FLIGHT = Math.max(1, Number(process.env.PY_MAX_IN_FLIGHT) || 2);
+
 const pending = new Map<string, PendingResolver>();
 const queue: QueuedRequest[] = [];
-let activeCorrelationId: string | null = null;
+
+// Framing offered to Python, most preferred first (PY_PROTOCOL=lines keeps
+// plain JSON lines). Requests wait in the queue until Python has answered.
+const OFFERED_PROTOCOLS = (process.env.PY_PROTOCOL || "msgpack,json")
+   .split(",")
+   .map((p) => p.trim())
+   .filter(Boolean) as PyProtocol[];
+const HELLO_ID = "hello";
+
+let stream: PyStream | null = null;
+let negotiating = false;
 
 function flushQueue() {
-   if (!global.__PY_PROC__) return;
-   if (activeCorrelationId) return; // Python busy
-   if (queue.length === 0) return;
+   if (!global.__PY_PROC__ || !stream || negotiating) return;
 
-   const next = queue.shift()!;
-   const cid = next.payload.correlationId;
+   while (queue.length > 0 && pending.size < MAX_IN_FLIGHT) {
+      const next = queue.shift()!;
+      const cid = next.payload.correlationId;
 
-   activeCorrelationId = cid;
-   pending.set(cid, {
-      resolve: next.resolve,
-      reject: next.reject,
-   });
+      pending.set(cid, {
+         resolve: next.resolve,
+         reject: next.reject,
+      });
 
-   // send payload to python
-   global.__PY_PROC__.stdin.write(JSON.stringify(next.payload) + "\n");
+      // send payload to python
+      global.__PY_PROC__.stdin.write(stream.encode(next.payload));
+   }
+}
+
+function isHelloReply(msg: any) {
+   if (msg.correlationId === HELLO_ID) return true;
+   // Workers from before the hello exchange answer it without a correlationId
+   return msg.type === "error" && msg.data === "unknown type";
+}
+
+function rejectAll(reason: Error) {
+   for (const { reject } of pending.values()) reject(reason);
+   pending.clear();
+   for (const { reject } of queue.splice(0)) reject(reason);
 }
 
 export function setupPythonBridge(mainWindow: BrowserWindow) {
@@ -78,30 +104,66 @@ export function setupPythonBridge(mainWindow: BrowserWindow) {
 
    const pyProc = startPython();
 
-   pyProc.stdout.on("data", (data) => {
-      const lines = data.toString().trim().split("\n");
+   pyProc.on("exit", () => {
+      rejectAll(new Error("Python exited"));
+   });
+
+   stream = new PyStream(
+      (msg) => {
+         if (negotiating && isHelloReply(msg)) {
+            // Everything after this message uses the agreed protocol; a
+            // worker that doesn't know hello keeps JSON lines
+            stream!.protocol = msg.type === "hello" ? msg.protocol : "lines";
+            negotiating = false;
+            flushQueue();
+            return;
+         }
 
-      for (const line of lines) {
-         if (!line.trim()) continue;
-         try {
-            const msg = JSON.parse(line);
+         if (msg.correlationId && pending.has(msg.correlationId)) {
+            const { resolve, reject } = pending.get(msg.correlationId)!;
+            pending.delete(msg.correlationId);
 
-            if (msg.correlationId && pending.has(msg.correlationId)) {
-               pending.get(msg.correlationId)!.resolve(msg.value);
-               pending.delete(msg.correlationId);
+            if (msg.type === "error") reject(new Error(msg.data));
+            else resolve(msg.value);
 
-               activeCorrelationId = null;
-               flushQueue();
-               continue;
-            }
+            flushQueue();
+            return;
+         }
 
-            if (msg.type) {
-               mainWindow.webContents.send(`py:${msg.type}`, msg);
-            }
-         } catch {
-            console.log("[python raw]", line);
+         if (msg.type) {
+            mainWindow.webContents.send(`py:${msg.type}`, msg);
          }
+      },
+      (text) => console.log("[python raw]", text),
+   );
+
+   pyProc.stdout.on("data", (data: Buffer) => stream!.push(data));
+
+   if (OFFERED_PROTOCOLS.some((p) => p !== "lines")) {
+      negotiating = true;
+      pyProc.stdin.write(
+         JSON.stringify({
+            type: "hello",
+            correlationId: HELLO_ID,
+            protocols: OFFERED_PROTOCOLS,
+         }) + "\n",
+      );
+   }
+
+   ipcMain.handle("py-protocol-stats", () => stream?.stats() ?? null);
+
+   // Drop a request the renderer no longer needs. Still queued here: rejected
+   // right away. Sent: Python stops it and answers with a "cancelled" error.
+   // Requests can also carry deadlineMs (epoch ms) for Python to enforce.
+   ipcMain.handle("py-cancel", (_evt, correlationId: string) => {
+      const index = queue.findIndex((r) => r.payload.correlationId === correlationId);
+      if (index >= 0) {
+         queue.splice(index, 1)[0].reject(new Error("Request cancelled"));
+         return true;
       }
+      if (!pending.has(correlationId) || !global.__PY_PROC__ || !stream) return false;
+      global.__PY_PROC__.stdin.write(stream.encode({ type: "cancel", correlationId }));
+      return true;
    });
 
    ipcMain.handle("py-invoke", async (_evt, payload) => {
@@ -0,0 +1,263 @@
+import argparse
+import concurrent.futures
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from utils import config
+from utils.cache import cached_use_model
+from utils.model import use_model, warm_up
+
+# Score many recorded clips at once (re-audits), outside the Electron worker:
+#   python batch.py <clip dir | manifest> --out results.jsonl [--parquet results.parquet]
+#       [--workers 2] [--samples 20] [--pattern *.webm]
+#
+# A manifest is a text file with one clip path per line, or JSON lines with
+# "videoPath" (and optionally "sampleCount"); relative paths are relative to
+# the manifest. Results are appended to --out as they finish, one JSON line
+# per clip, so an interrupted run picks up where it stopped: clips already
+# scored in --out are skipped (failed ones are retried). Runs from any
+# directory: the forests resolve from the repository (ultralytics looks for,
+# or downloads, yolov8n.pt in the working directory).
+#
+# The report's rates cover clips the pipeline scored; clips served by the
+# result cache are counted as cache_hits instead. They are timed from when
+# every worker has loaded and warmed up its models; that startup is reported
+# as setup_s.
+
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger(__name__)
+
+
+def find_clips(source, pattern, sample_count):
+    """(video path, sample count) for every clip of a directory or manifest."""
+    if os.path.isdir(source):
+        import fnmatch
+
+        clips = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if fnmatch.fnmatch(name, pattern):
+                    clips.append((os.path.abspath(os.path.join(root, name)), sample_count))
+        return sorted(clips)
+
+    base = os.path.dirname(os.path.abspath(source))
+    clips = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                path, count = entry["videoPath"], entry.get("sampleCount", sample_count)
+            else:
+                path, count = line, sample_count
+            clips.append((os.path.abspath(os.path.join(base, path)), count))
+    return clips
+
+
+def read_done(out_path):
+    """Clips already scored in a previous run's output."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed mid-write
+                continue
+            if "error" not in record:
+                done.add((record["videoPath"], record["sampleCount"]))
+    return done
+
+
+def _end_with_newline(path):
+    """Don't append after half a line left by a killed run."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def _init_worker(torch_threads):
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    if config.WARM_UP:
+        warm_up()
+
+
+def _worker_pid(_):
+    # Long enough for workers still in their initializer to take one too
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _wait_for_workers(executor, workers):
+    """Return once every worker has run its initializer (a task only runs after it)."""
+    pids = set()
+    while len(pids) < workers:
+        pids.update(executor.map(_worker_pid, range(workers)))
+
+
+def score_clip(video_path, sample_count):
+    """One output record; failures are recorded rather than raised."""
+    record = {"videoPath": video_path, "sampleCount": sample_count}
+    start = time.perf_counter()
+    try:
+        record["value"] = cached_use_model(video_path, sample_count, use_model)
+    except Exception as e:
+        record["error"] = str(e)
+    record["ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def _executor(workers):
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    if sys.platform.startswith("linux"):
+        # Same as the worker's fork mode: models load once and are shared
+        from utils.pool import _preload
+
+        _preload()
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(torch_threads,),
+    )
+
+
+def _summary_row(record):
+    value = record.get("value") or {}
+    scores = value.get("scores", {})
+    stats = value.get("stats", {})
+    return {
+        "videoPath": record["videoPath"],
+        "sampleCount": record["sampleCount"],
+        "integrity_score": scores.get("integrity_score"),
+        "rf_score": scores.get("rf_score"),
+        "if_score": scores.get("if_score"),
+        "warning_level": scores.get("warning_level"),
+        "phone_present": value.get("isPhonePresent"),
+        "phone_frame_ratio": value.get("phone", {}).get("frame_ratio"),
+        "frames_used": stats.get("frames_used"),
+        "ms": record["ms"],
+        "error": record.get("error"),
+    }
+
+
+def write_parquet(out_path, parquet_path):
+    """One row per clip (the latest record of each) from the JSONL output."""
+    import polars as pl
+
+    latest = {}
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            latest[(record["videoPath"], record["sampleCount"])] = _summary_row(record)
+    pl.DataFrame(list(latest.values()), infer_schema_length=None).write_parquet(parquet_path)
+
+
+def _report(records, elapsed, setup=0.0):
+    ok = [r for r in records if "error" not in r]
+    # Cache hits skip the pipeline; counting them would inflate the rates
+    scored = [r for r in ok if r["value"]["stats"].get("cache") != "hit"]
+    latencies = [r["ms"] for r in scored]
+    frames = sum(r["value"]["stats"]["frames_used"] for r in scored)
+    return {
+        "clips": len(scored),
+        "cache_hits": len(ok) - len(scored),
+        "failed": len(records) - len(ok),
+        "clips_per_s": len(scored) / elapsed if elapsed else 0.0,
+        "frames_per_s": frames / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else None,
+        "setup_s": setup,
+    }
+
+
+def run(clips, out_path, workers, progress_every=10):
+    """Score `clips` on `workers` processes, appending to `out_path`; returns the report."""
+    done = read_done(out_path)
+    todo = [clip for clip in clips if clip not in done]
+    print(f"{len(clips)} clips, {len(clips) - len(todo)} already scored", file=sys.stderr)
+    if not todo:
+        return _report([], 0.0)
+
+    _end_with_newline(out_path)
+    records = []
+    next_progress = progress_every
+    setup_start = time.perf_counter()
+    with open(out_path, "a", encoding="utf-8") as out, _executor(workers) as executor:
+        # Model loading and warm-up are not scoring time
+        _wait_for_workers(executor, workers)
+        start = time.perf_counter()
+        setup = start - setup_start
+        # Keep a couple of clips queued per worker rather than submitting thousands
+        pending = set()
+        clips_left = iter(todo)
+        while True:
+            for clip in clips_left:
+                pending.add(executor.submit(score_clip, *clip))
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                records.append(record)
+                if "error" in record:
+                    print(f"{record['videoPath']}: {record['error']}", file=sys.stderr)
+            if len(records) >= next_progress:
+                next_progress += progress_every
+                report = _report(records, time.perf_counter() - start)
+                print(
+                    f"{len(records)}/{len(todo)} clips, {report['clips_per_s']:.2f} clips/s "
+                    f"({report['cache_hits']} from the cache)",
+                    file=sys.stderr,
+                )
+
+    return _report(records, time.perf_counter() - start, setup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory or manifest of clips.")
+    parser.add_argument("source", help="directory of clips or manifest file")
+    parser.add_argument("--out", required=True, help="JSONL results (appended; used to resume)")
+    parser.add_argument("--parquet", help="also write one summary row per clip here")
+    parser.add_argument("--workers", type=int, default=config.WORKER_PROCESSES)
+    parser.add_argument("--samples", type=int, default=20, help="sample count per clip")
+    parser.add_argument("--pattern", default="*.webm", help="clip file names in a directory")
+    args = parser.parse_args()
+
+    clips = find_clips(args.source, args.pattern, args.samples)
+    report = run(clips, args.out, max(1, args.workers))
+    if args.parquet:
+        write_parquet(args.out, args.parquet)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from .face_mesh import detect_face_mesh
 from .face import detect_faces
 from .hand import detect_hands
-from .phone import detect_phone
+from .phone import detect_phone, detect_phones
 from .derived import *
@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+import numpy as np
+from detectors.main import extract_features_from_images, warm_up_shards
+from utils.model import FEATURE_COLUMNS
+from utils.video import sample_frames
+
+# Feature extraction time per clip for the ways detectors can be run:
+#   python -m detectors.benchmark_test clip.webm [--samples 40] [--repeat 3]
+#       [--configs sequential,parallel,shards=2,shards=4]
+#
+# Each config's first pass runs on fresh graphs and is compared with a fresh
+# sequential pass: "parallel" must match exactly, shards start each run with
+# cold tracking and may drift. Clips of a first pass run concurrently, one
+# thread each like request threads, so with two or more clips any tracking
+# shared between requests shows up as a difference too. Timed passes come
+# after, on warm graphs.
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def _rows(features_list):
+    return np.array(
+        [[features[key] for key in FEATURE_COLUMNS] for features in features_list],
+        dtype=np.float64,
+    )
+
+
+def _options(config_name):
+    if config_name.startswith("shards="):
+        return {"shards": int(config_name.split("=")[1]), "runner": "sequential"}
+    return {"shards": 1, "runner": config_name}
+
+
+def _cold_pass(clips, options):
+    """First pass of a config: every clip on a new thread (fresh graphs), all at once."""
+    rows = [None] * len(clips)
+
+    def run(i):
+        rows[i] = _rows(extract_features_from_images(clips[i], **options))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(clips))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return rows
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 40))
+    repeat = int(_pop_option(args, "--repeat", 3))
+    configs = _pop_option(args, "--configs", "sequential,parallel,shards=2").split(",")
+
+    if not args:
+        print("Usage: python -m detectors.benchmark_test <video> [<video> ...]")
+        return
+
+    clips = [sample_frames(path, sample_count)[0] for path in args]
+    print(f"clips: {len(clips)}, frames/clip: {sample_count}, cpus: {os.cpu_count()}")
+
+    baseline = _cold_pass(clips, _options("sequential"))
+    for config_name in configs:
+        options = _options(config_name)
+        cold = _cold_pass(clips, options)
+        diff = max(
+            (np.abs(a - b).max() for a, b in zip(cold, baseline) if a.size),
+            default=0.0,
+        )
+
+        if options["shards"] > 1:
+            warm_up_shards(clips[0][0], shards=options["shards"])
+        timings = []
+        for _ in range(repeat):
+            for frames in clips:
+                start = time.perf_counter()
+                extract_features_from_images(frames, **options)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        print(
+            f"[{config_name}] {np.median(timings):.1f} ms/clip (median), "
+            f"max |diff| vs sequential: {diff:.6f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
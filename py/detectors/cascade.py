@@ -0,0 +1,64 @@
+import numpy as np
+from utils import config
+from utils.video import thumbnail
+
+# Cascade rules (see config.CASCADE):
+#   mesh_needs_face  skip FaceMesh when FaceDetection found no face ("separate"
+#                    mode; the mesh is the face detector in "fused" mode)
+#   reuse_similar    frames nearly identical to the last processed frame reuse
+#                    its features instead of running the detectors
+#   phone_gate       run YOLO only on frames where a phone is plausible: hands
+#                    in view, no face, or head pitched away from its usual pose
+CASCADE_RULES = ("mesh_needs_face", "reuse_similar", "phone_gate")
+
+
+def parse_rules(value) -> frozenset:
+    """Rules from a comma separated string (or iterable); unknown names raise."""
+    if isinstance(value, str):
+        value = [rule.strip() for rule in value.split(",")]
+    rules = frozenset(rule for rule in value if rule)
+    unknown = rules - set(CASCADE_RULES)
+    if unknown:
+        raise ValueError(f"Unknown cascade rules: {', '.join(sorted(unknown))}")
+    return rules
+
+
+def reuse_sources(frames, max_diff):
+    """
+    For every frame, the index of the frame whose features it can use: itself,
+    or the last processed frame when their thumbnails differ by less than
+    `max_diff` (mean absolute gray level, 0-255). Comparing against the last
+    processed frame rather than the previous one keeps slow drift from
+    chaining reuse indefinitely.
+    """
+    sources = []
+    last, last_thumb = None, None
+    for i, img in enumerate(frames):
+        thumb = thumbnail(img)
+        if last_thumb is not None and float(np.mean(np.abs(thumb - last_thumb))) < max_diff:
+            sources.append(last)
+            continue
+        last, last_thumb = i, thumb
+        sources.append(i)
+    return sources
+
+
+def phone_candidates(features_list, deviation=None):
+    """
+    Frames of one clip worth running the phone detector on (phone_gate).
+    Normalized pitch is offset by the camera's placement, so looking down is
+    judged against the clip itself: a head pitch more than `deviation`
+    (config.CASCADE_PITCH_DEVIATION) from the median of the frames with a
+    face. Both directions count, since a head tipped far down can flip to a
+    low pitch. A clip spent looking down throughout only runs the detector
+    on frames with hands in view or without a face.
+    """
+    deviation = config.CASCADE_PITCH_DEVIATION if deviation is None else deviation
+    pitches = [features["head_pitch"] for features in features_list if features["face_present"]]
+    usual = float(np.median(pitches)) if pitches else 0.0
+    return [
+        features["hand_count"] > 0
+        or features["face_present"] == 0
+        or abs(features["head_pitch"] - usual) > deviation
+        for features in features_list
+    ]
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import numpy as np
+from detectors.cascade import phone_candidates
+from utils import config
+from utils.feature_store import load
+from utils.model import use_model
+
+# Calibration report for the phone_gate rule, from stored per-frame features
+# (runs recorded with phone_gate off, so YOLO saw every frame):
+#   python -m detectors.cascade_test <store dir> [--deviations 0.05,0.1,0.2]
+#   python -m detectors.cascade_test clip1.webm clip2.webm [--samples 20]
+# Clips are scored into a temporary store first. For every deviation, prints
+# the share of frames the gate skips and the frames with a phone it would
+# have skipped (missed).
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def _report(directory, deviations):
+    rows = load(directory).sort("recorded_at", "run_id", "frame_index")
+    runs = [frame.to_dicts() for _, frame in rows.group_by("run_id", maintain_order=True)]
+    if not runs:
+        print("No stored runs")
+        return
+
+    pitches, offsets = [], []
+    for run in runs:
+        faces = [row["head_pitch"] for row in run if row["face_present"]]
+        if faces:
+            pitches.extend(faces)
+            offsets.extend(np.abs(np.array(faces) - np.median(faces)))
+    frames = sum(len(run) for run in runs)
+    phones = sum(1 for run in runs for row in run if row["phone_count"] > 0)
+    print(f"runs: {len(runs)}, frames: {frames}, with a face: {len(pitches)}, with a phone: {phones}")
+    if pitches:
+        percentiles = (0, 10, 50, 90, 100)
+        print(f"head_pitch p{'/p'.join(map(str, percentiles))}: {np.percentile(pitches, percentiles).round(3)}")
+        print(f"|pitch - clip median| p50/p90/p99: {np.percentile(offsets, (50, 90, 99)).round(3)}")
+
+    print(f"{'deviation':>10}{'skipped':>10}{'missed':>8}")
+    for deviation in deviations:
+        skipped = missed = 0
+        for run in runs:
+            for row, candidate in zip(run, phone_candidates(run, deviation)):
+                if not candidate:
+                    skipped += 1
+                    missed += row["phone_count"] > 0
+        print(f"{deviation:>10.3f}{skipped / frames:>10.1%}{missed:>8}")
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 20))
+    deviations = [
+        float(value) for value in _pop_option(args, "--deviations", "0.02,0.05,0.1,0.2").split(",")
+    ]
+    if not args:
+        print("Usage: python -m detectors.cascade_test <store dir | video ...>")
+        return
+
+    if os.path.isdir(args[0]):
+        _report(args[0], deviations)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.FEATURE_STORE = directory
+        config.RESULT_CACHE = False
+        config.CASCADE = ""
+        for path in args:
+            use_model(path, sample_count)
+        _report(directory, deviations)
+
+
+if __name__ == "__main__":
+    main()
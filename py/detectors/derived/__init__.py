@@ -1,2 +1,2 @@
-from .eye_gaze import detect_eye_gaze
-from .head_pose import detect_head_pose
\ No newline at end of file
+from .eye_gaze import detect_eye_gaze, detect_eye_gaze_batch
+from .head_pose import detect_head_pose, detect_head_pose_batch
\ No newline at end of file
@@ -0,0 +1,145 @@
+import sys
+import time
+import cv2
+import numpy as np
+from detectors.derived.eye_gaze import detect_eye_gaze, detect_eye_gaze_batch
+from detectors.derived.head_pose import (
+    MODEL_POINTS,
+    _POSE_INDICES,
+    _camera_matrix,
+    _fast_pose,
+    _norm_angles,
+    detect_head_pose,
+    detect_head_pose_batch,
+    head_pose_euler,
+    head_pose_euler_batch,
+)
+from detectors.face_mesh import detect_face_mesh
+from utils.video import sample_frames
+
+# Batch vs per-frame head pose and eye gaze on the FaceMesh landmarks of real
+# clips, plus the "fast" method on noise-free synthetic faces:
+#   python -m detectors.derived.batch_test clip1.webm clip2.webm [--samples 40]
+# Prints the maximum deviation of each batch path from the per-frame one, in
+# degrees and in normalized feature units, and the time per frame. Batch "pnp"
+# and batch gaze must match exactly, and "fast" must stay within
+# FAST_TOLERANCE of solvePnP on every frame (frames it hands back to solvePnP
+# are counted as fallbacks).
+
+FAST_TOLERANCE = 0.001
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _angle_gap(a, b):
+    """|a - b| in degrees, modulo 180 like _norm_angles folds them."""
+    return np.abs((a - b + 90) % 180 - 90)
+
+
+def _landmarks(path, sample_count):
+    """Frame shape and FaceMesh landmarks (N, 478, 3) of the clip's frames with a face."""
+    frames, _ = sample_frames(path, sample_count)
+    points = [detect_face_mesh(img)["mesh_points"] for img in frames]
+    points = [p for p in points if p is not None]
+    if not points:
+        return None, None
+    return frames[0].shape[:2], np.stack(points)
+
+
+def _compare_clip(path, shape, landmarks):
+    h, w = shape
+    n = len(landmarks)
+    print(f"{path} ({w}x{h}): {n} frames with a face")
+
+    single, single_s = _timed(lambda: np.array([head_pose_euler(p, w, h) for p in landmarks]))
+    pnp, pnp_s = _timed(head_pose_euler_batch, landmarks, w, h, "pnp")
+    fast, fast_s = _timed(head_pose_euler_batch, landmarks, w, h, "fast")
+
+    per_frame = [detect_head_pose(p, shape) for p in landmarks]
+    single_n = np.array([[pose[k] for k in ("pitch", "yaw", "roll")] for pose in per_frame])
+    batch = detect_head_pose_batch(landmarks, shape, method="pnp")
+    pnp_n = np.stack([batch["pitch"], batch["yaw"], batch["roll"]], axis=1)
+    fast_n = _norm_angles(fast)
+
+    print(f"{'head pose':<22}{'max deg':>10}{'max norm':>10}{'ms/frame':>10}")
+    print(f"{'  per-frame solvePnP':<22}{'-':>10}{'-':>10}{single_s / n * 1000:>10.3f}")
+    print(
+        f"{'  batch pnp':<22}{_angle_gap(pnp, single).max():>10.2e}"
+        f"{np.abs(pnp_n - single_n).max():>10.2e}{pnp_s / n * 1000:>10.3f}"
+    )
+    print(
+        f"{'  batch fast':<22}{_angle_gap(fast, single).max():>10.2e}"
+        f"{np.abs(fast_n - single_n).max():>10.2e}{fast_s / n * 1000:>10.3f}"
+    )
+    gaps = np.percentile(np.abs(fast_n - single_n), (50, 95, 100), axis=0)
+    for name, gap in zip(("pitch", "yaw", "roll"), gaps.T):
+        print(f"  fast {name} norm p50/p95/max: {gap[0]:.2e} {gap[1]:.2e} {gap[2]:.2e}")
+    _, converged = _fast_pose(landmarks[:, _POSE_INDICES, :2].astype(np.float64) * (w, h), w, h)
+    print(f"  fast fallbacks to solvePnP: {int(np.sum(~converged))} of {n}")
+
+    single_gaze, single_gaze_s = _timed(
+        lambda: np.array([detect_eye_gaze(p, shape)["gaze_point"] for p in landmarks])
+    )
+    gaze, gaze_s = _timed(detect_eye_gaze_batch, landmarks, shape)
+    print(
+        f"eye gaze batch: max |diff| {np.abs(gaze['gaze_point'] - single_gaze).max():.2e}, "
+        f"{single_gaze_s / n * 1000:.3f} -> {gaze_s / n * 1000:.4f} ms/frame"
+    )
+
+    assert np.array_equal(pnp, single) and np.array_equal(pnp_n, single_n)
+    assert np.array_equal(gaze["gaze_point"], single_gaze)
+    assert np.abs(fast_n - single_n).max() <= FAST_TOLERANCE
+
+
+def _compare_synthetic(count=500, w=640, h=480, seed=0):
+    """"fast" vs solvePnP on exact projections of MODEL_POINTS (+-35 deg, 40-80 cm)."""
+    rng = np.random.default_rng(seed)
+    landmarks = np.zeros((count, 478, 3))
+    for n in range(count):
+        rvec = np.radians(rng.uniform(-35, 35, 3))
+        tvec = np.array([rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(400, 800)])
+        image_points, _ = cv2.projectPoints(MODEL_POINTS, rvec, tvec, _camera_matrix(w, h), None)
+        landmarks[n, _POSE_INDICES, :2] = image_points.reshape(-1, 2) / (w, h)
+
+    pnp = head_pose_euler_batch(landmarks, w, h, "pnp")
+    fast = head_pose_euler_batch(landmarks, w, h, "fast")
+    gap = np.abs(_norm_angles(fast) - _norm_angles(pnp)).max()
+    print(
+        f"synthetic ({count} faces): fast vs pnp max {_angle_gap(fast, pnp).max():.2e} deg, "
+        f"{gap:.2e} norm"
+    )
+    assert gap <= FAST_TOLERANCE
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 40))
+
+    _compare_synthetic()
+    if not args:
+        print("Usage: python -m detectors.derived.batch_test <video> [<video> ...]")
+        return
+
+    for path in args:
+        shape, landmarks = _landmarks(path, sample_count)
+        if landmarks is None:
+            print(f"{path}: no faces found")
+            continue
+        _compare_clip(path, shape, landmarks)
+
+
+if __name__ == "__main__":
+    main()
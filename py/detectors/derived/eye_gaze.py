@@ -1,4 +1,5 @@
 import numpy as np
+from detectors.landmarks import as_landmark_array, to_px
 from utils.math import map_value
 
 # Landmark indices for iris and eyes (MediaPipe FaceMesh)
@@ -8,23 +9,16 @@ L_EYE_LEFT, L_EYE_RIGHT, L_EYE_TOP, L_EYE_BOTTOM = 33, 133, 159, 145
 R_EYE_LEFT, R_EYE_RIGHT, R_EYE_TOP, R_EYE_BOTTOM = 362, 263, 386, 374
 
 
-def _to_px(lm, w, h):
-    """Convert landmark (tuple or Mediapipe object) to pixel coordinates."""
-    if hasattr(lm, "x"):
-        return np.array([lm.x * w, lm.y * h], dtype=np.float64)
-    else:
-        return np.array([lm[0] * w, lm[1] * h], dtype=np.float64)
-
-
 def _eye_gaze(landmarks, w, h, iris_idx, left_idx, right_idx, top_idx, bot_idx):
     """Return normalized gaze relative to eye bounding box (-1..1), safely."""
     try:
-        iris = _to_px(landmarks[iris_idx], w, h)
-        left = _to_px(landmarks[left_idx], w, h)
-        right = _to_px(landmarks[right_idx], w, h)
-        top = _to_px(landmarks[top_idx], w, h)
-        bot = _to_px(landmarks[bot_idx], w, h)
-    except (IndexError, TypeError):
+        iris, left, right, top, bot = to_px(
+            as_landmark_array(landmarks),
+            [iris_idx, left_idx, right_idx, top_idx, bot_idx],
+            w,
+            h,
+        )
+    except (IndexError, TypeError, ValueError):
         # Landmarks missing or malformed, return center gaze
         return 0.0, 0.0
 
@@ -90,3 +84,43 @@ def detect_eye_gaze(
         "gaze_point": (gaze_x, gaze_y),
         "gaze_direction": gaze_direction,
     }
+
+
+# (eye, landmark) index table for the batch path: iris, left, right, top, bottom
+_GAZE_INDICES = np.array(
+    [
+        [L_IRIS_CENTER, L_EYE_LEFT, L_EYE_RIGHT, L_EYE_TOP, L_EYE_BOTTOM],
+        [R_IRIS_CENTER, R_EYE_LEFT, R_EYE_RIGHT, R_EYE_TOP, R_EYE_BOTTOM],
+    ]
+)
+
+
+def detect_eye_gaze_batch(landmarks, frame_shape, shift_x=0.0, shift_y=0.0):
+    """
+    Vectorized detect_eye_gaze for (N, 478, 3) landmarks sharing one frame shape.
+    Returns:
+        gaze_point: (N, 2) normalized (x, y) on screen (can exceed 0-1)
+    """
+    h, w = frame_shape[:2]
+    landmarks = np.asarray(landmarks)
+    if len(landmarks) == 0:
+        return {"gaze_point": np.zeros((0, 2), dtype=np.float64)}
+
+    # (N, eye, landmark, xy) in pixels
+    points = landmarks[:, _GAZE_INDICES, :2].astype(np.float64) * (w, h)
+    iris, left, right, top, bot = (points[:, :, i] for i in range(5))
+
+    center = (left + right) / 2.0
+    eye_w = np.linalg.norm(right - left, axis=-1) + 1e-6
+    eye_h = np.linalg.norm(bot - top, axis=-1) + 1e-6
+
+    # Per eye gaze, then averaged over both eyes
+    gx = (iris[..., 0] - center[..., 0]) / (eye_w / 2.0)
+    gy = (iris[..., 1] - center[..., 1]) / (eye_h / 2.0)
+    gx = (gx[:, 0] + gx[:, 1]) / 2.0
+    gy = (gy[:, 0] + gy[:, 1]) / 2.0
+
+    gaze_x = map_value(0.5 + gx / 2.0 + shift_x, 0.2, 0.8, 0.0, 1.0)
+    gaze_y = map_value(0.5 + gy / 2.0 + shift_y, 0.1, 0.5, 0.0, 1.0)
+
+    return {"gaze_point": np.stack([gaze_x, gaze_y], axis=1)}
@@ -1,5 +1,7 @@
+from functools import lru_cache
 import cv2
 import numpy as np
+from detectors.landmarks import as_landmark_array, to_px
 
 # Landmark indices for MediaPipe FaceMesh
 LANDMARKS = {
@@ -12,48 +14,58 @@ LANDMARKS = {
 }
 
 
-def _to_px(lm, w, h):
-    """Convert a landmark (tuple or Mediapipe object) to pixel coordinates."""
-    if hasattr(lm, "x"):  # Mediapipe landmark object
-        return np.array([lm.x * w, lm.y * h], dtype=np.float64)
-    else:  # Tuple or list (x, y)
-        return np.array([lm[0] * w, lm[1] * h], dtype=np.float64)
+# Order matches model_points below
+_POSE_INDICES = [
+    LANDMARKS["nose_tip"],
+    LANDMARKS["chin"],
+    LANDMARKS["left_eye_outer"],
+    LANDMARKS["right_eye_inner"],
+    LANDMARKS["left_mouth"],
+    LANDMARKS["right_mouth"],
+]
 
 
-def head_pose_euler(landmarks, w, h):
-    """Compute Euler angles (pitch, yaw, roll) from 2D landmarks via solvePnP."""
-    nose = _to_px(landmarks[LANDMARKS["nose_tip"]], w, h)
-    chin = _to_px(landmarks[LANDMARKS["chin"]], w, h)
-    left_eye = _to_px(landmarks[LANDMARKS["left_eye_outer"]], w, h)
-    right_eye = _to_px(landmarks[LANDMARKS["right_eye_inner"]], w, h)
-    left_mouth = _to_px(landmarks[LANDMARKS["left_mouth"]], w, h)
-    right_mouth = _to_px(landmarks[LANDMARKS["right_mouth"]], w, h)
-
-    image_points = np.array(
-        [nose, chin, left_eye, right_eye, left_mouth, right_mouth],
-        dtype=np.float64,
-    )
+# Generic 3D face model (mm), same order as _POSE_INDICES
+MODEL_POINTS = np.array(
+    [
+        (0.0, 0.0, 0.0),  # Nose tip
+        (0.0, -63.6, -12.5),  # Chin
+        (-43.3, 32.7, -26.0),  # Left eye outer
+        (43.3, 32.7, -26.0),  # Right eye inner
+        (-28.9, -28.9, -24.1),  # Left mouth corner
+        (28.9, -28.9, -24.1),  # Right mouth corner
+    ],
+    dtype=np.float64,
+)
+MODEL_POINTS.flags.writeable = False
 
-    model_points = np.array(
-        [
-            (0.0, 0.0, 0.0),  # Nose tip
-            (0.0, -63.6, -12.5),  # Chin
-            (-43.3, 32.7, -26.0),  # Left eye outer
-            (43.3, 32.7, -26.0),  # Right eye inner
-            (-28.9, -28.9, -24.1),  # Left mouth corner
-            (28.9, -28.9, -24.1),  # Right mouth corner
-        ],
-        dtype=np.float64,
-    )
+_DIST_COEFFS = np.zeros((4, 1), dtype=np.float64)
 
+# Homogeneous model points for the linear (DLT) start of the "fast" pose
+_MODEL_HOMOGENEOUS = np.hstack([MODEL_POINTS, np.ones((len(MODEL_POINTS), 1))])  # (6, 4)
+# Levenberg-Marquardt rounds of the "fast" pose (solvePnP's own cap)
+FAST_POSE_ITERATIONS = 20
+# "fast" frames whose squared reprojection error still changes by more than
+# this (relative) in the last round haven't converged and go to solvePnP
+FAST_POSE_TOLERANCE = 1e-9
+
+
+@lru_cache(maxsize=8)
+def _camera_matrix(w, h):
     cam_matrix = np.array([[w, 0, w / 2], [0, w, h / 2], [0, 0, 1]], dtype=np.float64)
-    dist_coeffs = np.zeros((4, 1), dtype=np.float64)
+    cam_matrix.flags.writeable = False
+    return cam_matrix
+
+
+def head_pose_euler(landmarks, w, h):
+    """Compute Euler angles (pitch, yaw, roll) from 2D landmarks via solvePnP."""
+    image_points = to_px(as_landmark_array(landmarks), _POSE_INDICES, w, h)
 
     ok, rvec, tvec = cv2.solvePnP(
-        model_points,
+        MODEL_POINTS,
         image_points,
-        cam_matrix,
-        dist_coeffs,
+        _camera_matrix(w, h),
+        _DIST_COEFFS,
         flags=cv2.SOLVEPNP_ITERATIVE,
     )
     if not ok:
@@ -66,29 +78,203 @@ def head_pose_euler(landmarks, w, h):
     return pitch, yaw, roll
 
 
+def _rq_euler_angles(rmats):
+    """
+    Vectorized cv2.RQDecomp3x3 for a stack of rotation matrices (N, 3, 3).
+    Returns (N, 3) Euler angles (pitch, yaw, roll) in degrees, with the same
+    Givens sequence and 180 degree ambiguity handling as OpenCV.
+    """
+    m = rmats.astype(np.float64)
+    eps = np.finfo(np.float64).eps
+
+    def _givens(s, c):
+        z = 1.0 / np.sqrt(c * c + s * s + eps)
+        return s * z, c * z
+
+    # Qx zeroes m[2, 1]
+    sx, cx = _givens(m[:, 2, 1], m[:, 2, 2])
+    qx = np.zeros_like(m)
+    qx[:, 0, 0] = 1
+    qx[:, 1, 1], qx[:, 1, 2], qx[:, 2, 1], qx[:, 2, 2] = cx, sx, -sx, cx
+    r = m @ qx
+
+    # Qy zeroes r[2, 0]
+    sy, cy = _givens(-r[:, 2, 0], r[:, 2, 2])
+    qy = np.zeros_like(m)
+    qy[:, 1, 1] = 1
+    qy[:, 0, 0], qy[:, 0, 2], qy[:, 2, 0], qy[:, 2, 2] = cy, -sy, sy, cy
+    r = r @ qy
+
+    # Qz zeroes r[1, 0]
+    sz, cz = _givens(r[:, 1, 0], r[:, 1, 1])
+    qz = np.zeros_like(m)
+    qz[:, 2, 2] = 1
+    qz[:, 0, 0], qz[:, 0, 1], qz[:, 1, 0], qz[:, 1, 1] = cz, sz, -sz, cz
+    r = r @ qz
+
+    # Diagonal entries of R except the last shall be positive
+    neg_x, neg_y = r[:, 0, 0] < 0, r[:, 1, 1] < 0
+    flip_z = neg_x & neg_y
+    flip_y = neg_x & ~neg_y
+    flip_x = ~neg_x & neg_y
+    for q, flip, (a, b) in ((qz, flip_z, (0, 1)), (qy, flip_y, (0, 2)), (qx, flip_x, (1, 2))):
+        for i in (a, b):
+            for j in (a, b):
+                q[flip, i, j] *= -1
+
+    def _angle(cos, sign_src):
+        return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0))) * np.where(
+            sign_src >= 0, 1.0, -1.0
+        )
+
+    return np.stack(
+        [
+            _angle(qx[:, 1, 1], qx[:, 1, 2]),
+            _angle(qy[:, 0, 0], qy[:, 2, 0]),
+            _angle(qz[:, 0, 0], qz[:, 0, 1]),
+        ],
+        axis=1,
+    )
+
+
+def _dlt_poses(points, focal):
+    """
+    Linear (DLT) rotations (N, 3, 3) and translations (N, 3), the start that
+    solvePnP's iterative solver uses for non-planar models, vectorized over
+    frames. `points` are (N, 6, 2) image points relative to the principal point.
+    """
+    normalized = points / focal
+    rows = np.zeros(points.shape[:2] + (2, 12))
+    rows[..., 0, 0:4] = rows[..., 1, 4:8] = _MODEL_HOMOGENEOUS
+    rows[..., 8:12] = -normalized[..., None] * _MODEL_HOMOGENEOUS[:, None]
+    rows = rows.reshape(len(points), -1, 12)
+
+    _, _, vt = np.linalg.svd(rows.transpose(0, 2, 1) @ rows)
+    rt = vt[:, -1].reshape(-1, 3, 4)
+    # The null vector's sign is free: take the one whose rotation part is proper
+    rt *= np.where(np.linalg.det(rt[:, :, :3]) < 0, -1.0, 1.0)[:, None, None]
+    scale = np.linalg.norm(rt[:, :, :3], axis=(1, 2))
+    u, _, vt = np.linalg.svd(rt[:, :, :3])
+    return u @ vt, rt[:, :, 3] * (np.sqrt(3.0) / scale)[:, None]
+
+
+def _rotations_from_vectors(rvecs):
+    """Vectorized cv2.Rodrigues for (N, 3) rotation vectors."""
+    theta = np.linalg.norm(rvecs, axis=1)[:, None, None]
+    axis = rvecs / np.maximum(theta[:, 0], 1e-12)
+    cross = np.zeros((len(rvecs), 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2] = -axis[:, 2], axis[:, 1]
+    cross[:, 1, 0], cross[:, 1, 2] = axis[:, 2], -axis[:, 0]
+    cross[:, 2, 0], cross[:, 2, 1] = -axis[:, 1], axis[:, 0]
+    return np.eye(3) + np.sin(theta) * cross + (1 - np.cos(theta)) * cross @ cross
+
+
+def _refine(rmats, tvecs, points, focal, iterations=FAST_POSE_ITERATIONS):
+    """
+    Levenberg-Marquardt on the reprojection error (what solvePnP minimizes),
+    vectorized over frames, until every frame's error stops changing or after
+    `iterations` rounds. Returns refined rotations and which frames converged.
+    """
+    previous = converged = None
+    for round_ in range(iterations + 1):
+        rotated = np.einsum("nij,kj->nki", rmats, MODEL_POINTS)  # (N, 6, 3)
+        cam = rotated + tvecs[:, None]
+        x, y, z = cam[..., 0], cam[..., 1], cam[..., 2]
+        residuals = focal * cam[..., :2] / z[..., None] - points
+
+        error = np.square(residuals).sum(axis=(1, 2))
+        if previous is not None:
+            # Written so that NaN (a diverged frame) counts as not converged
+            converged = np.abs(previous - error) <= FAST_POSE_TOLERANCE * error + 1e-12
+            if converged.all():
+                break
+        if round_ == iterations:
+            break
+        previous = error
+
+        # d(projection)/d(camera point), (N, 6, 2, 3)
+        d_cam = np.zeros(points.shape[:2] + (2, 3))
+        d_cam[..., 0, 0] = d_cam[..., 1, 1] = focal / z
+        d_cam[..., 0, 2] = -focal * x / z**2
+        d_cam[..., 1, 2] = -focal * y / z**2
+        # Camera point wrt a small rotation applied on the left, and the translation
+        skew = np.zeros(rotated.shape + (3,))
+        skew[..., 0, 1], skew[..., 0, 2] = rotated[..., 2], -rotated[..., 1]
+        skew[..., 1, 0], skew[..., 1, 2] = -rotated[..., 2], rotated[..., 0]
+        skew[..., 2, 0], skew[..., 2, 1] = rotated[..., 1], -rotated[..., 0]
+        jac = np.concatenate([d_cam @ skew, d_cam], axis=-1).reshape(len(points), -1, 6)
+
+        jt = jac.transpose(0, 2, 1)
+        hess = jt @ jac
+        hess += 1e-3 * hess * np.eye(6)
+        step = np.linalg.solve(hess, -(jt @ residuals.reshape(len(points), -1, 1)))[..., 0]
+        rmats = _rotations_from_vectors(step[:, :3]) @ rmats
+        tvecs = tvecs + step[:, 3:]
+
+    return rmats, converged
+
+
+def _fast_pose(image_points, w, h):
+    """
+    solvePnP's iterative solve vectorized over frames, with the same camera
+    (f = w): rotations (N, 3, 3) and whether each frame converged.
+    """
+    focal = float(w)
+    points = image_points - (w / 2, h / 2)
+    rmats, tvecs = _dlt_poses(points, focal)
+    return _refine(rmats, tvecs, points, focal)
+
+
+def head_pose_euler_batch(landmarks, w, h, method="pnp"):
+    """
+    Euler angles (N, 3) as (pitch, yaw, roll) degrees for (N, 478, 3) landmarks.
+    "pnp" runs solvePnP per frame (identical to head_pose_euler);
+    "fast" runs solvePnP's own solve (DLT start, Levenberg-Marquardt) vectorized
+    over N, and hands frames that don't converge back to solvePnP. It lands in
+    the same minimum as "pnp", within 0.001 normalized units
+    (python -m detectors.derived.batch_test checks clips against that).
+    """
+    landmarks = np.asarray(landmarks)
+    if len(landmarks) == 0:
+        return np.zeros((0, 3), dtype=np.float64)
+
+    if method == "pnp":
+        return np.array(
+            [head_pose_euler(points, w, h) for points in landmarks], dtype=np.float64
+        )
+    if method == "fast":
+        image_points = landmarks[:, _POSE_INDICES, :2].astype(np.float64) * (w, h)
+        rmats, converged = _fast_pose(image_points, w, h)
+        angles = _rq_euler_angles(rmats)
+        for i in np.flatnonzero(~converged):
+            angles[i] = head_pose_euler(landmarks[i], w, h)
+        return angles
+    raise ValueError(f"Unknown head pose method: {method}")
+
+
+def _norm_angles(angles):
+    """Normalize angles (degrees) to [0,1]."""
+    angles = np.where(angles > 90, angles - 180, angles)
+    angles = np.where(angles < -90, angles + 180, angles)
+    return np.clip((angles + 45) / 90, 0.0, 1.0)
+
+
 # 0 yaw = looking left; 1 = looking right
 # 0 pitch = looking up; 1 = looking down
 # 0 roll = head tilted right; 1 = head tilted left
 
 
 def detect_head_pose(landmarks, frame_shape):
-    if not landmarks:
+    if landmarks is None or len(landmarks) == 0:
         return {"yaw": 0.5, "pitch": 0.5, "roll": 0.5, "orientation": "forward"}
 
     h, w = frame_shape[:2]
     pitch, yaw, roll = head_pose_euler(landmarks, w, h)
 
     # Normalize angles to [0,1]
-    def _norm(angle):
-        if angle > 90:
-            angle -= 180
-        elif angle < -90:
-            angle += 180
-        return np.clip((angle + 45) / 90, 0.0, 1.0)
-
-    yaw_n = _norm(yaw)
-    pitch_n = _norm(pitch)
-    roll_n = _norm(roll)
+    yaw_n = _norm_angles(yaw)
+    pitch_n = _norm_angles(pitch)
+    roll_n = _norm_angles(roll)
 
     # Determine orientation based on thresholds
     # These thresholds can be adjusted based on testing
@@ -104,3 +290,14 @@ def detect_head_pose(landmarks, frame_shape):
         orientation = "forward"
 
     return {"yaw": yaw_n, "pitch": pitch_n, "roll": roll_n, "orientation": orientation}
+
+
+def detect_head_pose_batch(landmarks, frame_shape, method="pnp"):
+    """
+    Head pose for a stack of frames sharing one shape.
+    Returns normalized yaw/pitch/roll arrays of shape (N,).
+    """
+    h, w = frame_shape[:2]
+    angles = _norm_angles(head_pose_euler_batch(landmarks, w, h, method))
+    pitch, yaw, roll = angles.T
+    return {"yaw": yaw, "pitch": pitch, "roll": roll}
@@ -1,16 +1,19 @@
-import mediapipe as mp
+from utils.lazy import lazy_loader
 
-# Initialize MediaPipe Face Detection only once
-mp_face_detection = mp.solutions.face_detection
 
-# Create a single face detection object for efficiency
-face_detection = mp_face_detection.FaceDetection(
-    model_selection=0, min_detection_confidence=0.5  # 0 = short range (2m)
-)
+# Created on first use, once per thread: graphs keep tracking state and
+# aren't safe to share (mediapipe itself is imported then too)
+@lazy_loader("face_detection", per_thread=True)
+def get_face_detection():
+    import mediapipe as mp
+
+    return mp.solutions.face_detection.FaceDetection(
+        model_selection=0, min_detection_confidence=0.5  # 0 = short range (2m)
+    )
 
 
 def detect_faces(frame):
-    results = face_detection.process(frame)
+    results = get_face_detection().process(frame)
 
     face_data = []
     if results.detections:
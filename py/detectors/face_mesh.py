@@ -1,48 +1,98 @@
-import mediapipe as mp
+from detectors.landmarks import landmarks_to_array
+from utils import config
+from utils.lazy import lazy_loader
 
-mp_face_mesh = mp.solutions.face_mesh
+# Landmark indices of the named keypoints (refine_landmarks adds the irises)
+KEYPOINTS = {
+    "pupil_left": 468,
+    "pupil_right": 473,
+    "left_eye": 33,
+    "right_eye": 263,
+    "nose_tip": 1,
+    "mouth": 13,
+}
 
-# Initialize once for efficiency
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1,
-    refine_landmarks=True,  # enables iris landmarks (for pupils)
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-)
 
+# Created on first use, once per thread (see detectors/face.py)
+@lazy_loader("face_mesh", per_thread=True)
+def get_face_mesh():
+    import mediapipe as mp
 
-def detect_face_mesh(frame):
-    results = face_mesh.process(frame)
-
-    output = {
-        "keypoints": {
-            "pupil_left": None,
-            "pupil_right": None,
-            "left_eye": None,
-            "right_eye": None,
-            "nose_tip": None,
-            "mouth": None,
-        },
-        "mesh_points": [],
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,  # enables iris landmarks (for pupils)
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
+
+
+# Fused mode graph: stands in for FaceDetection as well, so by default it also
+# looks for a second face (see config.FUSED_MAX_FACES)
+@lazy_loader("face_mesh_fused", per_thread=True)
+def get_face_mesh_fused():
+    import mediapipe as mp
+
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=config.FUSED_MAX_FACES,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
+
+
+def empty_mesh_output():
+    """detect_face_mesh output for a frame without a face."""
+    return {
+        "keypoints": {name: None for name in KEYPOINTS},
+        "mesh_points": None,
+    }
+
+
+def _mesh_output(points):
+    return {
+        # Row views into the mesh, no copies
+        "keypoints": {name: points[idx] for name, idx in KEYPOINTS.items()},
+        # Full mesh (normalized), (478, 3) float32
+        "mesh_points": points,
+    }
+
+
+def _box_from_landmarks(points):
+    """Face bounds in the same normalized x/y/w/h layout as detect_faces."""
+    x, y = (float(v) for v in points[:, :2].min(axis=0))
+    x_max, y_max = (float(v) for v in points[:, :2].max(axis=0))
+    return {
+        "x": x,
+        "y": y,
+        "w": x_max - x,
+        "h": y_max - y,
+        # FaceMesh exposes no detection score; use the calibrated stand-in
+        "confidence": config.FUSED_FACE_CONF,
     }
 
+
+def detect_face_mesh(frame):
+    results = get_face_mesh().process(frame)
+
     if results.multi_face_landmarks:
-        face_landmarks = results.multi_face_landmarks[0].landmark
+        return _mesh_output(
+            landmarks_to_array(results.multi_face_landmarks[0].landmark)
+        )
+
+    return empty_mesh_output()
 
-        def get_point(idx):
-            lm = face_landmarks[idx]
-            return (lm.x, lm.y, lm.z)
 
-        output["keypoints"] = {
-            "pupil_left": get_point(468),
-            "pupil_right": get_point(473),
-            "left_eye": get_point(33),
-            "right_eye": get_point(263),
-            "nose_tip": get_point(1),
-            "mouth": get_point(13),
-        }
+def detect_faces_and_mesh(frame):
+    """
+    Single graph run replacing detect_faces + detect_face_mesh.
+    Returns:
+        faces: up to 2 face boxes derived from the landmarks (detect_faces layout)
+        mesh: detect_face_mesh output for the first face
+    """
+    results = get_face_mesh_fused().process(frame)
 
-        # Full mesh (normalized)
-        output["mesh_points"] = [(lm.x, lm.y, lm.z) for lm in face_landmarks]
+    if not results.multi_face_landmarks:
+        return [], empty_mesh_output()
 
-    return output
+    meshes = [landmarks_to_array(f.landmark) for f in results.multi_face_landmarks]
+    return [_box_from_landmarks(points) for points in meshes], _mesh_output(meshes[0])
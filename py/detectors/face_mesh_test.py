@@ -20,7 +20,7 @@ while True:
     results = detect_face_mesh(frame_rgb)
 
     # Draw full mesh if present
-    if results["mesh_points"]:
+    if results["mesh_points"] is not None:
         h, w, _ = frame.shape
 
         # Draw all mesh points (green)
@@ -30,7 +30,7 @@ while True:
 
         # Draw selected keypoints (red)
         for name, coords in results["keypoints"].items():
-            if coords:
+            if coords is not None:
                 px, py = int(coords[0] * w), int(coords[1] * h)
                 cv2.circle(frame, (px, py), 3, (0, 0, 255), -1)
 
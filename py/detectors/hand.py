@@ -1,25 +1,39 @@
-import mediapipe as mp
+from detectors.landmarks import landmarks_to_array
+from utils.lazy import lazy_loader
 
-# Initialize MediaPipe Hands once
-mp_hands = mp.solutions.hands
 
-# Create a global hand detector instance
-hands_detector = mp_hands.Hands(
-    static_image_mode=False,
-    max_num_hands=4,  # can detect up to 4, but we'll limit to one per side
-    model_complexity=1,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-)
+def _hands(model_complexity):
+    import mediapipe as mp
 
+    return mp.solutions.hands.Hands(
+        static_image_mode=False,
+        max_num_hands=4,  # can detect up to 4, but we'll limit to one per side
+        model_complexity=model_complexity,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
 
-def detect_hands(frame):
-    results = hands_detector.process(frame)
+
+# Created on first use, once per thread (see detectors/face.py)
+@lazy_loader("hands", per_thread=True)
+def get_hands_detector():
+    return _hands(1)
+
+
+# The lite landmark model, for the coarser quality tiers (see utils/tiers.py)
+@lazy_loader("hands_lite", per_thread=True)
+def get_hands_detector_lite():
+    return _hands(0)
+
+
+def detect_hands(frame, model_complexity=1):
+    detector = get_hands_detector() if model_complexity else get_hands_detector_lite()
+    results = detector.process(frame)
 
     hand_data = {
         "hand_count": 0,
-        "left_hand_points": [],
-        "right_hand_points": [],
+        "left_hand_points": None,
+        "right_hand_points": None,
         "wrist_left_x": None,
         "wrist_left_y": None,
         "wrist_right_x": None,
@@ -35,11 +49,12 @@ def detect_hands(frame):
             results.multi_hand_landmarks, results.multi_handedness
         ):
             label = handedness.classification[0].label  # "Left" or "Right"
-            hand_points = [(lm.x, lm.y) for lm in hand_landmarks.landmark]
+            # (21, 2) float32, normalized
+            hand_points = landmarks_to_array(hand_landmarks.landmark, dims=2)
 
             # Wrist landmark (index 0)
-            wrist_x = hand_landmarks.landmark[0].x
-            wrist_y = hand_landmarks.landmark[0].y
+            wrist_x = float(hand_points[0, 0])
+            wrist_y = float(hand_points[0, 1])
 
             if label == "Left" and not left_done:
                 hand_data["left_hand_points"] = hand_points
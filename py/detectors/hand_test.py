@@ -22,7 +22,7 @@ while True:
     h, w, _ = frame.shape
 
     # Draw left hand if detected
-    if results["left_hand_points"]:
+    if results["left_hand_points"] is not None:
         for x_norm, y_norm in results["left_hand_points"]:
             cx, cy = int(x_norm * w), int(y_norm * h)
             cv2.circle(frame, (cx, cy), 2, (0, 255, 0), -1)
@@ -39,7 +39,7 @@ while True:
         )
 
     # Draw right hand if detected
-    if results["right_hand_points"]:
+    if results["right_hand_points"] is not None:
         for x_norm, y_norm in results["right_hand_points"]:
             cx, cy = int(x_norm * w), int(y_norm * h)
             cv2.circle(frame, (cx, cy), 2, (0, 0, 255), -1)
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+def landmarks_to_array(landmarks, dims=3) -> np.ndarray:
+    """Pack Mediapipe landmarks into a contiguous (N, dims) float32 array."""
+    count = len(landmarks)
+    if dims == 3:
+        values = (v for lm in landmarks for v in (lm.x, lm.y, lm.z))
+    else:
+        values = (v for lm in landmarks for v in (lm.x, lm.y))
+    return np.fromiter(values, dtype=np.float32, count=count * dims).reshape(
+        count, dims
+    )
+
+
+def as_landmark_array(landmarks) -> np.ndarray:
+    """Accept a landmark array, a list of tuples or Mediapipe landmark objects."""
+    if isinstance(landmarks, np.ndarray):
+        return landmarks
+    if len(landmarks) and hasattr(landmarks[0], "x"):
+        return landmarks_to_array(landmarks)
+    return np.asarray(landmarks, dtype=np.float32)
+
+
+def to_px(landmarks: np.ndarray, indices, w, h) -> np.ndarray:
+    """Pixel coordinates (len(indices), 2) of the selected landmarks."""
+    return landmarks[indices, :2].astype(np.float64) * (w, h)
@@ -1,15 +1,58 @@
 from detectors.face import detect_faces
-from detectors.face_mesh import detect_face_mesh
+from detectors.face_mesh import (
+    detect_face_mesh,
+    detect_faces_and_mesh,
+    empty_mesh_output,
+)
 from detectors.hand import detect_hands
-from detectors.derived.head_pose import detect_head_pose
-from detectors.derived.eye_gaze import detect_eye_gaze
+from detectors.derived.head_pose import detect_head_pose_batch
+from detectors.derived.eye_gaze import detect_eye_gaze_batch
+from detectors.cascade import parse_rules, reuse_sources
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from utils import cancel, config
+import numpy as np
+import threading
 
+FEATURE_MODES = ("separate", "fused")
+DETECTOR_RUNNERS = ("sequential", "parallel")
 
-def extract_features_from_image(img) -> dict:
+# Executors of the calling (request) thread, created on first use:
+#   shards     threads that extract frame shards of one clip in parallel
+#              (see extract_features_from_images)
+#   detectors  parallel runner: one single-thread executor per detector, so
+#              each graph lives on (and keeps the frame order of) its own thread
+# Their threads keep their own MediaPipe graphs, so like the request thread's
+# own graphs they only ever see its clips, one after another. They go away
+# with the thread.
+_executors = threading.local()
+
+
+def _run_detectors(img, mode, gate_mesh=False, face_mesh=True, hand_complexity=1):
+    """
+    Run the per-frame detectors one after another; returns (faces, mesh, hands).
+    With gate_mesh, FaceMesh is skipped when no face was detected; without
+    face_mesh it never runs (FaceDetection gives the faces in either mode).
+    """
+    # FACE BOUNDS + FACE MESH
+    if not face_mesh:
+        faces, mesh = detect_faces(img), empty_mesh_output()
+    elif mode == "fused":
+        # One FaceMesh run gives both the landmarks and the face boxes
+        faces, mesh = detect_faces_and_mesh(img)
+    else:
+        faces = detect_faces(img)
+        mesh = detect_face_mesh(img) if faces or not gate_mesh else empty_mesh_output()
+
+    # HANDS
+    hands = detect_hands(img, hand_complexity)
+    return faces, mesh, hands
+
+
+def _detector_features(faces, mesh, hands):
+    """Feature dict from the detector outputs; returns (features, mesh_points or None)."""
     features = {}
 
-    # FACE BOUNDS
-    faces = detect_faces(img)
     if faces:
         f = faces[0]
         features["face_present"] = 1
@@ -28,8 +71,6 @@ def extract_features_from_image(img) -> dict:
         features["face_conf"] = 0
         features["face_count"] = 0
 
-    # FACE MESH
-    mesh = detect_face_mesh(img)
     # key = mesh["keypoints"]
 
     # def get_xy(point):
@@ -45,7 +86,6 @@ def extract_features_from_image(img) -> dict:
     # features["pupil_right_x"], features["pupil_right_y"] = get_xy(key["pupil_right"])
 
     # HANDS
-    hands = detect_hands(img)
     features["hand_count"] = hands["hand_count"]
 
     features["wrist_left_x"] = hands["wrist_left_x"] or 0
@@ -53,28 +93,268 @@ def extract_features_from_image(img) -> dict:
     features["wrist_right_x"] = hands["wrist_right_x"] or 0
     features["wrist_right_y"] = hands["wrist_right_y"] or 0
 
-    # HEAD POSE
-    if mesh["mesh_points"]:
-        hp = detect_head_pose(mesh["mesh_points"], img.shape)
-        features["head_yaw"] = hp["yaw"]
-        features["head_pitch"] = hp["pitch"]
-        features["head_roll"] = hp["roll"]
-        # orientation = hp["orientation"]
-    else:
+    return features, mesh["mesh_points"]
+
+
+def _extract_detector_features(img, mode, gate_mesh=False, face_mesh=True, hand_complexity=1):
+    return _detector_features(
+        *_run_detectors(img, mode, gate_mesh, face_mesh, hand_complexity)
+    )
+
+
+def _get_detector_executor(name):
+    if not hasattr(_executors, "detectors"):
+        _executors.detectors = {}
+    if name not in _executors.detectors:
+        _executors.detectors[name] = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"detector-{name}"
+        )
+    return _executors.detectors[name]
+
+
+def _results(futures):
+    """
+    Results of `futures`, in order. Waits for all of them even when one
+    raises (a cancelled request), so none is left running on this thread's
+    executors when the next request starts.
+    """
+    wait(futures)
+    return [future.result() for future in futures]
+
+
+def _detector_calls(mode, face_mesh=True, hand_complexity=1):
+    """(executor name, detector) pairs whose outputs make up _run_detectors'."""
+    hands = ("hands", partial(detect_hands, model_complexity=hand_complexity))
+    if not face_mesh:
+        return [("face", detect_faces), hands]
+    if mode == "fused":
+        return [("face_mesh", detect_faces_and_mesh), hands]
+    return [("face", detect_faces), ("face_mesh", detect_face_mesh), hands]
+
+
+def _detect_frame(detect, img):
+    cancel.check()
+    return detect(img)
+
+
+def _extract_parallel(frames, mode, face_mesh=True, hand_complexity=1):
+    """
+    Same results as _extract_detector_features over `frames`, with every
+    detector on its own thread. MediaPipe releases the GIL, so the detectors
+    of a frame overlap, and a detector can move on to the next frame while
+    the slowest one is still busy. Each detector still sees the frames in order.
+    """
+    futures = [
+        [
+            _get_detector_executor(name).submit(cancel.bound(_detect_frame), detect, img)
+            for img in frames
+        ]
+        for name, detect in _detector_calls(mode, face_mesh, hand_complexity)
+    ]
+    wait([future for per_detector in futures for future in per_detector])
+    outputs = [_results(per_detector) for per_detector in futures]
+
+    results = []
+    for frame_outputs in zip(*outputs):
+        if not face_mesh:
+            (faces, hands), mesh = frame_outputs, empty_mesh_output()
+        elif mode == "fused":
+            (faces, mesh), hands = frame_outputs
+        else:
+            faces, mesh, hands = frame_outputs
+        results.append(_detector_features(faces, mesh, hands))
+    return results
+
+
+def _add_derived_features(features_list, meshes, frame_shape, pose_method):
+    """Fill head pose and eye gaze for frames of one shape, batched over frames with a face."""
+    # Frames without a face mesh keep zeros
+    for features in features_list:
         features["head_yaw"] = 0
         features["head_pitch"] = 0
         features["head_roll"] = 0
-        # orientation = "forward"
+        features["eye_gaze_x"], features["eye_gaze_y"] = (0, 0)
+
+    with_mesh = [i for i, points in enumerate(meshes) if points is not None]
+    if not with_mesh:
+        return
 
-    # features["head_pose"] = orientation
+    landmarks = np.stack([meshes[i] for i in with_mesh])
+
+    # HEAD POSE
+    hp = detect_head_pose_batch(landmarks, frame_shape, method=pose_method)
 
     # EYE GAZE
-    if mesh["mesh_points"]:
-        gaze = detect_eye_gaze(mesh["mesh_points"], img.shape)
-        features["eye_gaze_x"], features["eye_gaze_y"] = gaze["gaze_point"]
-        # features["gaze_direction"] = gaze["gaze_direction"]
+    gaze = detect_eye_gaze_batch(landmarks, frame_shape)["gaze_point"]
+
+    for row, i in enumerate(with_mesh):
+        features = features_list[i]
+        features["head_yaw"] = float(hp["yaw"][row])
+        features["head_pitch"] = float(hp["pitch"][row])
+        features["head_roll"] = float(hp["roll"][row])
+        features["eye_gaze_x"] = float(gaze[row, 0])
+        features["eye_gaze_y"] = float(gaze[row, 1])
+
+
+def _get_shard_executor(shards):
+    """This thread's shard executor, with at least `shards` threads (grown, never shrunk)."""
+    executor = getattr(_executors, "shards", None)
+    if executor is None or _executors.shard_count < shards:
+        if executor is not None:
+            # Idle: only this thread submits to it, and it waits for its shards
+            executor.shutdown()
+        executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix="frame-shard")
+        _executors.shards, _executors.shard_count = executor, shards
+    return executor
+
+
+def _extract_shard(frames, mode, gate_mesh=False, face_mesh=True, hand_complexity=1):
+    results = []
+    for img in frames:
+        # A cancelled or expired request stops between frames
+        cancel.check()
+        results.append(
+            _extract_detector_features(img, mode, gate_mesh, face_mesh, hand_complexity)
+        )
+    return results
+
+
+def _shard_bounds(count, shards):
+    """Contiguous [start, end) ranges splitting `count` frames over `shards`."""
+    shards = max(1, min(shards, count))
+    edges = [round(i * count / shards) for i in range(shards + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def warm_up_shards(img, mode=None, shards=None):
+    """
+    Run `img` once on every shard thread of the calling thread so each
+    builds its graphs now. The barrier keeps any thread from taking two of
+    the warm-up tasks.
+    """
+    mode = mode or config.FEATURE_MODE
+    shards = shards or config.FRAME_SHARDS
+    if shards <= 1:
+        return
+
+    executor = _get_shard_executor(shards)
+    barrier = threading.Barrier(shards)
+
+    def warm():
+        barrier.wait()
+        _extract_detector_features(img, mode)
+
+    _results([executor.submit(warm) for _ in range(shards)])
+
+
+def extract_features_from_image(img, mode=None, pose_method=None) -> dict:
+    return extract_features_from_images([img], mode, pose_method)[0]
+
+
+def _extract_frames(frames, mode, shards, runner, gate_mesh, face_mesh, hand_complexity):
+    """(features, mesh_points) per frame with the configured runner."""
+    if shards > 1 and len(frames) > 1:
+        executor = _get_shard_executor(shards)
+        futures = [
+            executor.submit(
+                cancel.bound(_extract_shard),
+                frames[start:end],
+                mode,
+                gate_mesh,
+                face_mesh,
+                hand_complexity,
+            )
+            for start, end in _shard_bounds(len(frames), shards)
+        ]
+        return [result for shard in _results(futures) for result in shard]
+    if runner == "parallel":
+        # Detectors run side by side, so there's no face result to gate on
+        return _extract_parallel(frames, mode, face_mesh, hand_complexity)
+    return _extract_shard(frames, mode, gate_mesh, face_mesh, hand_complexity)
+
+
+def extract_features_from_images(
+    frames,
+    mode=None,
+    pose_method=None,
+    shards=None,
+    runner=None,
+    rules=None,
+    stats=None,
+    face_mesh=True,
+    hand_complexity=1,
+) -> list:
+    """
+    Feature dicts for a list of frames, in order. Detectors run per frame;
+    head pose and eye gaze run once over all frames that have a face mesh.
+    With shards > 1 the frames are split into that many contiguous runs,
+    extracted in parallel on threads with their own graphs. Each run starts
+    with cold tracking, so features can differ slightly from a serial pass.
+    Otherwise the "parallel" runner runs the detectors concurrently (see
+    _extract_parallel).
+    `rules` are the cascade rules to apply (see detectors/cascade.py); when a
+    `stats` dict is given, frames_reused and mesh_skipped are added to it.
+    Without `face_mesh` FaceMesh doesn't run (head pose and gaze stay 0);
+    `hand_complexity` picks the Hands model (see utils/tiers.py).
+    """
+    mode = mode or config.FEATURE_MODE
+    pose_method = pose_method or config.HEAD_POSE_METHOD
+    shards = shards or config.FRAME_SHARDS
+    runner = runner or config.DETECTOR_RUNNER
+    rules = parse_rules(config.CASCADE if rules is None else rules)
+    if mode not in FEATURE_MODES:
+        raise ValueError(f"Unknown feature mode: {mode}")
+    if runner not in DETECTOR_RUNNERS:
+        raise ValueError(f"Unknown detector runner: {runner}")
+
+    # Near-duplicate frames take the features of the frame they repeat
+    if "reuse_similar" in rules:
+        sources = reuse_sources(frames, config.CASCADE_REUSE_DIFF)
     else:
-        features["eye_gaze_x"], features["eye_gaze_y"] = (0, 0)
-        # features["gaze_direction"] = "center"
+        sources = list(range(len(frames)))
+    unique = [i for i, source in enumerate(sources) if source == i]
+
+    sharded = shards > 1 and len(unique) > 1
+    gate_mesh = (
+        face_mesh
+        and "mesh_needs_face" in rules
+        and mode == "separate"
+        and (sharded or runner != "parallel")
+    )
+    extracted = _extract_frames(
+        [frames[i] for i in unique],
+        mode,
+        shards,
+        runner,
+        gate_mesh,
+        face_mesh,
+        hand_complexity,
+    )
+    extracted = dict(zip(unique, extracted))
+    results = [
+        extracted[i] if source == i else (dict(extracted[source][0]), extracted[source][1])
+        for i, source in enumerate(sources)
+    ]
+    features_list = [features for features, _ in results]
+
+    if stats is not None:
+        stats["frames_reused"] = len(frames) - len(unique)
+        stats["mesh_skipped"] = (
+            sum(1 for i in unique if extracted[i][0]["face_present"] == 0)
+            if gate_mesh
+            else 0
+        )
+
+    # Frames of a clip share a shape; group in case callers mix sources
+    by_shape = {}
+    for i, img in enumerate(frames):
+        by_shape.setdefault(img.shape[:2], []).append(i)
+    for shape, indices in by_shape.items():
+        _add_derived_features(
+            [features_list[i] for i in indices],
+            [results[i][1] for i in indices],
+            shape,
+            pose_method,
+        )
 
-    return features
+    return features_list
@@ -0,0 +1,83 @@
+import sys
+import time
+import numpy as np
+from detectors.main import extract_features_from_image
+from utils.video import sample_frames
+
+# Calibration report for the fused feature mode. Runs both extraction modes
+# on the same frames and compares the features they produce:
+#   python -m detectors.main_test clip1.webm clip2.webm [--samples 20]
+
+BOX_FEATURES = ["face_x", "face_y", "face_w", "face_h"]
+COMPARED_FEATURES = BOX_FEATURES + [
+    "face_conf",
+    "face_count",
+    "face_present",
+    "eye_gaze_x",
+    "eye_gaze_y",
+    "head_yaw",
+    "head_pitch",
+    "head_roll",
+]
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = 20
+    if "--samples" in args:
+        i = args.index("--samples")
+        sample_count = int(args[i + 1])
+        del args[i : i + 2]
+
+    if not args:
+        print("Usage: python -m detectors.main_test <video> [<video> ...]")
+        return
+
+    rows = {"separate": [], "fused": []}
+    timings = {"separate": 0.0, "fused": 0.0}
+    for path in args:
+        frames, _ = sample_frames(path, sample_count)
+        for img in frames:
+            for mode in rows:
+                start = time.perf_counter()
+                features = extract_features_from_image(img, mode=mode)
+                timings[mode] += time.perf_counter() - start
+                rows[mode].append([features[key] for key in COMPARED_FEATURES])
+
+    frame_count = len(rows["separate"])
+    if frame_count == 0:
+        print("No frames decoded")
+        return
+
+    separate = np.array(rows["separate"], dtype=np.float64)
+    fused = np.array(rows["fused"], dtype=np.float64)
+    present = COMPARED_FEATURES.index("face_present")
+    both = (separate[:, present] == 1) & (fused[:, present] == 1)
+
+    print(f"frames: {frame_count}, face in both modes: {int(both.sum())}")
+    print(
+        f"face presence agreement: "
+        f"{np.mean(separate[:, present] == fused[:, present]):.3f}"
+    )
+    for mode, total in timings.items():
+        print(f"[{mode}] {total / frame_count * 1000:.1f} ms/frame")
+
+    print(f"{'feature':<14}{'mean |diff|':>12}{'max |diff|':>12}{'fit (a*fused+b)':>22}")
+    for i, key in enumerate(COMPARED_FEATURES):
+        mask = both if key not in ("face_count", "face_present") else slice(None)
+        diff = np.abs(separate[mask, i] - fused[mask, i])
+        fit = ""
+        if key in BOX_FEATURES and both.sum() >= 2:
+            a, b = np.polyfit(fused[both, i], separate[both, i], 1)
+            fit = f"{a:.3f}*x{b:+.3f}"
+        mean_diff = diff.mean() if diff.size else float("nan")
+        max_diff = diff.max() if diff.size else float("nan")
+        print(f"{key:<14}{mean_diff:>12.4f}{max_diff:>12.4f}{fit:>22}")
+
+    if both.any():
+        conf = separate[both, COMPARED_FEATURES.index("face_conf")].mean()
+        print(f"suggested DISTRACT_FUSED_FACE_CONF={conf:.3f}")
+
+
+if __name__ == "__main__":
+    main()
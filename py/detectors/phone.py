@@ -1,36 +1,47 @@
-from ultralytics import YOLO
-import torch
+import threading
+from utils import cancel, config
+from utils.lazy import lazy_loader
 
-# Load YOLOv8m model
-model = YOLO("yolov8n.pt")
-model.fuse()  # small speed & stability boost
+# Shared by every request thread; ultralytics predictors aren't thread-safe
+_predict_lock = threading.Lock()
 
 
-def detect_phone(frame, conf_thresh=0.35):
-    h, w = frame.shape[:2]
+# torch + ultralytics are only imported here, on first use.
+# Returns (model, predict device)
+@lazy_loader("yolo")
+def get_model():
+    from ultralytics import YOLO
+    import torch
 
-    # Run prediction
-    results = model.predict(
-        source=frame,
-        classes=[67],  # COCO class 'cell phone'
-        conf=conf_thresh,  # minimum confidence
-        iou=0.5,  # NMS IoU threshold
-        imgsz=640,  # higher resolution for small phones
-        device=0 if torch.cuda.is_available() else "cpu",
-        verbose=False,
-    )
+    # Load YOLOv8m model
+    model = YOLO("yolov8n.pt")
+    model.fuse()  # small speed & stability boost
+    return model, 0 if torch.cuda.is_available() else "cpu"
 
-    detections = []
 
-    # Only one frame, so grab first result
-    r = results[0]
+def _predict(source, conf_thresh, imgsz=640):
+    model, device = get_model()
+    with _predict_lock:
+        return model.predict(
+            source=source,
+            classes=[67],  # COCO class 'cell phone'
+            conf=conf_thresh,  # minimum confidence
+            iou=0.5,  # NMS IoU threshold
+            imgsz=imgsz,  # 640: higher resolution for small phones
+            device=device,
+            verbose=False,
+        )
 
-    if r.boxes is None or len(r.boxes) == 0:
+
+def _to_detections(result, w, h):
+    detections = []
+
+    if result.boxes is None or len(result.boxes) == 0:
         return detections
 
     # Extract boxes and confidences as arrays
-    boxes = r.boxes.xywh.cpu().numpy()  # center x, center y, width, height
-    confs = r.boxes.conf.cpu().numpy()
+    boxes = result.boxes.xywh.cpu().numpy()  # center x, center y, width, height
+    confs = result.boxes.conf.cpu().numpy()
 
     for (cx, cy, bw, bh), conf in zip(boxes, confs):
         detections.append(
@@ -44,3 +55,50 @@ def detect_phone(frame, conf_thresh=0.35):
         )
 
     return detections
+
+
+def detect_phone(frame, conf_thresh=0.35):
+    h, w = frame.shape[:2]
+
+    # Run prediction
+    results = _predict(frame, conf_thresh)
+
+    # Only one frame, so grab first result
+    return _to_detections(results[0], w, h)
+
+
+def detect_phones(frames, conf_thresh=0.35, mask=None, imgsz=640):
+    """
+    Detect phones on every frame of a clip with batched predict calls of
+    config.PHONE_BATCH frames. Frames whose `mask` entry is False are not run
+    and count as phone-free. `imgsz` is the YOLO input size.
+    Returns:
+        frames: per-frame detection lists, in input order
+        summary: present (any frame), frame_ratio (frames with a phone / frames),
+                 max_confidence (over all frames)
+    """
+    frames = list(frames)
+    per_frame = [[] for _ in frames]
+    run = [i for i in range(len(frames)) if mask is None or mask[i]]
+
+    batch = config.PHONE_BATCH if config.PHONE_BATCH > 0 else max(1, len(run))
+    for start in range(0, len(run), batch):
+        # A cancelled or expired request stops between batches
+        cancel.check()
+        chunk = run[start : start + batch]
+        results = _predict([frames[i] for i in chunk], conf_thresh, imgsz)
+        for i, r in zip(chunk, results):
+            h, w = frames[i].shape[:2]
+            per_frame[i] = _to_detections(r, w, h)
+
+    hits = sum(1 for detections in per_frame if detections)
+    confidences = [d["confidence"] for detections in per_frame for d in detections]
+
+    return {
+        "frames": per_frame,
+        "summary": {
+            "present": hits > 0,
+            "frame_ratio": hits / len(per_frame) if per_frame else 0.0,
+            "max_confidence": max(confidences, default=0.0),
+        },
+    }
@@ -1,34 +1,310 @@
-import sys, json
-from utils.model import use_model
+import sys
+import os
+import queue
+import threading
+import time
+import psutil
+from utils.cache import cached_use_model, get_result_cache
+from utils.cancel import RequestCancelled
+from utils.model import use_model, warm_up
+from utils.protocol import Channel, ProtocolError
+from utils.shm import detach, detach_all, use_frames
+from utils.tiers import QualityController
+from utils import cancel
+from utils import live
+from utils import config
 import logging
 
 
 logging.basicConfig(level=logging.ERROR)  # only show ERROR or higher
 logger = logging.getLogger(__name__)
 
+# Request threads and the reader all write responses, one message at a time,
+# as JSON lines or frames once the host negotiates them (see utils/protocol.py)
+_channel = Channel(sys.stdin.buffer, sys.stdout.buffer)
 
-def handle_message(msg):
+# use_model / use_frames requests waiting for a request thread (None tells a
+# thread to exit); a cancelled or expired one is answered when a thread takes it.
+# Requests that find it full are answered "busy" right away (see _submit).
+_requests = queue.Queue(maxsize=max(1, config.MAX_QUEUED_REQUESTS))
+
+# Request threads (or pool workers) warm up their own graphs before taking
+# requests; the worker reports "ready" once all of them have
+_warm_lock = threading.Lock()
+_warm_results = []
+_warm_start = time.perf_counter()
+_status = "warming"
+
+# Set in fork mode (see utils/pool.py)
+_pool = None
+
+# Picks each request's quality tier from the backlog and latency (see utils/tiers.py)
+_quality = QualityController()
+
+
+def emit(msg):
+    _channel.write(msg)
+
+
+def _answer(msg):
+    """Emit a use_model / use_frames answer, timing the request for the tier controller."""
+    _quality.answered(msg.get("correlationId"), msg.get("type") != "error")
+    emit(msg)
+
+
+def _warmed(timings):
+    """Called once per request thread or pool worker (timings None if skipped or failed)."""
+    global _status
+    with _warm_lock:
+        _warm_results.append(timings)
+        if len(_warm_results) < _worker_count():
+            return
+        _status = "ready"
+
+    if config.WARM_UP:
+        emit({"type": "status", "data": "ready", **_warm_summary()})
+
+
+def _warm_summary():
+    done = [t for t in _warm_results if t is not None]
+    if not done:
+        return {}
+    return {
+        "workers": len(done),
+        "load_ms": done[-1]["load_ms"],
+        # Slowest thread per stage
+        "warmup_ms": {
+            stage: max(t["warmup_ms"][stage] for t in done)
+            for stage in done[0]["warmup_ms"]
+        },
+        "total_ms": (time.perf_counter() - _warm_start) * 1000,
+    }
+
+
+def _fork_mode():
+    if config.WORKER_MODE != "fork":
+        return False
+    if not sys.platform.startswith("linux"):
+        logger.warning("DISTRACT_WORKER_MODE=fork needs Linux; using threads")
+        return False
+    return True
+
+
+def _worker_count():
+    if _pool is not None:
+        return _pool.size
+    return max(1, config.WORKER_THREADS)
+
+
+def _request_thread():
+    timings = None
+    if config.WARM_UP:
+        try:
+            timings = warm_up()
+        except Exception as e:
+            # Models still load on first use; the first clip just pays for it
+            logger.exception("Warm-up failed")
+            emit({"type": "error", "data": f"warm-up failed: {e}"})
+    _warmed(timings)
+
+    while True:
+        msg = _requests.get()
+        if msg is None:
+            return
+        _quality.started(msg.get("correlationId"))
+        msg["tier"] = _quality.choose()
+        try:
+            _answer(handle_message(msg))
+        except Exception as e:
+            _answer({"type": "error", "correlationId": msg.get("correlationId"), "data": str(e)})
+
+
+def _submit(msg):
+    cid = msg.get("correlationId")
+    _quality.received()
+    cancel.track(msg)
+    try:
+        _requests.put_nowait(msg)
+    except queue.Full:
+        # Turned away rather than waiting for room: the reader has to keep
+        # reading pings, stats and the cancels that would free it up
+        cancel.untrack(cid)
+        _quality.turned_away()
+        _answer(
+            {
+                "type": "error",
+                "correlationId": cid,
+                "data": f"Worker busy: {_requests.maxsize} requests already queued",
+                "reason": "busy",
+            }
+        )
+
+
+def _submit_to_pool(msg):
+    # Workers queue their own requests, so the tier is picked when sending
+    _quality.received()
+    msg["tier"] = _quality.choose(_pool.queued())
+    _pool.submit(msg)
+
+
+def _cancel(msg):
+    """Stop a queued or running request (see utils/cancel.py); unknown ones are ignored."""
+    if _pool is not None:
+        _pool.cancel(msg.get("correlationId"))
+    else:
+        cancel.cancel(msg.get("correlationId"))
+
+
+def start_request_threads():
+    threads = [
+        threading.Thread(target=_request_thread, name=f"request-{i}", daemon=True)
+        for i in range(_worker_count())
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def start_pool():
+    global _pool
+    from utils.pool import WorkerPool
+
+    _pool = WorkerPool(
+        config.WORKER_PROCESSES, handle_message, _answer, _warmed, _quality.started
+    )
+    _pool.start()
+
+
+def stats():
+    """
+    Memory of the worker (and of each pool process in fork mode), result
+    cache counters, cancelled / expired request counts (both summed over the
+    pool processes in fork mode), and the quality tier controller's state.
+    """
+    if _pool is not None:
+        data = _pool.stats()
+    else:
+        memory = psutil.Process().memory_info()
+        data = {"parent": {"pid": os.getpid(), "rss_mb": memory.rss / 1e6}, "workers": []}
+
+    if config.RESULT_CACHE:
+        cache = get_result_cache().stats()
+        if _pool is not None:
+            # The parent never serves requests; its disk view is shared, the rest isn't
+            cache = {
+                "hits": sum(w["cache_hits"] for w in data["workers"]),
+                "misses": sum(w["cache_misses"] for w in data["workers"]),
+                "disk_entries": cache["disk_entries"],
+                "disk_mb": cache["disk_mb"],
+                "expired": cache["expired"],
+            }
+        data["cache"] = cache
+    if _pool is not None:
+        data["requests"] = {
+            reason: sum(w[reason] for w in data["workers"]) for reason in cancel.REASONS
+        }
+    else:
+        data["requests"] = cancel.stats()
+    data["tiers"] = _quality.stats()
+    data["protocol"] = _channel.stats()
+    return data
+
+
+def _run_request(msg):
+    tier = msg.get("tier", "full")
     if msg["type"] == "use_model":
-        video_path = msg["videoPath"]
-        sample_count = msg["sampleCount"]
+        return cached_use_model(msg["videoPath"], msg["sampleCount"], use_model, tier)
+    # Frames in a shared-memory ring instead of a clip; see utils/shm.py
+    return use_frames(msg, tier)
+
+
+def handle_message(msg):
+    if msg["type"] in ("use_model", "use_frames"):
+        try:
+            with cancel.request(msg):
+                value = _run_request(msg)
+        except RequestCancelled as e:
+            return {
+                "type": "error",
+                "correlationId": msg["correlationId"],
+                "data": str(e),
+                "reason": e.reason,
+            }
+        return {"correlationId": msg["correlationId"], "value": value}
+    elif msg["type"] == "ping":
+        # Answered right away, even while warming up
         return {
-            "correlationId": msg["correlationId"],
-            "value": use_model(video_path, sample_count),
+            "type": "pong",
+            "correlationId": msg.get("correlationId"),
+            "value": {"status": _status},
         }
-    elif msg["type"] == "ping":
-        return {"type": "pong"}
+    elif msg["type"] == "stats":
+        return {"type": "stats", "correlationId": msg.get("correlationId"), "value": stats()}
+    elif msg["type"] == "start_live":
+        # Results arrive as "live_result" messages; see utils/live.py
+        return {
+            "correlationId": msg.get("correlationId"),
+            "value": {"sessionId": live.start_live(msg, emit)},
+        }
+    elif msg["type"] == "detach_frames":
+        # Frame rings are mapped where use_frames runs; see utils/shm.py
+        if _pool is not None:
+            _pool.broadcast(msg)
+        else:
+            detach(msg["shm"])
+        return {"correlationId": msg.get("correlationId"), "value": {"shm": msg["shm"]}}
+    elif msg["type"] == "stop_live":
+        live.stop_live(msg["sessionId"])
+        return {"correlationId": msg.get("correlationId"), "value": {"sessionId": msg["sessionId"]}}
     else:
         return {"type": "error", "data": "unknown type"}
 
 
 def main():
-    for line in sys.stdin:
+    if config.WARM_UP:
+        emit({"type": "status", "data": "warming"})
+
+    threads = []
+    if _fork_mode():
+        # Loads the models before forking, so the first pong waits for that
+        start_pool()
+        submit = _submit_to_pool
+    else:
+        threads = start_request_threads()
+        submit = _submit
+
+    while True:
+        msg = {}
         try:
-            msg = json.loads(line.strip())
-            result = handle_message(msg)
-            print(json.dumps(result), flush=True)
+            msg = _channel.read()
+            if msg is None:
+                break
+            if msg.get("type") == "hello":
+                _channel.negotiate(msg)
+                continue
+            if msg.get("type") == "cancel":
+                _cancel(msg)
+                continue
+            if msg.get("type") in ("use_model", "use_frames"):
+                # Answered by a request thread or pool worker, possibly out of order
+                submit(msg)
+                continue
+            emit(handle_message(msg))
+        except ProtocolError as e:
+            emit({"type": "error", "data": f"stopped reading requests: {e}"})
+            break
         except Exception as e:
-            print(json.dumps({"type": "error", "data": str(e)}), flush=True)
+            emit({"type": "error", "correlationId": msg.get("correlationId"), "data": str(e)})
+
+    # stdin closed: finish what was already received
+    live.stop_all()
+    if _pool is not None:
+        _pool.close()
+    for _ in threads:
+        _requests.put(None)
+    for thread in threads:
+        thread.join()
+    detach_all()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 # -*- mode: python -*-
 
 import sys
-from PyInstaller.utils.hooks import collect_data_files
+from PyInstaller.utils.hooks import collect_data_files, collect_dynamic_libs
 
 # Collect all data files from mediapipe modules and models dir
 mediapipe_datas = collect_data_files("mediapipe", include_py_files=True)
@@ -16,12 +16,15 @@ block_cipher = None
 a = Analysis(
     ['main.py'],
     pathex=['.'], # current folder
-    binaries=[],
+    binaries=collect_dynamic_libs("decord"),  # libdecord is loaded via ctypes
     datas=datas,
     hiddenimports=[
         'mediapipe.python.solutions.face_mesh',
         'sklearn',
-        'sklearn.tree'
+        'sklearn.tree',
+        'decord',
+        'polars',
+        'msgpack'
     ],
     hookspath=[],
     runtime_hooks=[],
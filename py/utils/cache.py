@@ -0,0 +1,294 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import threading
+from collections import OrderedDict
+from utils import config
+from utils.lazy import lazy_loader
+
+logger = logging.getLogger(__name__)
+
+# Bump when a code change alters use_model results for the same clip, models
+# and settings, so results cached by older builds stop matching
+PIPELINE_VERSION = 2
+
+# Settings that change use_model results; the ones that only change how the
+# work is scheduled (runner, worker mode, warm-up...) are left out
+RESULT_SETTINGS = (
+    "FRAME_SAMPLER",
+    "DECODE_BACKEND",
+    "DECODE_SIZE",
+    "FEATURE_MODE",
+    "FUSED_MAX_FACES",
+    "FUSED_FACE_CONF",
+    "HEAD_POSE_METHOD",
+    "SCORING_ENGINE",
+    "FRAME_SHARDS",
+    "CASCADE",
+    "CASCADE_REUSE_DIFF",
+    "CASCADE_PITCH_DEVIATION",
+    "ADAPTIVE_OVERSAMPLE",
+    "ADAPTIVE_MIN_DIFF",
+    "ADAPTIVE_MIN_FRAMES",
+    "EARLY_STOP",
+    "EARLY_STOP_CONFIDENCE",
+    "EARLY_STOP_MIN_FRAMES",
+    "EARLY_STOP_BATCH",
+    "EARLY_STOP_MIN_STD",
+)
+
+_CHUNK = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_files():
+    """Every model file use_model may load, whether or not it exists."""
+    from utils.model import MODEL_FILES, _model_path
+
+    paths = [
+        _model_path(name, artifact=artifact)
+        for name in MODEL_FILES
+        for artifact in (False, True)
+    ]
+    # detectors/phone.py loads YOLO relative to the working directory
+    return paths + [os.path.abspath("yolov8n.pt")]
+
+
+def model_fingerprint() -> str:
+    """Hash of the model files' contents (missing files count as missing)."""
+    digest = hashlib.sha256()
+    for path in model_files():
+        digest.update(path.encode())
+        digest.update(file_sha256(path).encode() if os.path.exists(path) else b"-")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    use_model results keyed by what they depend on: the clip's bytes, the
+    sample count, PIPELINE_VERSION, RESULT_SETTINGS and the model files.
+
+    Two LRU tiers: up to `memory_entries` results in memory, and up to
+    `disk_mb` of JSON files under `directory`/<model fingerprint>. A replaced
+    model gets a directory of its own; other fingerprints' directories are
+    never touched, since other installs or model versions may be using them.
+    Entries not read for `max_days` are deleted when the cache opens. Disk
+    entries are written atomically, so forked workers can share the directory.
+    """
+
+    def __init__(self, directory, memory_entries, disk_mb, fingerprint, max_days=0):
+        self.fingerprint = fingerprint
+        self.directory = os.path.join(directory, fingerprint[:16])
+        self.memory_entries = max(0, memory_entries)
+        self.disk_bytes = max(0, int(disk_mb * 1e6))
+        self.max_age = max(0, max_days) * 86400
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_used = None
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+
+        if self.disk_bytes:
+            os.makedirs(self.directory, exist_ok=True)
+            self._prune()
+
+    def _prune(self):
+        """Expire this fingerprint's stale entries and trim it to the disk budget."""
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            for path, _, mtime in self._disk_entries():
+                if mtime >= cutoff:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.counters["expired"] += 1
+        with self._lock:
+            self._evict_disk()
+
+    def key(self, video_path: str, sample_count: int) -> str:
+        settings = {name: getattr(config, name) for name in RESULT_SETTINGS}
+        digest = hashlib.sha256()
+        digest.update(file_sha256(video_path).encode())
+        digest.update(
+            json.dumps(
+                [PIPELINE_VERSION, sample_count, self.fingerprint, settings],
+                sort_keys=True,
+            ).encode()
+        )
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return json.loads(text)
+
+        text = self._read_disk(key)
+        with self._lock:
+            if text is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, text)
+        return json.loads(text)
+
+    def put(self, key, result):
+        text = json.dumps(result)
+        with self._lock:
+            self._remember(key, text)
+        self._write_disk(key, text)
+
+    def _remember(self, key, text):
+        if not self.memory_entries:
+            return
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    def _read_disk(self, key):
+        if not self.disk_bytes:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            # Disk entries are evicted least recently used first
+            os.utime(path)
+            return text
+        except OSError:
+            return None
+
+    def _write_disk(self, key, text):
+        if not self.disk_bytes:
+            return
+        data = text.encode("utf-8")
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write result cache entry: {e}")
+            return
+
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_used += len(data)
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        """(path, size, mtime) of every entry; other processes may add or remove some."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e[2])
+        used = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            used -= size
+            self.counters["disk_evictions"] += 1
+        self._disk_used = used
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.disk_bytes:
+                for path, _, _ in self._disk_entries():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._disk_used = 0
+
+    def stats(self):
+        with self._lock:
+            disk = self._disk_entries() if self.disk_bytes else []
+            return {
+                **self.counters,
+                "hits": self.counters["memory_hits"] + self.counters["disk_hits"],
+                "memory_entries": len(self._memory),
+                "disk_entries": len(disk),
+                "disk_mb": sum(size for _, size, _ in disk) / 1e6,
+            }
+
+
+@lazy_loader("result_cache")
+def get_result_cache():
+    directory = config.RESULT_CACHE_DIR or os.path.join(
+        tempfile.gettempdir(), "distract", "results"
+    )
+    return ResultCache(
+        directory,
+        config.RESULT_CACHE_ENTRIES,
+        config.RESULT_CACHE_DISK_MB,
+        model_fingerprint(),
+        config.RESULT_CACHE_MAX_DAYS,
+    )
+
+
+def cached_use_model(video_path: str, sample_count: int, use_model, tier: str = "full") -> dict:
+    """
+    use_model through the result cache (when config.RESULT_CACHE is on).
+    Only "full" tier results are stored; any request can be served one.
+    """
+    if not config.RESULT_CACHE:
+        return use_model(video_path, sample_count, tier)
+
+    cache = get_result_cache()
+    try:
+        key = cache.key(video_path, sample_count)
+    except OSError:
+        # Unreadable clip: let use_model report it as it always has
+        return use_model(video_path, sample_count, tier)
+    result = cache.get(key)
+    if result is not None:
+        result["stats"]["cache"] = "hit"
+        return result
+
+    result = use_model(video_path, sample_count, tier)
+    result["stats"]["cache"] = "miss"
+    if tier == "full":
+        cache.put(key, result)
+    return result
@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from utils.cache import ResultCache, cached_use_model, get_result_cache
+from utils.model import use_model
+
+# Result cache behaviour, then cold vs cached use_model time on real clips:
+#   python -m utils.cache_test [clip1.webm clip2.webm] [--samples 20]
+# Runs against a temporary cache directory, never the worker's own.
+
+
+def _check_tiers(directory):
+    result = {"scores": {"integrity_score": 0.5}, "stats": {}}
+    entry_mb = len(json.dumps({"n": 0, **result})) / 1e6
+
+    # Room for 2 results in memory and 3 on disk
+    cache = ResultCache(directory, memory_entries=2, disk_mb=entry_mb * 3.5, fingerprint="a" * 64)
+    for n in range(5):
+        cache.put(f"key{n}", {"n": n, **result})
+    stats = cache.stats()
+    print(f"memory LRU: {stats['memory_entries']} entries, {stats['memory_evictions']} evicted")
+    print(f"disk LRU: {stats['disk_entries']} entries, {stats['disk_evictions']} evicted")
+
+    assert cache.get("key4")["n"] == 4 and cache.counters["memory_hits"] == 1
+    assert cache.get("key2")["n"] == 2 and cache.counters["disk_hits"] == 1
+    assert cache.get("key0") is None and cache.counters["misses"] == 1
+
+    # A new model fingerprint misses the old results but leaves them in place,
+    # since another install may still be using the old model
+    other = ResultCache(directory, memory_entries=2, disk_mb=1, fingerprint="b" * 64)
+    assert other.get("key4") is None
+    reopened = ResultCache(directory, memory_entries=0, disk_mb=1, fingerprint="a" * 64)
+    assert reopened.get("key4")["n"] == 4
+    print(f"new fingerprint: old entries kept, {reopened.stats()['disk_entries']} on disk")
+
+    # Entries not read for max_days expire when the cache opens
+    stale = reopened._path("key2")
+    os.utime(stale, (0, 0))
+    expiring = ResultCache(directory, memory_entries=0, disk_mb=1, fingerprint="a" * 64, max_days=1)
+    assert not os.path.exists(stale) and expiring.get("key4")["n"] == 4
+    print(f"max age: {expiring.counters['expired']} stale entries expired")
+
+
+def _time_clips(paths, sample_count):
+    cache = get_result_cache()
+    cache.clear()
+    for path in paths:
+        for attempt in ("cold", "cached"):
+            start = time.perf_counter()
+            result = cached_use_model(path, sample_count, use_model)
+            print(
+                f"{path} [{attempt}] {result['stats']['cache']}, "
+                f"integrity {result['scores']['integrity_score']:.4f}, "
+                f"{(time.perf_counter() - start) * 1000:.1f} ms"
+            )
+    print(cache.stats())
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = 20
+    if "--samples" in args:
+        i = args.index("--samples")
+        sample_count = int(args[i + 1])
+        del args[i : i + 2]
+
+    from utils import config
+
+    with tempfile.TemporaryDirectory() as directory:
+        _check_tiers(directory)
+        if args:
+            config.RESULT_CACHE_DIR = directory
+            _time_clips(args, sample_count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Requests the host no longer needs. A queued or running use_model /
+# use_frames request stops at its next check when the host sends
+#   {"type": "cancel", "correlationId": <the request's correlationId>}
+# or once its optional "deadlineMs" (epoch ms, like Date.now()) has passed.
+# Checks run before any decoding and between frames, and the request is
+# answered with
+#   {"type": "error", "correlationId", "data", "reason": "cancelled" | "expired"}
+#
+# The running request is per thread; bound() carries it onto the shard and
+# detector threads that work on its frames.
+
+REASONS = ("cancelled", "expired")
+
+
+class RequestCancelled(Exception):
+    def __init__(self, correlation_id, reason):
+        super().__init__(
+            f"Request {correlation_id} was cancelled"
+            if reason == "cancelled"
+            else f"Request {correlation_id} passed its deadline"
+        )
+        self.correlation_id = correlation_id
+        self.reason = reason
+
+
+class _Request:
+    def __init__(self, msg):
+        self.correlation_id = msg.get("correlationId")
+        deadline = msg.get("deadlineMs")
+        self.deadline_ms = float(deadline) if deadline is not None else None
+        self.cancelled = False
+
+
+# Requests received and not answered yet, by correlationId
+_requests = {}
+_lock = threading.Lock()
+_local = threading.local()
+counters = {reason: 0 for reason in REASONS}
+
+
+def track(msg):
+    """Called when a request is received, so a cancel can find it while it waits."""
+    with _lock:
+        _requests[msg.get("correlationId")] = _Request(msg)
+
+
+def untrack(correlation_id):
+    """Forget a tracked request that won't run (turned away while the queue was full)."""
+    with _lock:
+        _requests.pop(correlation_id, None)
+
+
+def cancel(correlation_id) -> bool:
+    """Mark a request cancelled; False if it isn't here (unknown or already answered)."""
+    with _lock:
+        request = _requests.get(correlation_id)
+        if request is None:
+            return False
+        request.cancelled = True
+        return True
+
+
+def check():
+    """Raise RequestCancelled if this thread's request is cancelled or expired."""
+    request = getattr(_local, "request", None)
+    if request is None:
+        return
+    if request.cancelled:
+        raise RequestCancelled(request.correlation_id, "cancelled")
+    if request.deadline_ms is not None and time.time() * 1000 > request.deadline_ms:
+        raise RequestCancelled(request.correlation_id, "expired")
+
+
+@contextmanager
+def request(msg):
+    """Run a request on this thread: checks now, and on every later check()."""
+    with _lock:
+        current = _requests.setdefault(msg.get("correlationId"), _Request(msg))
+    _local.request = current
+    try:
+        check()
+        yield current
+    except RequestCancelled as e:
+        with _lock:
+            counters[e.reason] += 1
+        raise
+    finally:
+        _local.request = None
+        with _lock:
+            _requests.pop(current.correlation_id, None)
+
+
+def bound(fn):
+    """`fn` for another thread, checking against the calling thread's request."""
+    request = getattr(_local, "request", None)
+
+    def run(*args, **kwargs):
+        previous = getattr(_local, "request", None)
+        _local.request = request
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.request = previous
+
+    return run
+
+
+def stats():
+    with _lock:
+        return dict(counters)
@@ -0,0 +1,122 @@
+import os
+import subprocess
+import sys
+import time
+from utils.protocol import Channel
+
+# Stand in for the host: queue requests on a one-thread worker and cancel or
+# expire some of them, in thread mode and in fork mode:
+#   python -m utils.cancel_test clip.webm [--samples 20]
+# A cancelled request that is running should be answered within a frame or
+# so, long before it would have finished.
+
+
+def _next(host):
+    while True:
+        try:
+            return host.read()
+        except ValueError:
+            continue  # stray prints
+
+
+def _wait_for(host, cid):
+    start = time.perf_counter()
+    while True:
+        msg = _next(host)
+        if msg.get("correlationId") == cid:
+            return msg, (time.perf_counter() - start) * 1000
+
+
+def _describe(msg):
+    if msg.get("type") == "error":
+        return msg.get("reason") or f"error: {msg['data']}"
+    return f"scored ({msg['value']['scores']['integrity_score']:.4f})"
+
+
+def _run(path, sample_count, mode):
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "..", "main.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env={
+            **os.environ,
+            "DISTRACT_RESULT_CACHE": "0",
+            "DISTRACT_WORKER_MODE": mode,
+            "DISTRACT_WORKER_THREADS": "1",
+            "DISTRACT_WORKER_PROCESSES": "1",
+            "DISTRACT_QUALITY_TIER": "full",
+        },
+    )
+    host = Channel(worker.stdout, worker.stdin)
+    host.write({"type": "ping"})
+    while _next(host).get("type") != "pong":
+        pass
+
+    def request(cid, **extra):
+        host.write(
+            {
+                "type": "use_model",
+                "correlationId": cid,
+                "videoPath": path,
+                "sampleCount": sample_count,
+                **extra,
+            }
+        )
+
+    # Full runs, for how long a warm one takes
+    for cid in ("first", "full"):
+        request(cid)
+        msg, full_ms = _wait_for(host, cid)
+    print(f"  full: {_describe(msg)} in {full_ms:.0f} ms")
+
+    # Cancelled while running
+    request("running")
+    time.sleep(full_ms / 3000)
+    host.write({"type": "cancel", "correlationId": "running"})
+    msg, ms = _wait_for(host, "running")
+    print(f"  cancelled while running: {_describe(msg)} after {ms:.0f} ms")
+
+    # Queued behind a busy thread: one cancelled, one past its deadline
+    request("busy")
+    request("queued")
+    request("late", deadlineMs=time.time() * 1000 + full_ms / 2)
+    host.write({"type": "cancel", "correlationId": "queued"})
+    answers = {}
+    while len(answers) < 3:
+        msg = _next(host)
+        if msg.get("correlationId") in ("busy", "queued", "late"):
+            answers[msg["correlationId"]] = _describe(msg)
+    print(f"  queued: {answers}")
+
+    # Unknown ids are ignored
+    host.write({"type": "cancel", "correlationId": "nobody"})
+    host.write({"type": "stats"})
+    while True:
+        msg = _next(host)
+        if msg.get("type") == "stats":
+            print(f"  stats: {msg['value']['requests']}")
+            break
+    worker.stdin.close()
+    worker.wait(timeout=60)
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = 20
+    if "--samples" in args:
+        i = args.index("--samples")
+        sample_count = int(args[i + 1])
+        del args[i : i + 2]
+    if not args:
+        print("Usage: python -m utils.cancel_test <video>")
+        return
+    path = os.path.abspath(args[0])
+
+    for mode in ("threads", "fork"):
+        print(f"{mode}:")
+        _run(path, sample_count, mode)
+
+
+if __name__ == "__main__":
+    main()
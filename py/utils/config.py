@@ -0,0 +1,172 @@
+import os
+
+# Runtime knobs for the Python worker. Every value can be overridden with a
+# DISTRACT_<NAME> environment variable so the dev script and the bundled
+# main.exe can be tuned without rebuilding.
+
+
+def _env(name: str, default, cast=str):
+    value = os.environ.get(f"DISTRACT_{name}")
+    if value is None or value == "":
+        return default
+    if cast is bool:
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return cast(value)
+
+
+# How sampled frames are pulled out of a clip:
+# "sequential" decodes forward once and only retrieves the sampled frames,
+# "seek" jumps to every sampled index (decodes again from the previous keyframe),
+# "adaptive" spends the samples where the clip changes (see ADAPTIVE_* below)
+FRAME_SAMPLER = _env("FRAME_SAMPLER", "sequential")
+
+# Decoder used for clips: "decord" (batched get_batch, decode-time resizing) or
+# "opencv". Clips decord can't open fall back to opencv.
+DECODE_BACKEND = _env("DECODE_BACKEND", "decord")
+
+# Resolution frames are decoded to, as "WIDTHxHEIGHT". Empty keeps the
+# recorder's native 800x600.
+DECODE_SIZE = _env("DECODE_SIZE", "")
+
+# How face features are extracted per frame: "separate" runs FaceDetection and
+# FaceMesh, "fused" derives the face box from a single FaceMesh run.
+# Check `python -m detectors.main_test` before switching a deployment over.
+FEATURE_MODE = _env("FEATURE_MODE", "separate")
+
+# Faces the fused FaceMesh graph looks for. 2 matches detect_faces' face_count,
+# but while fewer faces are tracked the graph re-runs its own detector every
+# frame; 1 lets tracking skip the detector at the cost of face_count <= 1.
+FUSED_MAX_FACES = _env("FUSED_MAX_FACES", 2, int)
+
+# face_conf reported in fused mode (FaceMesh has no detection score)
+FUSED_FACE_CONF = _env("FUSED_FACE_CONF", 0.9, float)
+
+# Head pose solver: "pnp" (cv2.solvePnP per frame) or "fast" (the same solve
+# vectorized over the clip, frames that don't converge left to solvePnP; see
+# detectors/derived/head_pose.py). "fast" stays within 0.001 of "pnp"
+# (python -m detectors.derived.batch_test checks clips)
+HEAD_POSE_METHOD = _env("HEAD_POSE_METHOD", "pnp")
+
+# Forest scoring: "compiled" uses the flattened arrays in utils/forest.py,
+# "reference" the original sklearn/treeinterpreter path (for verification)
+SCORING_ENGINE = _env("SCORING_ENGINE", "compiled")
+
+# Load every model and run a blank frame through the graphs in the background
+# as soon as the worker starts, instead of on the first clip
+WARM_UP = _env("WARM_UP", True, bool)
+
+# Score with the memory-mapped forest artifacts in py/models when they exist
+# (see utils/export_forests.py); off compiles the pickles at startup instead
+MODEL_ARTIFACTS = _env("MODEL_ARTIFACTS", True, bool)
+
+# Requests (clips) the worker processes at once. Each request thread gets its
+# own MediaPipe graphs; YOLO is shared and runs one batch at a time.
+WORKER_THREADS = _env("WORKER_THREADS", 2, int)
+
+# Requests read from stdin but not yet picked up by a thread. Once full, more
+# requests are answered with a "busy" error (reason "busy") instead of
+# queueing, so the reader keeps serving pings, stats and cancels.
+MAX_QUEUED_REQUESTS = _env("MAX_QUEUED_REQUESTS", 8, int)
+
+# How concurrent requests are served: "threads" (WORKER_THREADS in this
+# process) or "fork" (Linux only: WORKER_PROCESSES forked after the models are
+# loaded, sharing them copy-on-write; see utils/pool.py)
+WORKER_MODE = _env("WORKER_MODE", "threads")
+WORKER_PROCESSES = _env("WORKER_PROCESSES", 2, int)
+
+# Quality tier of use_model / use_frames requests (see utils/tiers.py):
+# "full", "reduced", "minimal", or "auto" to degrade while the worker falls
+# behind and recover once it catches up (opt-in: coarser tiers change scores).
+# Auto steps one tier coarser when TIER_QUEUE_HIGH requests are waiting or the
+# moving average of request latency (start of processing to answer;
+# TIER_LATENCY_ALPHA smoothing) passes TIER_LATENCY_HIGH_MS, and one tier finer
+# when at most TIER_QUEUE_LOW are waiting and latency is under
+# TIER_LATENCY_LOW_MS. TIER_MIN_DWELL requests are answered between switches.
+# The defaults fit the renderer's 6 s clips.
+QUALITY_TIER = _env("QUALITY_TIER", "full")
+TIER_QUEUE_HIGH = _env("TIER_QUEUE_HIGH", 2, int)
+TIER_QUEUE_LOW = _env("TIER_QUEUE_LOW", 0, int)
+TIER_LATENCY_HIGH_MS = _env("TIER_LATENCY_HIGH_MS", 6000.0, float)
+TIER_LATENCY_LOW_MS = _env("TIER_LATENCY_LOW_MS", 3000.0, float)
+TIER_LATENCY_ALPHA = _env("TIER_LATENCY_ALPHA", 0.3, float)
+TIER_MIN_DWELL = _env("TIER_MIN_DWELL", 3, int)
+
+# Frames per YOLO predict call in detect_phones. Between calls a request can
+# be cancelled (see utils/cancel.py) and other requests get a turn at the
+# shared model; on CPU small batches are no slower. 0 runs a clip in one call.
+PHONE_BATCH = _env("PHONE_BATCH", 4, int)
+
+# Threads one clip's sampled frames are split across for feature extraction
+# (contiguous runs, each thread with its own graphs). 1 extracts serially.
+FRAME_SHARDS = _env("FRAME_SHARDS", 1, int)
+
+# How the detectors of a frame run: "sequential" (one after another on the
+# request thread) or "parallel" (face, mesh and hands each on their own
+# thread, overlapping; same features). FRAME_SHARDS > 1 takes precedence.
+DETECTOR_RUNNER = _env("DETECTOR_RUNNER", "sequential")
+
+# Cascade rules skipping detector work that earlier results make unnecessary,
+# comma separated: mesh_needs_face, reuse_similar, phone_gate (see
+# detectors/cascade.py). Empty runs every detector on every frame. Skips are
+# counted in the use_model stats.
+CASCADE = _env("CASCADE", "")
+
+# reuse_similar: max mean absolute difference (0-255 gray levels, on 32x24
+# thumbnails) for a frame to reuse the last processed frame's features
+CASCADE_REUSE_DIFF = _env("CASCADE_REUSE_DIFF", 2.0, float)
+
+# phone_gate: how far (normalized pitch) a frame's head pitch must be from the
+# median of the clip's frames with a face for the head to count as turned
+# away from its usual pose. Absolute pitch depends on where the camera sits: a
+# frontal face reads anywhere from 0.7 to 0.92. Calibrate with
+# `python -m detectors.cascade_test`.
+CASCADE_PITCH_DEVIATION = _env("CASCADE_PITCH_DEVIATION", 0.1, float)
+
+# FRAME_SAMPLER="adaptive": decode ADAPTIVE_OVERSAMPLE x sampleCount evenly
+# spaced candidates, drop those within ADAPTIVE_MIN_DIFF (mean abs gray level
+# on 32x24 thumbnails) of the last kept one, and spend at most sampleCount
+# frames where the clip changes most. Never fewer than ADAPTIVE_MIN_FRAMES.
+ADAPTIVE_OVERSAMPLE = _env("ADAPTIVE_OVERSAMPLE", 3, int)
+ADAPTIVE_MIN_DIFF = _env("ADAPTIVE_MIN_DIFF", 2.0, float)
+ADAPTIVE_MIN_FRAMES = _env("ADAPTIVE_MIN_FRAMES", 3, int)
+
+# Stop a clip early once its warning level is settled: frames are scored
+# coarse to fine (middle of the clip first, then the middles of each half...)
+# and extraction stops when the EARLY_STOP_CONFIDENCE interval of the clip's
+# integrity score lies within one warning level. The first
+# EARLY_STOP_MIN_FRAMES frames always run, then EARLY_STOP_BATCH at a time
+# (at least FRAME_SHARDS, so shards stay busy). EARLY_STOP_MIN_STD is the
+# smallest per-frame spread of integrity scores assumed, so a handful of
+# identical frames can't settle a clip by themselves.
+EARLY_STOP = _env("EARLY_STOP", False, bool)
+EARLY_STOP_CONFIDENCE = _env("EARLY_STOP_CONFIDENCE", 0.95, float)
+EARLY_STOP_MIN_FRAMES = _env("EARLY_STOP_MIN_FRAMES", 4, int)
+EARLY_STOP_BATCH = _env("EARLY_STOP_BATCH", 2, int)
+EARLY_STOP_MIN_STD = _env("EARLY_STOP_MIN_STD", 0.05, float)
+
+# Cache use_model results by clip content, sample count, result settings and
+# model files (see utils/cache.py), so replayed clips skip the pipeline.
+# RESULT_CACHE_ENTRIES results are kept in memory and up to
+# RESULT_CACHE_DISK_MB on disk, under RESULT_CACHE_DIR (default: the temp
+# directory's distract/results). 0 turns a tier off. Entries not read for
+# RESULT_CACHE_MAX_DAYS are dropped when the worker starts (0 keeps them until
+# evicted); each model fingerprint only ever prunes its own entries.
+RESULT_CACHE = _env("RESULT_CACHE", True, bool)
+RESULT_CACHE_ENTRIES = _env("RESULT_CACHE_ENTRIES", 64, int)
+RESULT_CACHE_DISK_MB = _env("RESULT_CACHE_DISK_MB", 64.0, float)
+RESULT_CACHE_DIR = _env("RESULT_CACHE_DIR", "")
+RESULT_CACHE_MAX_DAYS = _env("RESULT_CACHE_MAX_DAYS", 14.0, float)
+
+# Directory use_model appends per-frame features to (one Parquet part file per
+# clip; see utils/feature_store.py), for rescoring with other models or
+# thresholds without running the detectors again. Empty stores nothing.
+# Results served from the result cache add no rows.
+FEATURE_STORE = _env("FEATURE_STORE", "")
+
+# Live sessions (start_live; see utils/live.py): frames sampled per second
+# from the source, seconds of frames per emitted result, and frames the ring
+# buffer holds before the oldest are dropped (when scoring falls behind).
+# start_live can override the first two with sampleFps / windowSeconds.
+LIVE_SAMPLE_FPS = _env("LIVE_SAMPLE_FPS", 4.0, float)
+LIVE_WINDOW_SECONDS = _env("LIVE_WINDOW_SECONDS", 5.0, float)
+LIVE_BUFFER_FRAMES = _env("LIVE_BUFFER_FRAMES", 64, int)
@@ -0,0 +1,78 @@
+from collections import deque
+from statistics import NormalDist
+from typing import List, Optional, Tuple
+import numpy as np
+
+
+def bisection_order(count: int, weights: Optional[List[float]] = None) -> List[int]:
+    """
+    Positions 0..count-1 coarse to fine: the middle first, then the middles of
+    each half, and so on, so any prefix covers the whole timeline. With
+    `weights` (the stretch of the clip each position stands for) the timeline
+    is bisected instead of the positions, so a frame standing for a long
+    stretch comes as early as evenly sampled frames would.
+    """
+    if weights is not None:
+        ends = np.cumsum(weights)
+        slots = int(round(ends[-1])) if count else 0
+        order = []
+        seen = set()
+        for slot in bisection_order(slots):
+            position = min(int(np.searchsorted(ends, slot + 0.5)), count - 1)
+            if position not in seen:
+                seen.add(position)
+                order.append(position)
+        # Positions with (near) zero weight never cover a slot
+        return order + [p for p in range(count) if p not in seen]
+
+    order = []
+    pending = deque([(0, count)])
+    while pending:
+        lo, hi = pending.popleft()
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        order.append(mid)
+        pending.append((lo, mid))
+        pending.append((mid + 1, hi))
+    return order
+
+
+def mean_interval(
+    values,
+    population: int,
+    confidence: float,
+    weights: Optional[List[float]] = None,
+    min_std: float = 0.0,
+) -> Tuple[float, float, float]:
+    """
+    (mean, low, high) for the mean over all `population` frames, estimated
+    from the `values` of the frames processed so far (a sample drawn without
+    replacement). Normal approximation with the finite population correction,
+    so the interval closes once every frame is in. Weighted frames use the
+    weighted mean and Kish's effective sample size. `min_std` floors the
+    spread, so a few identical frames don't close the interval on their own.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if weights is None:
+        mean = float(values.mean())
+        variance = float(values.var(ddof=1)) if n > 1 else float("inf")
+        effective = n
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        mean = float(np.average(values, weights=weights))
+        effective = weights.sum() ** 2 / np.sum(weights**2)
+        variance = (
+            float(np.average((values - mean) ** 2, weights=weights)) * effective / (effective - 1)
+            if effective > 1
+            else float("inf")
+        )
+
+    if n >= population:
+        return mean, mean, mean
+    fpc = (population - n) / (population - 1) if population > 1 else 0.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    variance = max(variance, min_std**2)
+    half_width = z * np.sqrt(variance / effective * fpc)
+    return mean, mean - half_width, mean + half_width
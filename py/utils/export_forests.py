@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+import joblib
+from utils.cache import file_sha256
+from utils.forest import CompiledIsolationForest, CompiledRandomForest
+from utils.model import FEATURE_COLUMNS, MODEL_FILES
+
+# Converts the pickled forests into memory-mappable artifacts next to them.
+# Re-run after retraining; the worker prefers the artifacts over the pickles
+# they were exported from (an artifact of another pickle is ignored):
+#   python -m utils.export_forests [models_dir]
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+
+COMPILERS = {
+    "random_forest": CompiledRandomForest,
+    "isolation_forest": CompiledIsolationForest,
+}
+
+
+def export(models_dir=MODELS_DIR):
+    exported = 0
+    for name, (pickle_name, artifact_name) in MODEL_FILES.items():
+        pickle_path = os.path.join(models_dir, pickle_name)
+        artifact_path = os.path.join(models_dir, artifact_name)
+        if not os.path.exists(pickle_path):
+            print(f"[{name}] skipped, {pickle_path} not found")
+            continue
+
+        start = time.perf_counter()
+        model = joblib.load(pickle_path)
+        forest = COMPILERS[name].from_model(model)
+        forest.save(
+            artifact_path,
+            FEATURE_COLUMNS,
+            source=pickle_name,
+            source_sha256=file_sha256(pickle_path),
+        )
+        exported += 1
+        print(
+            f"[{name}] {pickle_name} ({os.path.getsize(pickle_path) / 1e6:.2f} MB) -> "
+            f"{artifact_name} ({os.path.getsize(artifact_path) / 1e6:.2f} MB) "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    return exported
+
+
+if __name__ == "__main__":
+    export(*sys.argv[1:2])
@@ -0,0 +1,182 @@
+import glob
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import List, Optional
+from utils import config
+
+logger = logging.getLogger(__name__)
+
+# Per-frame features written by use_model when config.FEATURE_STORE is set,
+# so models and thresholds can be tried without decoding or running the
+# detectors again. Every use_model call appends one Parquet part file:
+#   <FEATURE_STORE>/part-<run id>.parquet
+# with one row per frame that was scored:
+#   run_id, clip_id (sha256 of the clip), video_path, sample_count,
+#   frame_index, timestamp (s, null without fps), weight, the FEATURE_COLUMNS,
+#   phone_count, phone_max_confidence, phones (x/y/w/h/confidence list),
+#   integrity_score (what use_model reported for the whole run), recorded_at
+#
+#   python -m utils.feature_store <store dir> [--engine reference]
+# rescores every stored run with the current models (see rescore()).
+
+_PHONE_FIELDS = ("x", "y", "w", "h", "confidence")
+
+
+def _schema():
+    import polars as pl
+    from utils.model import FEATURE_COLUMNS
+
+    return {
+        "run_id": pl.String,
+        "clip_id": pl.String,
+        "video_path": pl.String,
+        "sample_count": pl.Int32,
+        "frame_index": pl.Int64,
+        "timestamp": pl.Float64,
+        "weight": pl.Float64,
+        **{key: pl.Float64 for key in FEATURE_COLUMNS},
+        "phone_count": pl.Int32,
+        "phone_max_confidence": pl.Float64,
+        "phones": pl.List(pl.Struct({field: pl.Float64 for field in _PHONE_FIELDS})),
+        "integrity_score": pl.Float64,
+        "recorded_at": pl.Float64,
+    }
+
+
+def write_run(
+    directory: str,
+    video_path: str,
+    sample_count: int,
+    samples: List[List[float]],
+    frame_indices: List[int],
+    fps: float,
+    weights: Optional[List[float]],
+    phones: List[list],
+    integrity_score: float,
+) -> str:
+    """Append one use_model run (one row per scored frame); returns the part file."""
+    import polars as pl
+    from utils.cache import file_sha256
+    from utils.model import FEATURE_COLUMNS
+
+    run_id = uuid.uuid4().hex
+    count = len(samples)
+    columns = {
+        "run_id": [run_id] * count,
+        "clip_id": [file_sha256(video_path)] * count,
+        "video_path": [os.path.abspath(video_path)] * count,
+        "sample_count": [sample_count] * count,
+        "frame_index": frame_indices,
+        "timestamp": [index / fps if fps > 0 else None for index in frame_indices],
+        "weight": weights if weights is not None else [1.0] * count,
+        **{
+            key: [float(row[i]) for row in samples]
+            for i, key in enumerate(FEATURE_COLUMNS)
+        },
+        "phone_count": [len(detections) for detections in phones],
+        "phone_max_confidence": [
+            max((d["confidence"] for d in detections), default=0.0) for detections in phones
+        ],
+        "phones": [
+            [{field: float(d[field]) for field in _PHONE_FIELDS} for d in detections]
+            for detections in phones
+        ],
+        "integrity_score": [integrity_score] * count,
+        "recorded_at": [time.time()] * count,
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{run_id}.parquet")
+    # Written aside and renamed, so readers never see half a file
+    tmp = f"{path}.tmp"
+    pl.DataFrame(columns, schema=_schema()).write_parquet(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def record_run(video_path, sample_count, samples, frame_indices, fps, weights, phones, scores):
+    """write_run into config.FEATURE_STORE; a failing sink never fails the request."""
+    try:
+        write_run(
+            config.FEATURE_STORE,
+            video_path,
+            sample_count,
+            samples,
+            frame_indices,
+            fps,
+            weights,
+            phones,
+            scores["integrity_score"],
+        )
+    except Exception as e:
+        logger.warning(f"Could not write features of {video_path} to the store: {e}")
+
+
+def load(directory: str):
+    """Every stored row as a polars DataFrame."""
+    import polars as pl
+
+    paths = sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+    if not paths:
+        return pl.DataFrame(schema=_schema())
+    return pl.read_parquet(paths)
+
+
+def rescore(directory: str, engine: Optional[str] = None) -> List[dict]:
+    """
+    extract_scores over every stored run, with the models loaded now.
+    Frames keep their stored weights, so runs are scored as use_model did.
+    """
+    from utils.model import FEATURE_COLUMNS, extract_scores
+
+    runs = []
+    frame = load(directory).sort("recorded_at", "run_id", "frame_index")
+    for (run_id,), rows in frame.group_by("run_id", maintain_order=True):
+        weights = rows["weight"].to_list()
+        scores = extract_scores(
+            rows.select(FEATURE_COLUMNS).to_numpy().tolist(),
+            engine,
+            None if all(w == 1.0 for w in weights) else weights,
+        )
+        runs.append(
+            {
+                "run_id": run_id,
+                "clip_id": rows["clip_id"][0],
+                "video_path": rows["video_path"][0],
+                "frames": rows.height,
+                "stored_integrity_score": rows["integrity_score"][0],
+                "scores": scores,
+            }
+        )
+    return runs
+
+
+def main():
+    args = sys.argv[1:]
+    engine = None
+    if "--engine" in args:
+        i = args.index("--engine")
+        engine = args[i + 1]
+        del args[i : i + 2]
+
+    if not args:
+        print("Usage: python -m utils.feature_store <store dir> [--engine compiled|reference]")
+        return
+
+    start = time.perf_counter()
+    runs = rescore(args[0], engine)
+    for run in runs:
+        scores = run["scores"]
+        print(
+            f"{run['video_path']} ({run['frames']} frames): "
+            f"integrity {scores['integrity_score']:.4f} ({scores['warning_level']}), "
+            f"stored {run['stored_integrity_score']:.4f}"
+        )
+    print(f"{len(runs)} runs rescored in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
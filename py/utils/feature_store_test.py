@@ -0,0 +1,49 @@
+import sys
+import tempfile
+import time
+from utils import config
+from utils.feature_store import load, rescore
+from utils.model import use_model
+
+# Store the features of some clips, then rescore them from the store:
+#   python -m utils.feature_store_test clip1.webm clip2.webm [--samples 20]
+# Rescored integrity must match what use_model returned.
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = 20
+    if "--samples" in args:
+        i = args.index("--samples")
+        sample_count = int(args[i + 1])
+        del args[i : i + 2]
+
+    if not args:
+        print("Usage: python -m utils.feature_store_test <video> [<video> ...]")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.FEATURE_STORE = directory
+        config.RESULT_CACHE = False
+
+        start = time.perf_counter()
+        reported = {}
+        for path in args:
+            reported[path] = use_model(path, sample_count)["scores"]["integrity_score"]
+        pipeline_ms = (time.perf_counter() - start) * 1000
+
+        rows = load(directory)
+        print(f"stored {rows.height} rows, {rows.width} columns")
+
+        start = time.perf_counter()
+        runs = rescore(directory)
+        rescore_ms = (time.perf_counter() - start) * 1000
+
+        for run in runs:
+            diff = abs(run["scores"]["integrity_score"] - run["stored_integrity_score"])
+            print(f"{run['video_path']}: {run['frames']} frames, |rescored - reported| {diff:.2e}")
+        print(f"pipeline {pipeline_ms:.0f} ms, rescore {rescore_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+import json
+import struct
+import numpy as np
+
+# sklearn compares features as float32 against float64 thresholds
+_X_DTYPE = np.float32
+
+# Forest artifact layout: magic, format version (uint32), header length (uint32),
+# JSON header, then the arrays. The data section starts at the first 64-byte
+# boundary after the header and every array offset (relative to it) is aligned too.
+ARTIFACT_MAGIC = b"DSTFRST\0"
+ARTIFACT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def save_artifact(path, kind, arrays, scalars, feature_columns, meta=None):
+    """Write named arrays plus a JSON header (kind, scalars, feature columns)."""
+    arrays = {name: np.ascontiguousarray(a) for name, a in arrays.items()}
+    layout, offset = {}, 0
+    for name, a in arrays.items():
+        layout[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset = _aligned(offset + a.nbytes)
+
+    header = json.dumps(
+        {
+            "kind": kind,
+            "feature_columns": list(feature_columns),
+            "scalars": scalars,
+            "arrays": layout,
+            "meta": meta or {},
+        }
+    ).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header))
+
+    with open(path, "wb") as f:
+        f.write(_PREAMBLE.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION, len(header)))
+        f.write(header)
+        for name, a in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(a.tobytes())
+
+
+def load_artifact(path):
+    """
+    Memory-map an artifact written by save_artifact.
+    Returns (header, arrays); arrays are read-only views into the mapped file,
+    so pages are only read in when a scorer touches them.
+    """
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, version, header_len = _PREAMBLE.unpack(bytes(mapped[: _PREAMBLE.size]))
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError(f"Not a forest artifact: {path}")
+    if version != ARTIFACT_VERSION:
+        raise ValueError(
+            f"Unsupported forest artifact version {version} (expected {ARTIFACT_VERSION}): {path}"
+        )
+
+    header_end = _PREAMBLE.size + header_len
+    header = json.loads(bytes(mapped[_PREAMBLE.size : header_end]).decode("utf-8"))
+    data_start = _aligned(header_end)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            mapped, dtype=dtype, count=count, offset=data_start + spec["offset"]
+        ).reshape(spec["shape"])
+    return header, arrays
+
+
+def _flatten_tree(tree, offset, feature_map=None):
+    """Node arrays of one sklearn tree with global indices; leaves loop onto themselves."""
+    n_nodes = tree.node_count
+    is_leaf = tree.children_left == -1
+    own = np.arange(n_nodes)
+
+    feature = np.where(is_leaf, 0, tree.feature)
+    if feature_map is not None:
+        # Tree trained on a feature subset: map back to input columns
+        feature = np.where(is_leaf, 0, np.asarray(feature_map)[feature])
+
+    return {
+        "feature": feature,
+        "threshold": np.where(is_leaf, np.inf, tree.threshold),
+        "left": np.where(is_leaf, own, tree.children_left) + offset,
+        "right": np.where(is_leaf, own, tree.children_right) + offset,
+    }
+
+
+class _FlatForest:
+    """
+    Trees of a fitted sklearn ensemble flattened into per-node arrays.
+
+    Every tree's nodes live in one set of arrays (feature, threshold, left,
+    right) with global child indices and leaves pointing at themselves, so
+    all trees are walked for all samples at once, one level per step.
+    """
+
+    # Constructor arguments stored in an artifact, as arrays and as JSON scalars
+    _ARRAYS = ("feature", "threshold", "left", "right", "roots")
+    _SCALARS = ("max_depth",)
+
+    def __init__(self, feature, threshold, left, right, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @staticmethod
+    def _concat(flat_trees):
+        # Node indices fit in int32, which halves the index arrays
+        return {
+            key: np.concatenate([t[key] for t in flat_trees]).astype(
+                np.float64 if key == "threshold" else np.int32
+            )
+            for key in ("feature", "threshold", "left", "right")
+        }
+
+    def save(self, path, feature_columns, **meta):
+        """Write the forest as a memory-mappable artifact (see save_artifact)."""
+        save_artifact(
+            path,
+            kind=type(self).__name__,
+            arrays={name: getattr(self, name) for name in self._ARRAYS},
+            scalars={name: getattr(self, name) for name in self._SCALARS},
+            feature_columns=feature_columns,
+            meta=meta,
+        )
+
+    @classmethod
+    def load(cls, path, feature_columns=None, source_sha256=None):
+        """
+        Memory-map a forest saved with save(). Raises ValueError if the file is
+        another kind of forest, was exported for different feature columns, or
+        (given the sha256 of the model it should come from) from another model.
+        """
+        header, arrays = load_artifact(path)
+        if header["kind"] != cls.__name__:
+            raise ValueError(f"{path} holds a {header['kind']}, not a {cls.__name__}")
+        if feature_columns is not None and header["feature_columns"] != list(
+            feature_columns
+        ):
+            raise ValueError(f"{path} was exported for different feature columns")
+        if source_sha256 is not None and header["meta"].get("source_sha256") != source_sha256:
+            raise ValueError(
+                f"{path} was exported from another {header['meta'].get('source', 'model')}"
+            )
+        return cls(**arrays, **header["scalars"])
+
+    def _walk(self, X, record_path=False):
+        """
+        Leaf index per (tree, sample). With record_path, also the visited nodes
+        (D + 1, T, S) and the split feature used at each step (D, T, S).
+        """
+        n_samples, n_features = X.shape
+        flat_x = X.ravel()
+        row_offset = (np.arange(n_samples) * n_features)[None, :]
+        node = np.repeat(self.roots[:, None], n_samples, axis=1)  # (T, S)
+        path, split_features = [], []
+        for _ in range(self.max_depth):
+            feature = self.feature[node]
+            go_left = flat_x[row_offset + feature] <= self.threshold[node]
+            if record_path:
+                path.append(node)
+                split_features.append(feature)
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        if not record_path:
+            return node
+        path.append(node)
+        return node, np.stack(path), np.stack(split_features)
+
+
+class CompiledRandomForest(_FlatForest):
+    """
+    A fitted RandomForestClassifier as flat arrays. Node values are normalized
+    the same way treeinterpreter does, and `delta` holds each node's value
+    minus its parent's, so one walk yields predictions and per-feature
+    contributions together.
+    """
+
+    _ARRAYS = _FlatForest._ARRAYS + ("value", "delta")
+
+    def __init__(self, feature, threshold, left, right, value, delta, roots, max_depth):
+        super().__init__(feature, threshold, left, right, roots, max_depth)
+        self.value = value
+        self.delta = delta
+        # Constant for every sample: mean root value over trees
+        self.bias = np.mean(value[roots], axis=0)
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledRandomForest":
+        flat_trees, values, deltas, roots = [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(n_nodes)
+
+            # Same normalization as treeinterpreter (class counts -> probabilities)
+            value = tree.value.squeeze(axis=1).astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+
+            parent = np.zeros(n_nodes, dtype=np.int64)
+            parent[tree.children_left[~is_leaf]] = own[~is_leaf]
+            parent[tree.children_right[~is_leaf]] = own[~is_leaf]
+
+            flat_trees.append(_flatten_tree(tree, offset))
+            values.append(value)
+            deltas.append(value - value[parent])  # root: zero
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            **cls._concat(flat_trees),
+            value=np.concatenate(values),
+            delta=np.concatenate(deltas),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max_depth,
+        )
+
+    def predict(self, X):
+        """
+        Returns (prediction, bias, contributions) like treeinterpreter.predict:
+        shapes (S, C), (S, C) and (S, F, C) for S samples, F features, C classes.
+        Matches treeinterpreter up to float rounding (~1e-16).
+        """
+        X = np.asarray(X, dtype=_X_DTYPE).astype(np.float64)
+        n_samples, n_features = X.shape
+        n_trees, n_classes = len(self.roots), self.value.shape[1]
+
+        leaves, path, split_features = self._walk(X, record_path=True)
+
+        # Each step credits child value - parent value to the parent's split feature;
+        # steps taken after reaching a leaf (self loops) credit nothing
+        moved = path[1:] != path[:-1]
+        delta = self.delta[path[1:]] * moved[..., None]  # (D, T, S, C)
+        row_offset = (np.arange(n_samples) * n_features)[None, :]
+        slots = (row_offset + split_features).ravel()
+
+        contributions = np.empty((n_samples * n_features, n_classes))
+        for c in range(n_classes):
+            contributions[:, c] = np.bincount(
+                slots, weights=delta[..., c].ravel(), minlength=n_samples * n_features
+            )
+        contributions = contributions.reshape(n_samples, n_features, n_classes) / n_trees
+
+        prediction = np.mean(self.value[leaves], axis=0)
+        bias = np.broadcast_to(self.bias, (n_samples, n_classes))
+        return prediction, bias, contributions
+
+
+def _average_path_length(n_samples_leaf):
+    """Average path length of an unsuccessful BST search (sklearn's c(n))."""
+    n = np.asarray(n_samples_leaf, dtype=np.float64)
+    result = np.zeros_like(n)
+    result[n == 2] = 1.0
+    rest = n > 2
+    result[rest] = 2.0 * (np.log(n[rest] - 1.0) + np.euler_gamma) - 2.0 * (
+        n[rest] - 1.0
+    ) / n[rest]
+    return result
+
+
+class CompiledIsolationForest(_FlatForest):
+    """
+    A fitted IsolationForest as flat arrays. Each node stores the path length
+    sklearn credits a sample ending there (its depth plus c(n_node_samples),
+    minus one), so scoring is one walk, a gather and a sum over trees.
+    """
+
+    _ARRAYS = _FlatForest._ARRAYS + ("path_length",)
+    _SCALARS = _FlatForest._SCALARS + ("denominator", "offset")
+
+    def __init__(
+        self, feature, threshold, left, right, path_length, roots, max_depth, denominator, offset
+    ):
+        super().__init__(feature, threshold, left, right, roots, max_depth)
+        self.path_length = path_length
+        self.denominator = float(denominator)
+        self.offset = float(offset)
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledIsolationForest":
+        flat_trees, path_lengths, roots = [], [], []
+        node_offset, max_depth = 0, 0
+        for tree_idx, (estimator, features) in enumerate(
+            zip(model.estimators_, model.estimators_features_)
+        ):
+            tree = estimator.tree_
+            flat_trees.append(_flatten_tree(tree, node_offset, feature_map=features))
+            path_lengths.append(
+                model._decision_path_lengths[tree_idx]
+                + model._average_path_length_per_tree[tree_idx]
+                - 1.0
+            )
+            roots.append(node_offset)
+            node_offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            **cls._concat(flat_trees),
+            path_length=np.concatenate(path_lengths).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max_depth,
+            denominator=len(model.estimators_)
+            * _average_path_length([model._max_samples])[0],
+            offset=model.offset_,
+        )
+
+    def score_samples(self, X):
+        """Same as IsolationForest.score_samples (lower is more abnormal)."""
+        X = np.asarray(X, dtype=_X_DTYPE).astype(np.float64)
+        depths = np.sum(self.path_length[self._walk(X)], axis=0)
+        if self.denominator == 0:
+            # For a single training sample, denominator and depth are 0
+            return -np.ones_like(depths)
+        return -(2 ** (-depths / self.denominator))
+
+    def decision_function(self, X):
+        """Same as IsolationForest.decision_function (negative = outlier)."""
+        return self.score_samples(X) - self.offset
@@ -0,0 +1,48 @@
+import threading
+import time
+from functools import wraps
+
+# Load time (ms) of every lazily loaded component, by name, in load order.
+# Per-thread components keep the time of their latest load.
+LOAD_TIMES = {}
+
+
+def lazy_loader(name: str, per_thread: bool = False):
+    """
+    Turn a zero-argument loader into a getter that loads on first call and
+    returns the same object afterwards. Safe to call from several threads:
+    concurrent first calls wait for a single load. With per_thread, every
+    thread gets (and keeps) its own instance instead, for objects that can't
+    be shared, like MediaPipe graphs. Records the load time under `name` in
+    LOAD_TIMES.
+    """
+
+    def decorator(load):
+        lock = threading.Lock()
+        loaded = []
+        local = threading.local()
+
+        def timed_load():
+            start = time.perf_counter()
+            value = load()
+            LOAD_TIMES[name] = (time.perf_counter() - start) * 1000
+            return value
+
+        @wraps(load)
+        def get():
+            if per_thread:
+                if not hasattr(local, "value"):
+                    local.value = timed_load()
+                return local.value
+
+            if loaded:
+                return loaded[0]
+            with lock:
+                if not loaded:
+                    loaded.append(timed_load())
+            return loaded[0]
+
+        get.is_loaded = lambda: hasattr(local, "value") if per_thread else bool(loaded)
+        return get
+
+    return decorator
@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+import cv2
+import numpy as np
+from utils import config
+from utils.model import score_frames, warm_up
+
+logger = logging.getLogger(__name__)
+
+# Live sessions score frames as they are captured instead of recorded clips:
+# a capture thread samples the source at `sampleFps` into a bounded ring
+# buffer, and a scoring thread turns every `windowSeconds` of buffered frames
+# into a use_model result, emitted as
+#   {"type": "live_result", "sessionId", "windowStart", "windowEnd", "value"}
+# (capture times of the window's first and last frames, epoch ms). Sources:
+#   {"device": 0}                                      local capture device
+#   {"pipe": "/path/to/fifo", "width": w, "height": h} raw bgr24 frames, e.g.
+#       ffmpeg ... -f rawvideo -pix_fmt bgr24 /path/to/fifo
+# A session ends on stop_live or when its source ends ("live_stopped").
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class LiveSession:
+    def __init__(self, source, emit, sample_fps, window_seconds, buffer_frames):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self._emit = emit
+        self.sample_interval = 1.0 / sample_fps
+        self.window_seconds = window_seconds
+        self._buffer = deque(maxlen=max(1, buffer_frames))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._read = None
+        self._close = None
+        self.counters = {"windows": 0, "frames_captured": 0, "frames_dropped": 0}
+        self._window_dropped = 0
+
+    def start(self):
+        """Opens the source (raising if it can't) and starts capturing and scoring."""
+        if "device" in self.source:
+            self._open_device(int(self.source["device"]))
+        elif "pipe" in self.source:
+            if "width" not in self.source or "height" not in self.source:
+                raise ValueError("pipe sources need the frame width and height")
+            self._open_pipe(self.source["pipe"], self.source["width"], self.source["height"])
+        else:
+            raise ValueError("live source needs a device or a pipe")
+
+        # The scoring thread starts capturing once its graphs are warm
+        self._start_thread(self._score, "score")
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=f"live-{name}-{self.id[:8]}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _open_device(self, index):
+        cap = cv2.VideoCapture(index)
+        if not cap.isOpened():
+            raise RuntimeError(f"Could not open capture device {index}")
+
+        def read(sample):
+            # grab() every frame so the device queue stays current; decode only samples
+            if not cap.grab():
+                return None
+            if not sample:
+                return False
+            ret, frame = cap.retrieve()
+            return frame if ret else False
+
+        self._read = read
+        self._close = cap.release
+
+    def _open_pipe(self, path, width, height):
+        if not os.path.exists(path):
+            raise RuntimeError(f"No such pipe: {path}")
+        frame_bytes = width * height * 3
+        pipe = None
+
+        def read(sample):
+            nonlocal pipe
+            if pipe is None:
+                # Opening a FIFO blocks until the producer opens it, so it
+                # happens here on the capture thread
+                pipe = open(path, "rb", buffering=0)
+            data = bytearray(frame_bytes)
+            view = memoryview(data)
+            filled = 0
+            while filled < frame_bytes:
+                n = pipe.readinto(view[filled:])
+                if not n:
+                    return None
+                filled += n
+            if not sample:
+                return False
+            return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+
+        def close():
+            if pipe is not None:
+                pipe.close()
+
+        self._read = read
+        self._close = close
+
+    def _capture(self):
+        next_sample = time.time()
+        try:
+            while not self._stop.is_set():
+                now = time.time()
+                frame = self._read(now >= next_sample)
+                if frame is None:
+                    break
+                if frame is False:
+                    continue
+                next_sample = max(next_sample + self.sample_interval, now)
+                with self._lock:
+                    if len(self._buffer) == self._buffer.maxlen:
+                        self.counters["frames_dropped"] += 1
+                        self._window_dropped += 1
+                    self._buffer.append((now, frame))
+                    self.counters["frames_captured"] += 1
+        except Exception as e:
+            logger.exception("Live capture failed")
+            self._emit({"type": "error", "sessionId": self.id, "data": f"live capture failed: {e}"})
+        finally:
+            self._close()
+            # Score what is left, then end the session
+            self._stop.set()
+
+    def _drain(self):
+        with self._lock:
+            frames = list(self._buffer)
+            self._buffer.clear()
+            dropped, self._window_dropped = self._window_dropped, 0
+        return frames, dropped
+
+    def _score(self):
+        try:
+            if config.WARM_UP:
+                # This thread's own detector graphs
+                warm_up()
+            self._start_thread(self._capture, "capture")
+        except Exception as e:
+            logger.exception("Live session failed to start")
+            self._emit(
+                {"type": "error", "sessionId": self.id, "data": f"live session failed to start: {e}"}
+            )
+            # No capture thread to close the source
+            self._close()
+            self._stop.set()
+
+        try:
+            if not self._stop.is_set():
+                self._score_windows()
+        finally:
+            # Whatever happened, the session ends and its id is released
+            with _sessions_lock:
+                _sessions.pop(self.id, None)
+            self._emit({"type": "live_stopped", "sessionId": self.id, "data": dict(self.counters)})
+
+    def _score_windows(self):
+        window_end = time.time()
+        while True:
+            window_end += self.window_seconds
+            stopped = self._stop.wait(max(0.0, window_end - time.time()))
+            captured, dropped = self._drain()
+            if captured:
+                self._emit_window(captured, dropped)
+            if stopped:
+                break
+
+    def _emit_window(self, captured, dropped):
+        start = time.perf_counter()
+        try:
+            result, _ = score_frames([frame for _, frame in captured])
+        except Exception as e:
+            logger.exception("Live scoring failed")
+            self._emit({"type": "error", "sessionId": self.id, "data": str(e)})
+            return
+        result["stats"] = {
+            "backend": "live",
+            "sampler": "live",
+            "frames_decoded": len(captured),
+            "frames_candidates": len(captured) + dropped,
+            "decode_ms": 0.0,
+            **result["stats"],
+            "frames_dropped": dropped,
+            "score_ms": (time.perf_counter() - start) * 1000,
+        }
+        self.counters["windows"] += 1
+        self._emit(
+            {
+                "type": "live_result",
+                "sessionId": self.id,
+                # Capture times of the window's first and last frames
+                "windowStart": captured[0][0] * 1000,
+                "windowEnd": captured[-1][0] * 1000,
+                "value": result,
+            }
+        )
+
+    def stop(self):
+        """Ask the session to end; its last (partial) window and live_stopped follow."""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        # Only the scoring thread: the capture thread can sit in a read on a
+        # stalled pipe (it's a daemon)
+        self._threads[0].join(timeout)
+
+
+def start_live(msg, emit) -> str:
+    session = LiveSession(
+        msg["source"],
+        emit,
+        float(msg.get("sampleFps") or config.LIVE_SAMPLE_FPS),
+        float(msg.get("windowSeconds") or config.LIVE_WINDOW_SECONDS),
+        config.LIVE_BUFFER_FRAMES,
+    )
+    # Registered first: a source that ends right away unregisters its session
+    with _sessions_lock:
+        _sessions[session.id] = session
+    try:
+        session.start()
+    except Exception:
+        with _sessions_lock:
+            _sessions.pop(session.id, None)
+        raise
+    return session.id
+
+
+def stop_live(session_id):
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    if session is None:
+        raise ValueError(f"Unknown live session: {session_id}")
+    session.stop()
+
+
+def stop_all(timeout=None):
+    """Stop every session and wait for their last windows (used at shutdown)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        session.stop()
+    for session in sessions:
+        session.join(timeout)
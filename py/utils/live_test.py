@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import cv2
+from utils.live import start_live, stop_all
+from utils.model import use_model
+
+# Replay a clip into a live session through a FIFO (POSIX), in real time:
+#   python -m utils.live_test clip.webm [--fps 4] [--window 2] [--loops 1]
+# Prints every window's result, then use_model on the same clip for comparison.
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def _produce(path, fifo, loops):
+    with open(fifo, "wb") as out:
+        next_frame = time.perf_counter()
+        for _ in range(loops):
+            cap = cv2.VideoCapture(path)
+            interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                time.sleep(max(0.0, next_frame - time.perf_counter()))
+                next_frame += interval
+                out.write(frame.tobytes())
+            cap.release()
+
+
+def main():
+    args = sys.argv[1:]
+    sample_fps = float(_pop_option(args, "--fps", 4))
+    window = float(_pop_option(args, "--window", 2))
+    loops = int(_pop_option(args, "--loops", 1))
+    if not args:
+        print("Usage: python -m utils.live_test <video>")
+        return
+    path = args[0]
+
+    cap = cv2.VideoCapture(path)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    done = threading.Event()
+    sampled = []
+
+    def emit(msg):
+        if msg["type"] == "live_result":
+            stats = msg["value"]["stats"]
+            scores = msg["value"]["scores"]
+            sampled.append(stats["frames_decoded"])
+            lag = time.time() * 1000 - msg["windowEnd"]
+            print(
+                f"window {(msg['windowEnd'] - msg['windowStart']) / 1000:.1f}s: "
+                f"integrity {scores['integrity_score']:.4f} ({scores['warning_level']}), "
+                f"{stats['frames_decoded']} frames, {stats['frames_dropped']} dropped, "
+                f"scored in {stats['score_ms']:.0f} ms (emitted {lag:.0f} ms after the window)"
+            )
+        else:
+            print(msg)
+            if msg["type"] == "live_stopped":
+                done.set()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fifo = os.path.join(directory, "frames")
+        os.mkfifo(fifo)
+        start_live(
+            {
+                "source": {"pipe": fifo, "width": width, "height": height},
+                "sampleFps": sample_fps,
+                "windowSeconds": window,
+            },
+            emit,
+        )
+        _produce(path, fifo, loops)
+        done.wait()
+        stop_all()
+
+    samples = max(1, sum(sampled) // loops)
+    result = use_model(path, samples)
+    print(
+        f"use_model ({samples} samples of {frame_count} frames): "
+        f"integrity {result['scores']['integrity_score']:.4f} "
+        f"({result['scores']['warning_level']}), decode {result['stats']['decode_ms']:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,100 @@
 from typing import List, Optional
-import cv2
-import joblib
-import pandas as pd
-from detectors.main import extract_features_from_image
-from detectors.phone import detect_phone
+import logging
+import time
+import numpy as np
+from detectors.cascade import parse_rules, phone_candidates
+from detectors.main import extract_features_from_images, warm_up_shards
+from detectors.hand import detect_hands
+from detectors.phone import detect_phones
+from utils.cache import file_sha256
+from utils.early_stop import bisection_order, mean_interval
 from utils.enum import WarningLevel
+from utils.feature_store import record_run
+from utils.forest import CompiledIsolationForest, CompiledRandomForest
+from utils.lazy import LOAD_TIMES, lazy_loader
+from utils.video import extract_frames_from_video, parse_size, sample_frames
+from utils import cancel, config, tiers
 import random
-from treeinterpreter import treeinterpreter as ti
 import os
 import sys
 
+logger = logging.getLogger(__name__)
+
+
+# Repository root (py/..): resources resolve from here rather than from the
+# working directory, so scripts like batch.py run from anywhere
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
 
 def resource_path(relative_path: str) -> str:
     if hasattr(sys, "_MEIPASS"):
         return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.abspath(relative_path)
+    return os.path.join(_ROOT, relative_path)
+
+
+# Pickled sklearn model and its memory-mappable artifact (utils/export_forests.py)
+MODEL_FILES = {
+    "random_forest": ("random_forest_model.pkl", "random_forest_model.forest"),
+    "isolation_forest": ("isolation_forest_model.pkl", "isolation_forest_model.forest"),
+}
+
+
+def _model_path(name: str, artifact: bool = False) -> str:
+    return resource_path(os.path.join("py", "models", MODEL_FILES[name][1 if artifact else 0]))
+
+
+def _load_compiled(name: str, compiled_cls, load_model):
+    """
+    Map the exported artifact when there is one; otherwise (or if it doesn't
+    match FEATURE_COLUMNS, or was exported from another pickle than the one
+    next to it, i.e. the model was retrained since) compile the pickled model.
+    """
+    path = _model_path(name, artifact=True)
+    if config.MODEL_ARTIFACTS and os.path.exists(path):
+        pickle_path = _model_path(name)
+        try:
+            # Without the pickle the artifact is all there is
+            source_sha256 = file_sha256(pickle_path) if os.path.exists(pickle_path) else None
+            return compiled_cls.load(path, FEATURE_COLUMNS, source_sha256)
+        except Exception as e:
+            logger.warning(
+                f"Ignoring {path}, compiling the pickle instead "
+                f"(re-run python -m utils.export_forests): {e}"
+            )
+    return compiled_cls.from_model(load_model())
+
+
+# Models are loaded on first use (or by warm_up) so the worker starts fast
+@lazy_loader("random_forest")
+def get_random_forest_model():
+    import joblib
+
+    return joblib.load(_model_path("random_forest"))
+
+
+@lazy_loader("isolation_forest")
+def get_isolation_forest_model():
+    import joblib
+
+    return joblib.load(_model_path("isolation_forest"))
+
 
+# Flattened once so scoring doesn't go through pandas/sklearn per request
+@lazy_loader("random_forest_compiled")
+def get_compiled_random_forest():
+    return _load_compiled(
+        "random_forest", CompiledRandomForest, get_random_forest_model
+    )
 
-# Load models
-random_forest_model = joblib.load(resource_path("py/models/random_forest_model.pkl"))
-isolation_forest_model = joblib.load(
-    resource_path("py/models/isolation_forest_model.pkl")
-)
+
+@lazy_loader("isolation_forest_compiled")
+def get_compiled_isolation_forest():
+    return _load_compiled(
+        "isolation_forest", CompiledIsolationForest, get_isolation_forest_model
+    )
+
+
+SCORING_ENGINES = ("compiled", "reference")
 
 FEATURE_COLUMNS = [
     "face_x",
@@ -44,31 +117,110 @@ FEATURE_COLUMNS = [
 ]
 
 
-def rf_predict(data: List[List[float]]) -> dict:
+# Share of each model in the integrity score
+RF_WEIGHT = 0.7
+IF_WEIGHT = 0.3
+
+
+def _mean(values, weights=None, axis=None):
+    """Plain mean, or weighted by how much of the clip each sample stands for."""
+    if weights is None:
+        return np.mean(values, axis=axis)
+    return np.average(values, axis=axis, weights=weights)
+
+
+def _check_engine(engine: Optional[str]) -> str:
+    engine = engine or config.SCORING_ENGINE
+    if engine not in SCORING_ENGINES:
+        raise ValueError(f"Unknown scoring engine: {engine}")
+    return engine
+
+
+def _rf_outputs(data, engine):
+    """(prediction, bias, contributions) per row, like treeinterpreter.predict."""
+    if engine == "compiled":
+        return get_compiled_random_forest().predict(data)
+
+    # treeinterpreter over the sklearn model, kept for verification
+    import pandas as pd
+    from treeinterpreter import treeinterpreter as ti
+
+    df = pd.DataFrame(data, columns=FEATURE_COLUMNS)
+    return ti.predict(get_random_forest_model(), df.values)
+
+
+def _if_scores(data, engine) -> list:
+    """IsolationForest decision_function per row."""
+    if engine == "compiled":
+        return get_compiled_isolation_forest().decision_function(data).tolist()
+
+    # sklearn's own decision_function, kept for verification
+    import pandas as pd
+
+    df = pd.DataFrame(data, columns=FEATURE_COLUMNS)
+    return get_isolation_forest_model().decision_function(df).tolist()
+
+
+def rf_predict(
+    data: List[List[float]],
+    engine: Optional[str] = None,
+    weights: Optional[List[float]] = None,
+) -> dict:
+    engine = _check_engine(engine)
+
     if not data:
         return {"score": 0, "feature_impacts": {}}
 
-    df = pd.DataFrame(data, columns=FEATURE_COLUMNS)
-    pred, bias, contribs = ti.predict(random_forest_model, df.values)
+    pred, bias, contribs = _rf_outputs(data, engine)
+
     scores = pred[:, 0].tolist()
     contribs_class0 = contribs[:, :, 0]
-    mean_impacts = [float(score) for score in contribs_class0.mean(axis=0)]
+    mean_impacts = [float(score) for score in _mean(contribs_class0, weights, axis=0)]
     avg_feature_impact = dict(zip(FEATURE_COLUMNS, mean_impacts))
 
+    if weights is not None:
+        score = float(_mean(scores, weights))
+    else:
+        score = sum(scores) / len(scores) if scores else 0
+
     return {
-        "score": sum(scores) / len(scores) if scores else 0,
+        "score": score,
         "feature_impacts": avg_feature_impact,
     }
 
 
-def if_predict(data: List[List[int]]) -> dict:
-    df = pd.DataFrame(data, columns=FEATURE_COLUMNS)
-    scores = isolation_forest_model.decision_function(df).tolist()
+def if_predict(
+    data: List[List[int]],
+    engine: Optional[str] = None,
+    weights: Optional[List[float]] = None,
+) -> dict:
+    engine = _check_engine(engine)
+
+    if not data:
+        return {"score": 0}
+
+    scores = _if_scores(data, engine)
+    if weights is not None:
+        return {"score": float(_mean(scores, weights))}
     return {
         "score": sum(scores) / len(scores) if scores else 0,
     }
 
 
+def frame_integrity_scores(
+    samples: List[List[float]], engine: Optional[str] = None
+) -> np.ndarray:
+    """
+    Integrity score of every row on its own. extract_scores' clip integrity is
+    their (weighted) mean, since both models are averaged over rows.
+    """
+    engine = _check_engine(engine)
+    if not samples:
+        return np.zeros(0)
+    pred, _, _ = _rf_outputs(samples, engine)
+    return pred[:, 0] * RF_WEIGHT + np.asarray(_if_scores(samples, engine)) * IF_WEIGHT
+
+
 def classify_score_to_warning_level(integrity_score: float) -> WarningLevel:
     if integrity_score >= 0.6:
         return WarningLevel.NONE.value
@@ -79,12 +231,21 @@ def classify_score_to_warning_level(integrity_score: float) -> WarningLevel:
     return WarningLevel.SEVERE.value
 
 
-def extract_scores(samples: List[List[int]]) -> dict:
+def extract_scores(
+    samples: List[List[int]],
+    engine: Optional[str] = None,
+    weights: Optional[List[float]] = None,
+) -> dict:
+    """
+    Clip scores from per-frame feature rows. `weights` (one per row) make the
+    averages weighted, for samplers whose frames stand for uneven parts of
+    the clip.
+    """
     # Run predictions concurrently in threads
-    if_pred = if_predict(samples)
-    rf_pred = rf_predict(samples)
+    if_pred = if_predict(samples, engine, weights)
+    rf_pred = rf_predict(samples, engine, weights)
 
-    integrity_score = (rf_pred["score"] * 0.7) + (if_pred["score"] * 0.3)
+    integrity_score = (rf_pred["score"] * RF_WEIGHT) + (if_pred["score"] * IF_WEIGHT)
 
     return {
         "integrity_score": integrity_score,
@@ -95,56 +256,195 @@ def extract_scores(samples: List[List[int]]) -> dict:
     }
 
 
-def extract_frames_from_video(video_path: str, sample_count: int) -> list:
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Failed to open video: {video_path}")
-
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    if total_frames == 0:
-        cap.release()
-        return []
-
-    actual_sample_count = min(sample_count, total_frames)
-    # Compute evenly spaced frame indices
-    indices = [
-        int(i * total_frames / actual_sample_count) for i in range(actual_sample_count)
-    ]
-
-    frames = []
-    for idx in indices:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
-        ret, frame = cap.read()
-        if ret and frame is not None:
-            frames.append(frame)
-        else:
-            # If seeking fails, try reading the next frame
-            continue
-
-    cap.release()
-    return frames
-
-
-def use_model(video_path: str, sample_count: int):
+def _extract_until_settled(frames, weights, rules, stats, detectors):
+    """
+    Extract features coarse to fine (see config.EARLY_STOP) until the clip's
+    warning level is settled. Returns the positions used, in clip order, and
+    their features.
+    """
+    order = bisection_order(len(frames), weights)
+    batch = max(config.EARLY_STOP_BATCH, config.FRAME_SHARDS, 1)
+    features_at = {}
+    frame_scores = []
+    done = 0
+    while done < len(order):
+        positions = order[done : done + (batch if done else config.EARLY_STOP_MIN_FRAMES)]
+        batch_stats = {}
+        features_list = extract_features_from_images(
+            [frames[p] for p in positions], rules=rules, stats=batch_stats, **detectors
+        )
+        for key, value in batch_stats.items():
+            stats[key] = stats.get(key, 0) + value
+        features_at.update(zip(positions, features_list))
+        frame_scores.extend(
+            frame_integrity_scores(
+                [[features.get(key, 0) for key in FEATURE_COLUMNS] for features in features_list]
+            )
+        )
+        done += len(positions)
+
+        _, low, high = mean_interval(
+            frame_scores,
+            len(frames),
+            config.EARLY_STOP_CONFIDENCE,
+            [weights[p] for p in order[:done]] if weights is not None else None,
+            min_std=config.EARLY_STOP_MIN_STD,
+        )
+        if classify_score_to_warning_level(low) == classify_score_to_warning_level(high):
+            break
+
+    used = sorted(order[:done])
+    return used, [features_at[p] for p in used]
+
+
+def score_frames(frames: list, weights: Optional[List[float]] = None, tier: str = "full"):
+    """
+    Score decoded (BGR) frames the way use_model scores a clip's samples, with
+    the detectors of quality `tier` (see utils/tiers.py).
+    Returns the use_model result, whose stats only cover what happens after
+    decoding, and the frames actually used (fewer with EARLY_STOP):
+        positions: their positions in `frames`
+        samples: their FEATURE_COLUMNS rows
+        weights: their weights (None when unweighted)
+        phones: their phone detections
+    """
     samples: List[List[int]] = []
 
-    frames = extract_frames_from_video(video_path, sample_count)
-
-    for img in frames:
-        if img is None:
-            continue
-        img_for_phone_detection = img
-        features = extract_features_from_image(img)
+    settings = tiers.settings(tier)
+    detectors = {
+        "face_mesh": settings["face_mesh"],
+        "hand_complexity": settings["hand_complexity"],
+    }
+    rules = parse_rules(config.CASCADE)
+    cascade_stats = {}
+    frame_count = len(frames)
+    positions = list(range(frame_count))
+
+    if config.EARLY_STOP and frame_count > config.EARLY_STOP_MIN_FRAMES:
+        positions, features_list = _extract_until_settled(
+            frames, weights, rules, cascade_stats, detectors
+        )
+        frames = [frames[p] for p in positions]
+        if weights is not None:
+            weights = [weights[p] for p in positions]
+    else:
+        features_list = extract_features_from_images(
+            frames, rules=rules, stats=cascade_stats, **detectors
+        )
+    for features in features_list:
         model_input = [features.get(key, 0) for key in FEATURE_COLUMNS]
         samples.append(model_input)
 
+    # One batched YOLO pass covers every sampled frame, not just the last one
+    # (only the plausible ones with the phone_gate rule)
+    phone_mask = phone_candidates(features_list) if "phone_gate" in rules else None
+    phones = detect_phones(frames, mask=phone_mask, imgsz=settings["phone_imgsz"])
+    cascade_stats["phone_skipped"] = (
+        phone_mask.count(False) if phone_mask is not None else 0
+    )
+
+    result = {
+        "scores": extract_scores(samples, weights=weights),
+        "isPhonePresent": phones["summary"]["present"],
+        "phone": phones["summary"],
+        "stats": {
+            # Frames scored (fewer than decoded when EARLY_STOP settles early)
+            "frames_used": len(frames),
+            "early_stopped": len(frames) < frame_count,
+            "tier": tier,
+            **cascade_stats,
+        },
+    }
+    used = {
+        "positions": positions,
+        "samples": samples,
+        "weights": weights,
+        "phones": phones["frames"],
+    }
+    return result, used
+
+
+def use_model(video_path: str, sample_count: int, tier: str = "full"):
+    # Coarser tiers decode fewer samples
+    frames, video_info = sample_frames(video_path, tiers.sample_count(sample_count, tier))
+    weights = video_info.get("weights")
+    indices = video_info["indices"]
+    if weights is not None:
+        weights = [w for img, w in zip(frames, weights) if img is not None]
+    indices = [i for img, i in zip(frames, indices) if img is not None]
+    frames = [img for img in frames if img is not None]
+
+    cancel.check()
+    result, used = score_frames(frames, weights, tier)
+    # Coarser tiers' features (no FaceMesh, lite Hands) would skew rescoring
+    if config.FEATURE_STORE and tier == "full":
+        record_run(
+            video_path,
+            sample_count,
+            used["samples"],
+            [indices[p] for p in used["positions"]],
+            video_info["fps"],
+            used["weights"],
+            used["phones"],
+            result["scores"],
+        )
+
+    result["stats"] = {
+        "backend": video_info["backend"],
+        "sampler": video_info["sampler"],
+        "frames_decoded": len(frames),
+        # Frames the sampler looked at (more than decoded with "adaptive")
+        "frames_candidates": video_info.get("candidates", len(frames)),
+        "decode_ms": video_info["decode_ms"],
+        **result["stats"],
+    }
+    return result
+
+
+def warm_up() -> dict:
+    """
+    Load every model and push a blank frame through the same calls use_model
+    makes, so the first clip doesn't pay for graph initialization.
+    Returns:
+        load_ms: per-component load time (see utils.lazy.LOAD_TIMES)
+        warmup_ms: time of the first (dummy) run per stage
+        total_ms: wall time of the whole warm-up
+    """
+    start = time.perf_counter()
+    warmup_ms = {}
+
+    def timed(stage, fn, *args):
+        stage_start = time.perf_counter()
+        fn(*args)
+        warmup_ms[stage] = (time.perf_counter() - stage_start) * 1000
+
+    # The pickles (and sklearn) are only needed by the reference engine or
+    # when no artifact was exported; load them first so each load is timed on its own
+    loads = [get_compiled_random_forest, get_compiled_isolation_forest]
+    if config.SCORING_ENGINE == "reference":
+        loads = [get_random_forest_model, get_isolation_forest_model] + loads
+    for load in loads:
+        load()
+
+    # Recorder frames are 800x600 unless clips are decoded to another size
+    w, h = parse_size(config.DECODE_SIZE) or (800, 600)
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+
+    # With the parallel detector runner this builds the detector threads' graphs
+    timed("features", extract_features_from_images, [frame])
+    if config.QUALITY_TIER != "full":
+        # The coarser tiers' lite Hands graph, on this thread only (the other
+        # graphs' tracking state stays as use_model leaves it)
+        timed("hands_lite", detect_hands, frame, 0)
+    if config.FRAME_SHARDS > 1:
+        timed("frame_shards", warm_up_shards, frame)
+    timed("phone", detect_phones, [frame])
+    timed("scores", extract_scores, [[0] * len(FEATURE_COLUMNS)])
+
     return {
-        "scores": extract_scores(samples),
-        "isPhonePresent": (
-            bool(detect_phone(img_for_phone_detection))
-            if img_for_phone_detection is not None
-            else False
-        ),
+        "load_ms": dict(LOAD_TIMES),
+        "warmup_ms": warmup_ms,
+        "total_ms": (time.perf_counter() - start) * 1000,
     }
 
 
@@ -177,3 +477,21 @@ if __name__ == "__main__":
     # Run async extraction
     scores = extract_scores(sample_data)
     print("Scores:", scores)
+
+    # Compiled scorers vs the sklearn/treeinterpreter reference
+    compiled = extract_scores(sample_data, engine="compiled")
+    reference = extract_scores(sample_data, engine="reference")
+    print(
+        "RF compiled vs reference max diff:",
+        max(
+            [abs(compiled["rf_score"] - reference["rf_score"])]
+            + [
+                abs(compiled["feature_impacts"][k] - reference["feature_impacts"][k])
+                for k in FEATURE_COLUMNS
+            ]
+        ),
+    )
+    print(
+        "IF compiled vs reference diff:",
+        abs(compiled["if_score"] - reference["if_score"]),
+    )
@@ -0,0 +1,77 @@
+import sys
+import time
+import numpy as np
+from utils import config
+from utils.model import use_model, warm_up
+
+# Compare use_model results across values of one config setting:
+#   python -m utils.model_test clip1.webm clip2.webm [--samples 20]
+#       [--compare FRAME_SAMPLER=sequential,adaptive]   (or EARLY_STOP=0,1 ...)
+# The first value is the reference for the integrity/warning level comparison.
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 20))
+    setting, values = _pop_option(
+        args, "--compare", "FRAME_SAMPLER=sequential,adaptive"
+    ).split("=")
+    values = values.split(",")
+
+    if not args:
+        print("Usage: python -m utils.model_test <video> [<video> ...]")
+        return
+
+    default = getattr(config, setting)
+    cast = type(default)
+    warm_up()
+
+    results = {value: [] for value in values}
+    for path in args:
+        for value in values:
+            setattr(config, setting, cast(value) if cast is not bool else value == "1")
+            start = time.perf_counter()
+            result = use_model(path, sample_count)
+            elapsed = (time.perf_counter() - start) * 1000
+            results[value].append((result, elapsed))
+            stats = result["stats"]
+            print(
+                f"{path} [{setting}={value}] "
+                f"integrity {result['scores']['integrity_score']:.4f} "
+                f"({result['scores']['warning_level']}), "
+                f"frames {stats['frames_used']}/{stats['frames_decoded']}/{stats['frames_candidates']}"
+                f" (used/decoded/candidates), "
+                f"{elapsed:.0f} ms"
+            )
+    setattr(config, setting, default)
+
+    reference = results[values[0]]
+    for value in values:
+        frames = [r["stats"]["frames_used"] for r, _ in results[value]]
+        diffs = [
+            abs(r["scores"]["integrity_score"] - ref["scores"]["integrity_score"])
+            for (r, _), (ref, _) in zip(results[value], reference)
+        ]
+        same_level = [
+            r["scores"]["warning_level"] == ref["scores"]["warning_level"]
+            for (r, _), (ref, _) in zip(results[value], reference)
+        ]
+        print(
+            f"[{setting}={value}] mean frames used {np.mean(frames):.1f}, "
+            f"mean {np.mean([t for _, t in results[value]]):.0f} ms, "
+            f"mean |d integrity| {np.mean(diffs):.4f}, "
+            f"same level {np.mean(same_level):.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
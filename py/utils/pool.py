@@ -0,0 +1,287 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import psutil
+from utils import cancel, config, shm
+from utils.model import warm_up
+
+logger = logging.getLogger(__name__)
+
+# use_model responses say whether the result cache served them
+_CACHE_COUNTERS = {"hit": "cache_hits", "miss": "cache_misses"}
+
+
+def _preload():
+    """
+    Load the read-only models in the parent so forked workers share their
+    pages copy-on-write. Nothing here may start threads or run inference:
+    a forked child only inherits the forking thread.
+    """
+    import torch
+
+    # Keep the parent off torch's intra-op pool; children size their own
+    torch.set_num_threads(1)
+
+    import mediapipe  # noqa: F401  (module code is shared too; graphs are per worker)
+    from detectors.phone import get_model
+    from utils.model import (
+        get_compiled_isolation_forest,
+        get_compiled_random_forest,
+        get_isolation_forest_model,
+        get_random_forest_model,
+    )
+
+    get_model()
+    if config.RESULT_CACHE:
+        from utils.cache import get_result_cache
+
+        get_result_cache()
+    get_compiled_random_forest()
+    get_compiled_isolation_forest()
+    if config.SCORING_ENGINE == "reference":
+        get_random_forest_model()
+        get_isolation_forest_model()
+
+
+def _receive(conn, requests):
+    """
+    Worker side: take requests off the pipe as they come, so a cancel is seen
+    while the worker is busy with the request it targets.
+    """
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            msg = None
+        if msg is None:
+            requests.put(None)
+            return
+        if msg.get("type") == "cancel":
+            cancel.cancel(msg.get("correlationId"))
+            continue
+        if msg.get("type") == "detach_frames":
+            shm.detach(msg["shm"])
+            continue
+        cancel.track(msg)
+        requests.put(msg)
+
+
+def _worker_main(conn, handle, torch_threads):
+    import torch
+
+    # fd 1 is the parent's message stream (length-prefixed frames once
+    # negotiated; see utils/protocol.py). Workers answer through `conn`, so
+    # anything else printing here (print(), ultralytics, native code) goes to stderr
+    os.dup2(2, 1)
+    torch.set_num_threads(torch_threads)
+
+    timings = None
+    if config.WARM_UP:
+        try:
+            # Builds this worker's MediaPipe graphs; the models are already loaded
+            timings = warm_up()
+        except Exception as e:
+            logger.exception("Warm-up failed")
+            conn.send({"type": "error", "data": f"warm-up failed: {e}"})
+    conn.send({"type": "ready", "timings": timings})
+
+    requests = queue.Queue()
+    threading.Thread(target=_receive, args=(conn, requests), daemon=True).start()
+    while True:
+        msg = requests.get()
+        if msg is None:
+            return
+        try:
+            conn.send(handle(msg))
+        except Exception as e:
+            conn.send(
+                {"type": "error", "correlationId": msg.get("correlationId"), "data": str(e)}
+            )
+
+
+def _memory_mb(pid):
+    """RSS and PSS (shared pages split between the processes mapping them) in MB."""
+    try:
+        info = psutil.Process(pid).memory_full_info()
+    except (psutil.Error, OSError):
+        return None, None
+    pss = getattr(info, "pss", None)  # Linux only
+    return info.rss / 1e6, pss / 1e6 if pss is not None else None
+
+
+class WorkerPool:
+    """
+    Forked worker processes for use_model requests (Linux only).
+
+    The parent loads the models once, then forks `size` workers; each builds
+    its own MediaPipe graphs and handles one request at a time. Requests go
+    to the worker with the fewest outstanding ones and responses are emitted
+    as they arrive, so they can come back out of order. `on_start` (if given)
+    is called with a request's correlationId when its worker gets to it: a
+    worker runs its requests in the order sent, once it is ready.
+    """
+
+    def __init__(self, size, handle, emit, on_ready, on_start=None):
+        self.size = max(1, size)
+        self._handle = handle
+        self._emit = emit
+        self._on_ready = on_ready
+        self._on_start = on_start
+        self._lock = threading.Lock()
+        self._workers = []
+        self._readers = []
+
+    def start(self):
+        _preload()
+        ctx = multiprocessing.get_context("fork")
+        torch_threads = max(1, (os.cpu_count() or 1) // self.size)
+
+        for index in range(self.size):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(child_conn, self._handle, torch_threads),
+                name=f"worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(
+                {
+                    "index": index,
+                    "process": process,
+                    "conn": parent_conn,
+                    "in_flight": {},
+                    "handled": 0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                    "cancelled": 0,
+                    "expired": 0,
+                    "ready": False,
+                    "alive": True,
+                }
+            )
+
+        # Readers only start once every worker is forked
+        for worker in self._workers:
+            reader = threading.Thread(
+                target=self._read, args=(worker,), name=f"pool-reader-{worker['index']}", daemon=True
+            )
+            reader.start()
+            self._readers.append(reader)
+
+    def submit(self, msg):
+        cid = msg.get("correlationId")
+        with self._lock:
+            alive = [w for w in self._workers if w["alive"]]
+            if not alive:
+                raise RuntimeError("No worker processes left")
+            worker = min(alive, key=lambda w: len(w["in_flight"]))
+            worker["in_flight"][cid] = msg
+            worker["conn"].send(msg)
+            if worker["ready"] and len(worker["in_flight"]) == 1:
+                self._started(cid)
+
+    def _started(self, cid):
+        if self._on_start is not None and cid is not None:
+            self._on_start(cid)
+
+    def _start_next(self, worker):
+        """The worker moves on to its oldest request (with the lock held)."""
+        if worker["ready"] and worker["in_flight"]:
+            self._started(next(iter(worker["in_flight"])))
+
+    def queued(self):
+        """Requests sent to workers and not started yet (each runs one at a time)."""
+        with self._lock:
+            return sum(max(0, len(w["in_flight"]) - 1) for w in self._workers if w["alive"])
+
+    def cancel(self, cid):
+        """Pass a cancel on to the worker that has the request; False if none has."""
+        with self._lock:
+            for worker in self._workers:
+                if worker["alive"] and cid in worker["in_flight"]:
+                    worker["conn"].send({"type": "cancel", "correlationId": cid})
+                    return True
+        return False
+
+    def broadcast(self, msg):
+        """Send a message to every worker (handled as it arrives, like a cancel)."""
+        with self._lock:
+            for worker in self._workers:
+                if worker["alive"]:
+                    worker["conn"].send(msg)
+
+    def _read(self, worker):
+        while True:
+            try:
+                msg = worker["conn"].recv()
+            except (EOFError, OSError):
+                break
+
+            if msg.get("type") == "ready":
+                with self._lock:
+                    worker["ready"] = True
+                    self._start_next(worker)
+                self._on_ready(msg["timings"])
+                continue
+            with self._lock:
+                if worker["in_flight"].pop(msg.get("correlationId"), None) is not None:
+                    self._start_next(worker)
+                    worker["handled"] += 1
+                    cache = msg.get("value", {}).get("stats", {}).get("cache")
+                    if cache in _CACHE_COUNTERS:
+                        worker[_CACHE_COUNTERS[cache]] += 1
+                    if msg.get("reason") in cancel.REASONS:
+                        worker[msg["reason"]] += 1
+            self._emit(msg)
+
+        # Worker died (or the pool closed): fail whatever it still had
+        with self._lock:
+            worker["alive"] = False
+            lost = list(worker["in_flight"])
+            worker["in_flight"].clear()
+        for cid in lost:
+            self._emit(
+                {"type": "error", "correlationId": cid, "data": "worker process exited"}
+            )
+
+    def stats(self):
+        """Per-worker pid, liveness, load and memory; plus the parent's memory."""
+        workers = []
+        with self._lock:
+            for worker in self._workers:
+                pid = worker["process"].pid
+                rss, pss = _memory_mb(pid)
+                workers.append(
+                    {
+                        "pid": pid,
+                        "alive": worker["alive"],
+                        "in_flight": len(worker["in_flight"]),
+                        "handled": worker["handled"],
+                        "cache_hits": worker["cache_hits"],
+                        "cache_misses": worker["cache_misses"],
+                        "cancelled": worker["cancelled"],
+                        "expired": worker["expired"],
+                        "rss_mb": rss,
+                        "pss_mb": pss,
+                    }
+                )
+        rss, pss = _memory_mb(os.getpid())
+        return {"parent": {"pid": os.getpid(), "rss_mb": rss, "pss_mb": pss}, "workers": workers}
+
+    def close(self):
+        """Let workers finish queued requests, then wait for them to exit."""
+        for worker in self._workers:
+            if worker["alive"]:
+                try:
+                    worker["conn"].send(None)
+                except OSError:
+                    pass
+        for worker in self._workers:
+            worker["process"].join()
+        # Readers exit once their worker is gone, after emitting its last responses
+        for reader in self._readers:
+            reader.join()
@@ -0,0 +1,164 @@
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+# stdin/stdout message framing. The worker starts in "lines" (one JSON
+# document per line). The host can send
+#   {"type": "hello", "correlationId": "hello", "protocols": ["msgpack", "json"]}
+# and the worker answers (still as a line) with the first protocol it also
+# speaks, {"type": "hello", "correlationId": "hello", "protocol": ...}, then
+# both sides switch to frames: a 4-byte big-endian length, then the message
+# encoded as msgpack or JSON. msgpack is optional; without it only "json" is
+# offered. Frames need no scanning for delimiters and survive any chunking.
+
+PROTOCOLS = ("msgpack", "json", "lines")
+
+_LENGTH = struct.Struct(">I")
+
+# Larger frames mean the stream is out of step, not a real message
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """The input stream can't be read any further."""
+
+
+def _codecs():
+    codecs = {"json": (lambda msg: json.dumps(msg).encode("utf-8"), json.loads)}
+    try:
+        import msgpack
+
+        codecs["msgpack"] = (
+            lambda msg: msgpack.packb(msg, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    except ImportError:
+        pass
+    return codecs
+
+
+def available_protocols():
+    return [protocol for protocol in PROTOCOLS if protocol == "lines" or protocol in _codecs()]
+
+
+class Channel:
+    """Reads requests from `stdin` and writes messages to `stdout` (binary streams)."""
+
+    def __init__(self, stdin, stdout):
+        self._in = stdin
+        self._out = stdout
+        self._lock = threading.Lock()
+        self._codecs = _codecs()
+        self.protocol = "lines"
+        self.counters = {
+            "messages_in": 0,
+            "messages_out": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "max_message_bytes": 0,
+            "decode_ms": 0.0,
+            "encode_ms": 0.0,
+        }
+
+    def _read_exact(self, size):
+        data = self._in.read(size)
+        if len(data) < size:
+            if data:
+                raise ProtocolError("input ended in the middle of a frame")
+            return None
+        return data
+
+    def read(self):
+        """
+        Next message, or None once the input ends. Raises ValueError for a
+        message that can't be decoded (the stream is still usable) and
+        ProtocolError when the stream is out of step.
+        """
+        if self.protocol == "lines":
+            data = self._in.readline()
+            while data and not data.strip():
+                data = self._in.readline()
+            if not data:
+                return None
+        else:
+            header = self._read_exact(_LENGTH.size)
+            if header is None:
+                return None
+            (size,) = _LENGTH.unpack(header)
+            if size > MAX_FRAME_BYTES:
+                raise ProtocolError(f"frame of {size} bytes; stream out of step")
+            data = self._read_exact(size)
+            if data is None and size:
+                raise ProtocolError("input ended in the middle of a frame")
+
+        start = time.perf_counter()
+        try:
+            msg = self._decode(data)
+        finally:
+            with self._lock:
+                self._count("in", len(data), start)
+        if not isinstance(msg, dict):
+            raise ValueError("messages must be objects")
+        return msg
+
+    def _decode(self, data):
+        if self.protocol == "lines":
+            return json.loads(data)
+        return self._codecs[self.protocol][1](data)
+
+    def write(self, msg):
+        with self._lock:
+            self._write(msg)
+
+    def _write(self, msg):
+        start = time.perf_counter()
+        if self.protocol == "lines":
+            data = json.dumps(msg).encode("utf-8") + b"\n"
+        else:
+            body = self._codecs[self.protocol][0](msg)
+            data = _LENGTH.pack(len(body)) + body
+        self._count("out", len(data), start)
+        self._out.write(data)
+        self._out.flush()
+
+    def _count(self, direction, size, start):
+        self.counters[f"messages_{direction}"] += 1
+        self.counters[f"bytes_{direction}"] += size
+        self.counters["max_message_bytes"] = max(self.counters["max_message_bytes"], size)
+        key = "decode_ms" if direction == "in" else "encode_ms"
+        self.counters[key] += (time.perf_counter() - start) * 1000
+
+    def negotiate(self, msg):
+        """Answer a hello and switch to the chosen protocol."""
+        offered = msg.get("protocols") or []
+        protocol = next((p for p in offered if p in self._codecs), "lines")
+        with self._lock:
+            self._write(
+                {
+                    "type": "hello",
+                    "correlationId": msg.get("correlationId"),
+                    "protocol": protocol,
+                    "protocols": available_protocols(),
+                }
+            )
+            if protocol != "lines":
+                self._isolate_stdout()
+            self.protocol = protocol
+        return protocol
+
+    def _isolate_stdout(self):
+        """
+        Keep the frame stream to ourselves: anything else writing to fd 1
+        (print(), native libraries) goes to stderr from now on.
+        """
+        if self._out is not sys.stdout.buffer:
+            return
+        sys.stdout.flush()
+        self._out = os.fdopen(os.dup(1), "wb")
+        os.dup2(2, 1)
+
+    def stats(self):
+        return {"protocol": self.protocol, **self.counters}
@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+from utils.protocol import Channel, available_protocols
+
+# Stand in for the host: run main.py once per protocol, negotiate it and
+# score a clip a few times, reading the replies byte by byte so frames are
+# reassembled from the smallest possible chunks:
+#   python -m utils.protocol_test clip.webm [--requests 3]
+# Scores must be identical across protocols; prints each side's counters.
+
+
+class _Trickle:
+    """A stream that hands out at most one byte per read call."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read(self, size):
+        data = bytearray()
+        while len(data) < size:
+            byte = self._stream.read(1)
+            if not byte:
+                break
+            data += byte
+        return bytes(data)
+
+    def readline(self):
+        return self._stream.readline()
+
+
+def _next(host):
+    while True:
+        try:
+            return host.read()
+        except ValueError:
+            continue  # stray prints, in lines mode
+
+
+def _run(path, protocol, requests):
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "..", "main.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "DISTRACT_RESULT_CACHE": "0"},
+    )
+    host = Channel(_Trickle(worker.stdout), worker.stdin)
+    host.write({"type": "hello", "correlationId": "hello", "protocols": [protocol]})
+    while True:
+        msg = _next(host)
+        if msg.get("correlationId") == "hello":
+            host.protocol = msg["protocol"]
+            break
+
+    for i in range(requests):
+        host.write(
+            {"type": "use_model", "correlationId": f"r{i}", "videoPath": path, "sampleCount": 10}
+        )
+    scores = {}
+    while len(scores) < requests:
+        msg = _next(host)
+        if msg.get("type") == "error":
+            raise RuntimeError(msg["data"])
+        if msg.get("correlationId", "").startswith("r"):
+            scores[msg["correlationId"]] = msg["value"]["scores"]["integrity_score"]
+
+    host.write({"type": "stats"})
+    while True:
+        msg = _next(host)
+        if msg.get("type") == "stats":
+            worker_counters = msg["value"]["protocol"]
+            break
+    worker.stdin.close()
+    worker.wait(timeout=60)
+    return [scores[k] for k in sorted(scores)], host.stats(), worker_counters
+
+
+def main():
+    args = sys.argv[1:]
+    requests = 3
+    if "--requests" in args:
+        i = args.index("--requests")
+        requests = int(args[i + 1])
+        del args[i : i + 2]
+    if not args:
+        print("Usage: python -m utils.protocol_test <video>")
+        return
+    path = os.path.abspath(args[0])
+
+    print(f"available: {available_protocols()}")
+    reference = None
+    for protocol in available_protocols():
+        scores, host, worker = _run(path, protocol, requests)
+        reference = reference or scores
+        print(
+            f"{protocol}: scores {'match' if scores == reference else 'DIFFER'} "
+            f"({scores[0]:.4f}); received {host['bytes_in']} bytes in {host['messages_in']} "
+            f"messages, largest {host['max_message_bytes']}, decode {host['decode_ms']:.2f} ms; "
+            f"worker encode {worker['encode_ms']:.2f} ms, decode {worker['decode_ms']:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
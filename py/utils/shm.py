@@ -0,0 +1,286 @@
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+from utils import tiers
+from utils.model import score_frames
+
+logger = logging.getLogger(__name__)
+
+# Frames handed over in shared memory instead of as clip files. The host
+# creates a named ring of fixed-size frame slots, writes frames into free
+# slots and sends
+#   {"type": "use_frames", "correlationId", "shm": <ring name>,
+#    "generation": <ring generation>, "slots": [slot, ...],
+#    "sequences": [sequence, ...]}
+# The worker maps the ring on first use and reads the slots as NumPy views,
+# so no pixels are serialized or written to disk. The answer has the
+# use_model schema. The host must not rewrite a slot until the request
+# referencing it is answered; the sequences (returned by FrameRing.write)
+# catch it if it does.
+#
+# A ring recreated under the same name gets a new generation; a request
+# naming another generation than the mapped ring's maps the name again. The
+# host sends
+#   {"type": "detach_frames", "correlationId", "shm": <ring name>}
+# before unlinking a ring, so the worker doesn't keep the segment mapped (it
+# is unmapped once requests using it are answered).
+#
+# Layout (little endian, 64-byte aligned):
+#   header  magic, version, slot count, width, height, channel order (0 RGB, 1 BGR),
+#           generation (u64, random per ring)
+#   slots   each: sequence (u64, 0 while being written), timestamp (f64),
+#           then height x width x 3 pixels
+
+RING_MAGIC = b"DSTRING\0"
+RING_VERSION = 2
+CHANNEL_ORDERS = ("rgb", "bgr")
+
+_HEADER = struct.Struct("<8sIIIIIQ")
+_SLOT_HEADER = struct.Struct("<Qd")
+_ALIGN = 64
+
+
+def _aligned(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+# Rings created by this process (tests stand in for the host in process)
+_created = set()
+
+
+def _attach(name):
+    """Map an existing segment without letting this process unlink it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if sys.platform != "win32" and shm.name not in _created:
+            # Before 3.13 attaching registers the segment with the resource
+            # tracker, which would unlink the host's ring when we exit
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRing:
+    """A ring of frame slots in named shared memory (host or worker side)."""
+
+    def __init__(self, shm):
+        self.shm = shm
+        if shm.size < _HEADER.size:
+            raise ValueError(f"{shm.name} is too small for a frame ring")
+        magic, version, slots, width, height, order, generation = _HEADER.unpack_from(
+            shm.buf, 0
+        )
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise ValueError(f"{shm.name} is not a version {RING_VERSION} frame ring")
+        self.slot_count = slots
+        self.width = width
+        self.height = height
+        self.channel_order = CHANNEL_ORDERS[order]
+        self.generation = generation
+        self.frame_bytes = width * height * 3
+        self.slot_stride = _aligned(_aligned(_SLOT_HEADER.size) + self.frame_bytes)
+        self._data_start = _aligned(_HEADER.size)
+        if shm.size < self._data_start + slots * self.slot_stride:
+            raise ValueError(f"{shm.name} is smaller than its header says")
+        # Worker side: requests reading the ring, and whether it was detached
+        self.users = 0
+        self.detached = False
+
+    @classmethod
+    def create(cls, slot_count, width, height, channel_order="rgb", name=None):
+        """Host side: a new ring, with a new generation (unlink() it when done)."""
+        stride = _aligned(_aligned(_SLOT_HEADER.size) + width * height * 3)
+        shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_aligned(_HEADER.size) + slot_count * stride
+        )
+        _HEADER.pack_into(
+            shm.buf,
+            0,
+            RING_MAGIC,
+            RING_VERSION,
+            slot_count,
+            width,
+            height,
+            CHANNEL_ORDERS.index(channel_order),
+            int.from_bytes(os.urandom(8), "little"),
+        )
+        _created.add(shm.name)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _slot_offset(self, slot):
+        if not 0 <= slot < self.slot_count:
+            raise IndexError(f"Frame slot {slot} out of range (ring has {self.slot_count})")
+        return self._data_start + slot * self.slot_stride
+
+    def sequence(self, slot):
+        return _SLOT_HEADER.unpack_from(self.shm.buf, self._slot_offset(slot))[0]
+
+    def frame(self, slot):
+        """Zero-copy (height, width, 3) uint8 view of a slot's pixels."""
+        return np.ndarray(
+            (self.height, self.width, 3),
+            dtype=np.uint8,
+            buffer=self.shm.buf,
+            offset=self._slot_offset(slot) + _aligned(_SLOT_HEADER.size),
+        )
+
+    def write(self, slot, frame, timestamp=None):
+        """Host side: copy a frame into a slot; returns its new sequence number."""
+        offset = self._slot_offset(slot)
+        sequence = self.sequence(slot) + 1
+        _SLOT_HEADER.pack_into(self.shm.buf, offset, 0, 0.0)
+        self.frame(slot)[:] = frame
+        _SLOT_HEADER.pack_into(
+            self.shm.buf, offset, sequence, time.time() if timestamp is None else timestamp
+        )
+        return sequence
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view still references the mapping; it goes with the view
+            logger.warning(f"Frame ring {self.name} still in use, left mapped")
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+# Rings this process has mapped, by name, until detached or recreated
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+def _detach(name, ring):
+    """Forget a mapped ring (lock held); it is closed once no request uses it."""
+    if _rings.get(name) is ring:
+        del _rings[name]
+    ring.detached = True
+    if ring.users == 0:
+        ring.close()
+
+
+@contextmanager
+def using_ring(name, generation=None):
+    """
+    The ring mapped under `name`, for the duration of a request. Maps it
+    again when the host recreated it (`generation` differs from the mapped one).
+    """
+    with _rings_lock:
+        ring = _rings.get(name)
+        if ring is not None and generation is not None and ring.generation != generation:
+            _detach(name, ring)
+            ring = None
+        if ring is None:
+            ring = FrameRing.attach(name)
+            if generation is not None and ring.generation != generation:
+                ring.close()
+                raise ValueError(
+                    f"Frame ring {name} is generation {ring.generation}, not {generation}"
+                )
+            _rings[name] = ring
+        ring.users += 1
+    try:
+        yield ring
+    finally:
+        with _rings_lock:
+            ring.users -= 1
+            if ring.detached and ring.users == 0:
+                ring.close()
+
+
+def detach(name) -> bool:
+    """Stop mapping a ring (detach_frames); False if it isn't mapped."""
+    with _rings_lock:
+        ring = _rings.get(name)
+        if ring is None:
+            return False
+        _detach(name, ring)
+        return True
+
+
+def detach_all():
+    with _rings_lock:
+        for name, ring in list(_rings.items()):
+            _detach(name, ring)
+
+
+def _check_sequences(ring, slots, sequences):
+    if sequences is None:
+        return
+    for slot, sequence in zip(slots, sequences):
+        if ring.sequence(slot) != sequence:
+            raise RuntimeError(f"Frame slot {slot} was rewritten while in use")
+
+
+def _evenly_spaced(count, keep):
+    """`keep` positions spread over `count` (all of them when keep >= count)."""
+    if keep >= count:
+        return list(range(count))
+    return sorted({int(p) for p in np.linspace(0, count - 1, keep).round()})
+
+
+def use_frames(msg, tier="full") -> dict:
+    """
+    use_model over frames in a shared-memory ring instead of a clip. Coarser
+    quality tiers score an evenly spaced subset of the slots.
+    """
+    # The frame views into the ring are gone once _use_ring returns, so a
+    # detached ring can be closed when the request is done
+    with using_ring(msg["shm"], msg.get("generation")) as ring:
+        return _use_ring(ring, msg, tier)
+
+
+def _use_ring(ring, msg, tier):
+    start = time.perf_counter()
+    slots = msg["slots"]
+    sequences = msg.get("sequences")
+    if sequences is not None and len(sequences) != len(slots):
+        raise ValueError("use_frames needs one sequence per slot")
+    keep = _evenly_spaced(len(slots), tiers.sample_count(len(slots), tier))
+    slots = [slots[p] for p in keep]
+    if sequences is not None:
+        sequences = [sequences[p] for p in keep]
+
+    _check_sequences(ring, slots, sequences)
+    views = [ring.frame(slot) for slot in slots]
+    if ring.channel_order == "rgb":
+        # The detectors take the BGR frames cv2 decodes; one swap per frame
+        frames = [cv2.cvtColor(view, cv2.COLOR_RGB2BGR) for view in views]
+        _check_sequences(ring, slots, sequences)
+    else:
+        frames = views
+    transfer_ms = (time.perf_counter() - start) * 1000
+
+    result, _ = score_frames(frames, tier=tier)
+    if ring.channel_order == "bgr":
+        # Scored straight from the slots; they must not have changed meanwhile
+        _check_sequences(ring, slots, sequences)
+
+    result["stats"] = {
+        "backend": "shm",
+        "sampler": "slots",
+        "frames_decoded": len(frames),
+        "frames_candidates": len(msg["slots"]),
+        "decode_ms": transfer_ms,
+        **result["stats"],
+    }
+    return result
@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from utils.model import use_model
+from utils.shm import FrameRing, detach, use_frames
+from utils.video import sample_frames
+
+# Stand in for the host: put a clip's sampled frames in a shared-memory ring
+# and score them with use_frames, in process and through main.py:
+#   python -m utils.shm_test clip.webm [--samples 20]
+# Scores must match use_model on the same clip; the transfer replaces decode_ms.
+# Then the ring is recreated under the same name with blank frames: the
+# worker must map it again rather than score the old frames.
+
+
+def _on_new_thread(fn, *args):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn(*args)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = 20
+    if "--samples" in args:
+        i = args.index("--samples")
+        sample_count = int(args[i + 1])
+        del args[i : i + 2]
+    if not args:
+        print("Usage: python -m utils.shm_test <video>")
+        return
+    path = args[0]
+
+    frames, _ = sample_frames(path, sample_count)
+    height, width = frames[0].shape[:2]
+    ring = FrameRing.create(len(frames), width, height, "rgb")
+    try:
+        start = time.perf_counter()
+        sequences = [
+            ring.write(slot, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            for slot, frame in enumerate(frames)
+        ]
+        write_ms = (time.perf_counter() - start) * 1000
+        msg = {
+            "type": "use_frames",
+            "correlationId": "shm-test",
+            "shm": ring.name,
+            "generation": ring.generation,
+            "slots": list(range(len(frames))),
+            "sequences": sequences,
+        }
+
+        # Each on a fresh thread, so neither inherits the other's tracking state
+        reference = _on_new_thread(use_model, path, sample_count)
+        result = _on_new_thread(use_frames, msg)
+        diff = abs(result["scores"]["integrity_score"] - reference["scores"]["integrity_score"])
+        print(
+            f"use_frames: integrity {result['scores']['integrity_score']:.4f}, "
+            f"|diff vs use_model| {diff:.2e}; host write {write_ms:.1f} ms, "
+            f"worker transfer {result['stats']['decode_ms']:.1f} ms "
+            f"(use_model decode {reference['stats']['decode_ms']:.1f} ms)"
+        )
+
+        # A slot rewritten after the request was sent is refused
+        ring.write(0, cv2.cvtColor(frames[0], cv2.COLOR_BGR2RGB))
+        try:
+            use_frames(msg)
+            print("stale sequence: accepted (unexpected)")
+        except RuntimeError as e:
+            print(f"stale sequence: {e}")
+
+        # Same request through the worker protocol
+        msg["sequences"][0] = ring.sequence(0)
+        worker = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(__file__), "..", "main.py")],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        out, _ = worker.communicate(json.dumps(msg) + "\n", timeout=600)
+        for line in out.splitlines():
+            if "shm-test" in line:
+                value = json.loads(line)["value"]
+                print(f"main.py use_frames: integrity {value['scores']['integrity_score']:.4f}")
+
+        # Recreated under the same name (new generation), with blank frames
+        name = ring.name
+        ring.close()
+        ring.unlink()
+        ring = FrameRing.create(len(frames), width, height, "rgb", name=name)
+        blank = np.zeros_like(frames[0])
+        msg["generation"] = ring.generation
+        msg["sequences"] = [ring.write(slot, blank) for slot in range(len(frames))]
+        recreated = use_frames(msg)["scores"]["integrity_score"]
+        print(
+            f"recreated ring: integrity {recreated:.4f} "
+            f"({'stale frames' if recreated == result['scores']['integrity_score'] else 'new frames'}); "
+            f"detached: {detach(name)}"
+        )
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+if __name__ == "__main__":
+    main()
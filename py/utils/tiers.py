@@ -0,0 +1,146 @@
+import threading
+import time
+from utils import config
+
+# Quality tiers: how much work a use_model / use_frames request gets. When
+# the worker falls behind (requests queue up, or answers come back later than
+# the clips arrive), coarser tiers trade some accuracy for answers on time:
+#   sample_scale     fraction of the requested sampleCount decoded (at least 1)
+#   phone_imgsz      YOLO input size
+#   hand_complexity  MediaPipe Hands model (1 full, 0 lite)
+#   face_mesh        run FaceMesh; without it head pose and gaze read as 0,
+#                    which the forests score as suspicious (clips that are
+#                    "low" at full came out "moderate"), for little time saved,
+#                    so every tier keeps it
+# Every result records its tier in stats["tier"].
+TIERS = {
+    "full": {
+        "sample_scale": 1.0,
+        "phone_imgsz": 640,
+        "hand_complexity": 1,
+        "face_mesh": True,
+    },
+    "reduced": {
+        "sample_scale": 0.5,
+        "phone_imgsz": 416,
+        "hand_complexity": 0,
+        "face_mesh": True,
+    },
+    "minimal": {
+        "sample_scale": 0.25,
+        "phone_imgsz": 320,
+        "hand_complexity": 0,
+        "face_mesh": True,
+    },
+}
+TIER_ORDER = tuple(TIERS)
+
+
+def settings(tier) -> dict:
+    if tier not in TIERS:
+        raise ValueError(f"Unknown quality tier: {tier}")
+    return TIERS[tier]
+
+
+def sample_count(count, tier) -> int:
+    """Samples a clip gets at `tier` for a request of `count`."""
+    return max(1, round(count * settings(tier)["sample_scale"]))
+
+
+class QualityController:
+    """
+    Picks the tier of each request (config.QUALITY_TIER "auto") from the
+    backlog and a moving average of request latency (start of processing to
+    answer; time spent queued, or waiting for warm-up, shows in the backlog
+    instead). One tier coarser when the backlog reaches
+    TIER_QUEUE_HIGH or latency passes TIER_LATENCY_HIGH_MS; one tier finer
+    once the backlog is down to TIER_QUEUE_LOW and latency under
+    TIER_LATENCY_LOW_MS. After a switch, TIER_MIN_DWELL requests are answered
+    before the next one, so the average reflects the new tier.
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode or config.QUALITY_TIER
+        if self.mode != "auto":
+            settings(self.mode)
+        self._lock = threading.Lock()
+        self._level = TIER_ORDER.index(self.mode) if self.mode != "auto" else 0
+        self._started = {}
+        self._waiting = 0
+        # The first switch needn't wait
+        self._since_switch = config.TIER_MIN_DWELL
+        self.latency_ms = None
+        self.backlog = 0
+        self.switches = 0
+        self.served = {tier: 0 for tier in TIER_ORDER}
+
+    @property
+    def tier(self):
+        return TIER_ORDER[self._level]
+
+    def received(self):
+        with self._lock:
+            self._waiting += 1
+
+    def turned_away(self):
+        """A received request that won't run (answered "busy")."""
+        with self._lock:
+            self._waiting = max(0, self._waiting - 1)
+
+    def started(self, correlation_id):
+        """A request thread (or pool worker) starts processing the request."""
+        with self._lock:
+            self._started[correlation_id] = time.perf_counter()
+
+    def answered(self, correlation_id, ok=True):
+        """Record a request's latency; errors (cancelled ones too) only end its tracking."""
+        with self._lock:
+            started = self._started.pop(correlation_id, None)
+            if started is None or not ok:
+                return
+            latency = (time.perf_counter() - started) * 1000
+            if self.latency_ms is None:
+                self.latency_ms = latency
+            else:
+                alpha = config.TIER_LATENCY_ALPHA
+                self.latency_ms = alpha * latency + (1 - alpha) * self.latency_ms
+            self._since_switch += 1
+
+    def choose(self, backlog=None) -> str:
+        """
+        Tier for a received request about to run (or be sent to a worker),
+        with `backlog` requests waiting behind it; by default the requests
+        received and not chosen for yet.
+        """
+        with self._lock:
+            self._waiting = max(0, self._waiting - 1)
+            self.backlog = self._waiting if backlog is None else backlog
+            if self.mode == "auto" and self._since_switch >= config.TIER_MIN_DWELL:
+                latency = self.latency_ms
+                if self.backlog >= config.TIER_QUEUE_HIGH or (
+                    latency is not None and latency > config.TIER_LATENCY_HIGH_MS
+                ):
+                    self._switch(min(self._level + 1, len(TIER_ORDER) - 1))
+                elif self.backlog <= config.TIER_QUEUE_LOW and (
+                    latency is None or latency < config.TIER_LATENCY_LOW_MS
+                ):
+                    self._switch(max(self._level - 1, 0))
+            self.served[self.tier] += 1
+            return self.tier
+
+    def _switch(self, level):
+        if level != self._level:
+            self._level = level
+            self._since_switch = 0
+            self.switches += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "tier": self.tier,
+                "latency_ms": self.latency_ms,
+                "backlog": self.backlog,
+                "switches": self.switches,
+                "served": dict(self.served),
+            }
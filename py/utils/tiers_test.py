@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+from utils.model import use_model
+from utils.protocol import Channel
+from utils.tiers import TIER_ORDER
+
+# Quality tiers on a clip: what each costs and scores, then main.py fed a
+# request every --interval seconds (faster than it keeps up with at "full"),
+# pinned to "full" and on "auto":
+#   python -m utils.tiers_test clip.webm [--samples 20] [--interval 2] [--count 12]
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def _next(host):
+    while True:
+        try:
+            return host.read()
+        except ValueError:
+            continue  # stray prints
+
+
+def _stream(path, sample_count, interval, count, quality_tier):
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "..", "main.py")],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env={
+            **os.environ,
+            "DISTRACT_RESULT_CACHE": "0",
+            "DISTRACT_WORKER_THREADS": "1",
+            "DISTRACT_QUALITY_TIER": quality_tier,
+        },
+    )
+    host = Channel(worker.stdout, worker.stdin)
+    host.write({"type": "ping"})
+    while _next(host).get("type") != "pong":
+        pass
+    while _next(host).get("data") != "ready":
+        pass
+
+    sent = {}
+
+    def send():
+        for i in range(count):
+            sent[f"c{i}"] = time.perf_counter()
+            host.write(
+                {
+                    "type": "use_model",
+                    "correlationId": f"c{i}",
+                    "videoPath": path,
+                    "sampleCount": sample_count,
+                }
+            )
+            time.sleep(interval)
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    latencies, tiers = [], []
+    while len(latencies) < count:
+        msg = _next(host)
+        if msg.get("correlationId", "").startswith("c"):
+            latencies.append((time.perf_counter() - sent[msg["correlationId"]]) * 1000)
+            tiers.append(msg["value"]["stats"]["tier"])
+    sender.join()
+
+    host.write({"type": "stats"})
+    while True:
+        msg = _next(host)
+        if msg.get("type") == "stats":
+            controller = msg["value"]["tiers"]
+            break
+    worker.stdin.close()
+    worker.wait(timeout=60)
+
+    print(
+        f"{quality_tier}: latency p50 {np.percentile(latencies, 50):.0f} ms, "
+        f"p95 {np.percentile(latencies, 95):.0f} ms, last {latencies[-1]:.0f} ms; "
+        f"tiers {' '.join(t[0] for t in tiers)}; {controller['switches']} switches"
+    )
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 20))
+    interval = float(_pop_option(args, "--interval", 2))
+    count = int(_pop_option(args, "--count", 12))
+    if not args:
+        print("Usage: python -m utils.tiers_test <video>")
+        return
+    path = os.path.abspath(args[0])
+
+    use_model(path, sample_count)  # warm
+    reference = None
+    for tier in TIER_ORDER:
+        use_model(path, sample_count, tier)  # builds the tier's graphs
+        start = time.perf_counter()
+        result = use_model(path, sample_count, tier)
+        ms = (time.perf_counter() - start) * 1000
+        score = result["scores"]["integrity_score"]
+        reference = reference if reference is not None else score
+        print(
+            f"{tier}: {ms:.0f} ms for {result['stats']['frames_decoded']} frames, "
+            f"integrity {score:.4f} ({result['scores']['warning_level']}), "
+            f"|diff vs full| {abs(score - reference):.4f}"
+        )
+
+    for quality_tier in ("full", "auto"):
+        _stream(path, sample_count, interval, count, quality_tier)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+from typing import List, Optional, Tuple
+import logging
+import time
+import cv2
+import numpy as np
+from utils import config
+
+logger = logging.getLogger(__name__)
+
+
+def sample_frame_indices(total_frames: int, sample_count: int) -> List[int]:
+    actual_sample_count = min(sample_count, total_frames)
+    # Compute evenly spaced frame indices
+    return [
+        int(i * total_frames / actual_sample_count) for i in range(actual_sample_count)
+    ]
+
+
+def parse_size(value) -> Optional[Tuple[int, int]]:
+    """Parse a "WIDTHxHEIGHT" string (or (w, h) pair) into a size tuple."""
+    if not value:
+        return None
+    if isinstance(value, str):
+        w, h = value.lower().split("x")
+        return int(w), int(h)
+    w, h = value
+    return int(w), int(h)
+
+
+def _read_frames_seek(cap, indices: List[int]) -> Tuple[List[int], list]:
+    read_indices, frames = [], []
+    for idx in indices:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        ret, frame = cap.read()
+        if ret and frame is not None:
+            read_indices.append(idx)
+            frames.append(frame)
+        else:
+            # If seeking fails, try reading the next frame
+            continue
+    return read_indices, frames
+
+
+def _read_frames_sequential(cap, indices: List[int]) -> Tuple[List[int], list]:
+    """Decode forward once; grab() every frame, retrieve() only the sampled ones."""
+    wanted = set(indices)
+    read_indices, frames = [], []
+    for idx in range(max(indices) + 1):
+        if not cap.grab():
+            # Container reported more frames than it holds
+            break
+        if idx not in wanted:
+            continue
+        ret, frame = cap.retrieve()
+        if ret and frame is not None:
+            read_indices.append(idx)
+            frames.append(frame)
+    return read_indices, frames
+
+
+SAMPLERS = {
+    "seek": _read_frames_seek,
+    "sequential": _read_frames_sequential,
+}
+
+
+def _decode_opencv(video_path: str, sample_count: int, sampler: str, size, info):
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown frame sampler: {sampler}")
+    info["sampler"] = sampler
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open video: {video_path}")
+
+    try:
+        info["fps"] = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0 or sample_count <= 0:
+            return []
+
+        indices = sample_frame_indices(total_frames, sample_count)
+        info["indices"], frames = SAMPLERS[sampler](cap, indices)
+    finally:
+        cap.release()
+
+    if size is not None:
+        frames = [cv2.resize(f, size, interpolation=cv2.INTER_AREA) for f in frames]
+    return frames
+
+
+def _decode_decord(video_path: str, sample_count: int, sampler: str, size, info):
+    # Imported lazily so a missing/broken decord install only disables this backend
+    from decord import VideoReader, cpu
+
+    # decord scales inside the decoder, so frames never exist at full resolution
+    width, height = size if size is not None else (-1, -1)
+    vr = VideoReader(video_path, ctx=cpu(0), width=width, height=height)
+    info["sampler"] = "batch"
+    info["fps"] = float(vr.get_avg_fps() or 0.0)
+
+    total_frames = len(vr)
+    if total_frames <= 0:
+        raise RuntimeError(f"decord reported no frames: {video_path}")
+    if sample_count <= 0:
+        return []
+
+    indices = sample_frame_indices(total_frames, sample_count)
+    batch = vr.get_batch(indices).asnumpy()
+    del vr
+
+    info["indices"] = indices
+    # decord decodes to RGB; keep the same BGR layout cv2 hands to the detectors
+    return [cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) for frame in batch]
+
+
+DECODE_BACKENDS = {
+    "opencv": _decode_opencv,
+    "decord": _decode_decord,
+}
+
+# Thumbnails for cheap frame comparisons are (w, h)
+THUMBNAIL_SIZE = (32, 24)
+
+
+def thumbnail(img):
+    """Small grayscale copy of a BGR frame, as float32."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(
+        np.float32
+    )
+
+
+def _frame_diff(a, b):
+    """Mean absolute difference of two thumbnails (gray levels, 0-255)."""
+    return float(np.mean(np.abs(a - b)))
+
+
+def _evenly_spaced(positions, count):
+    if count <= 0 or not positions:
+        return []
+    return [positions[i] for i in sample_frame_indices(len(positions), count)]
+
+
+def select_adaptive(thumbs, budget, min_diff, min_frames) -> List[int]:
+    """
+    Pick up to `budget` positions out of candidate frame thumbnails (in
+    timeline order), spending them where the clip changes:
+    1. Drop candidates within `min_diff` of the last kept one (near-identical).
+    2. Over budget: keep a quarter evenly spaced for coverage, and fill the rest
+       with the candidates that changed most from their predecessor.
+    3. Under `min_frames`: top up with evenly spaced candidates.
+    Returns sorted positions.
+    """
+    if not thumbs or budget <= 0:
+        return []
+
+    motion = [float("inf")] + [
+        _frame_diff(thumbs[i], thumbs[i - 1]) for i in range(1, len(thumbs))
+    ]
+
+    kept = [0]
+    for i in range(1, len(thumbs)):
+        if _frame_diff(thumbs[i], thumbs[kept[-1]]) >= min_diff:
+            kept.append(i)
+
+    if len(kept) > budget:
+        coverage = set(_evenly_spaced(kept, budget // 4))
+        by_motion = sorted(
+            (i for i in kept if i not in coverage), key=lambda i: motion[i], reverse=True
+        )
+        kept = sorted(coverage | set(by_motion[: budget - len(coverage)]))
+
+    floor = min(min_frames, budget, len(thumbs))
+    if len(kept) < floor:
+        for i in _evenly_spaced(list(range(len(thumbs))), floor):
+            if len(kept) >= floor:
+                break
+            if i not in kept:
+                kept.append(i)
+        kept.sort()
+
+    return kept
+
+
+def sample_frames(
+    video_path: str,
+    sample_count: int,
+    sampler: Optional[str] = None,
+    backend: Optional[str] = None,
+    size=None,
+) -> Tuple[list, dict]:
+    """
+    Decode `sample_count` evenly spaced frames from a clip.
+    Falls back to the OpenCV backend when the configured one can't read the clip.
+    Returns:
+        frames: list of BGR images, resized to `size` (w, h) when given
+        info: backend/sampler used, frame indices actually read, fps and decode time (ms)
+    """
+    sampler = sampler or config.FRAME_SAMPLER
+    backend = backend or config.DECODE_BACKEND
+    size = parse_size(size if size is not None else config.DECODE_SIZE)
+    if backend not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend: {backend}")
+
+    start = time.perf_counter()
+    info = {
+        "backend": backend,
+        "sampler": sampler,
+        "indices": [],
+        "fps": 0.0,
+        "decode_ms": 0.0,
+    }
+
+    if sampler == "adaptive":
+        frames = _sample_adaptive(video_path, sample_count, backend, size, info)
+    else:
+        frames = _decode(video_path, sample_count, sampler, backend, size, info)
+
+    info["decode_ms"] = (time.perf_counter() - start) * 1000
+    return frames, info
+
+
+def _decode(video_path, sample_count, sampler, backend, size, info):
+    try:
+        return DECODE_BACKENDS[backend](video_path, sample_count, sampler, size, info)
+    except Exception as e:
+        if backend == "opencv":
+            raise
+        logger.warning(f"{backend} backend failed on {video_path}, using opencv: {e}")
+        info.update(backend="opencv", indices=[])
+        return _decode_opencv(video_path, sample_count, sampler, size, info)
+
+
+def _sample_adaptive(video_path, sample_count, backend, size, info):
+    """
+    Decode ADAPTIVE_OVERSAMPLE x sample_count evenly spaced candidates, then
+    keep at most sample_count of them (see select_adaptive). The candidate
+    count goes into info["candidates"], and info["weights"] holds how many
+    candidates each kept frame stands for (itself plus the dropped ones up to
+    the next kept frame), so clip averages aren't skewed toward busy segments.
+    """
+    candidates = _decode(
+        video_path,
+        sample_count * max(1, config.ADAPTIVE_OVERSAMPLE),
+        "sequential",
+        backend,
+        size,
+        info,
+    )
+    keep = select_adaptive(
+        [thumbnail(frame) for frame in candidates],
+        sample_count,
+        config.ADAPTIVE_MIN_DIFF,
+        config.ADAPTIVE_MIN_FRAMES,
+    )
+    info["sampler"] = "adaptive"
+    info["candidates"] = len(candidates)
+    info["indices"] = [info["indices"][i] for i in keep]
+    info["weights"] = [end - start for start, end in zip(keep, keep[1:] + [len(candidates)])]
+    return [candidates[i] for i in keep]
+
+
+def extract_frames_from_video(
+    video_path: str, sample_count: int, sampler: Optional[str] = None
+) -> list:
+    frames, _ = sample_frames(video_path, sample_count, sampler)
+    return frames
@@ -0,0 +1,64 @@
+import sys
+import numpy as np
+from utils.video import sample_frames
+
+# Compare the decode backends/samplers on recorded clips:
+#   python -m utils.video_test clip1.webm clip2.webm [--samples 4] [--repeat 5] [--size 320x240]
+
+VARIANTS = [
+    ("opencv", "seek"),
+    ("opencv", "sequential"),
+    ("decord", None),
+]
+
+
+def _pop_option(args, name, default):
+    if name not in args:
+        return default
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i : i + 2]
+    return value
+
+
+def main():
+    args = sys.argv[1:]
+    sample_count = int(_pop_option(args, "--samples", 4))
+    repeat = int(_pop_option(args, "--repeat", 5))
+    size = _pop_option(args, "--size", None)
+
+    if not args:
+        print("Usage: python -m utils.video_test <video> [<video> ...]")
+        return
+
+    totals = {}
+    for path in args:
+        results = {}
+        for backend, sampler in VARIANTS:
+            timings = []
+            for _ in range(repeat):
+                frames, info = sample_frames(
+                    path, sample_count, sampler=sampler, backend=backend, size=size
+                )
+                timings.append(info["decode_ms"])
+            name = f"{info['backend']}/{info['sampler']}"
+            results[name] = (frames, info, min(timings))
+            totals[name] = totals.get(name, 0.0) + min(timings)
+
+        reference_frames, reference_info, _ = results["opencv/seek"]
+        for name, (frames, info, best_ms) in results.items():
+            same = info["indices"] == reference_info["indices"] and all(
+                np.array_equal(a, b) for a, b in zip(frames, reference_frames)
+            )
+            print(
+                f"{path} [{name}] {best_ms:.1f} ms, "
+                f"{len(frames)} frames, indices={info['indices']}, "
+                f"matches seek: {same}"
+            )
+
+    for name, total in totals.items():
+        print(f"[{name}] mean per clip: {total / len(args):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()